@@ -48,7 +48,7 @@ class AutoController:
             post_wait: 输入后等待时间（秒）
         """
         self.wait(pre_wait)
-        self.keyboard.type_text(text, interval=char_interval)
+        self.keyboard.type_text(text, interval=char_interval, strategy='char')
         self.wait(post_wait)
     
     def input_at_position(self, x, y, text):
@@ -92,9 +92,9 @@ def double_click(x=None, y=None):
     """双击"""
     _controller.mouse.double_click(x, y)
 
-def type_text(text, interval=0.05):
-    """输入文本"""
-    _controller.keyboard.type_text(text, interval)
+def type_text(text, interval=0.05, strategy='auto'):
+    """输入文本（strategy见 keyboard_controller.TYPE_STRATEGIES）"""
+    _controller.keyboard.type_text(text, interval, strategy)
 
 def press_key(key_name):
     """按下键"""
@@ -0,0 +1,367 @@
+"""
+backends.py
+执行器的外部I/O后端：输入（键盘/鼠标/窗口）、音频、网络、OCR 和时钟。
+- 默认使用真实后端（pyautogui、sounddevice、socket 等，全部在首次使用时才导入）
+- 演练模式（--dry-run）换成内存中的假后端和虚拟时钟：不操作桌面、不放音录音、不连网络，
+  sleep 只推进虚拟时间，可在无桌面的Linux CI上几毫秒跑完整个XML，用于测量执行器开销和检查控制流程
+"""
+import threading
+import time
+import wave
+
+import numpy as np
+
+
+# ---- 时钟 ----
+
+class Clock:
+    """真实时钟"""
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def bind(self, func):
+        """包装在新线程中执行的函数（真实时钟无需处理）"""
+        return func
+
+    def advance_to(self, now):
+        pass
+
+
+class VirtualClock:
+    """
+    虚拟时钟：sleep 不阻塞，只推进虚拟时间。
+    每个线程有自己的虚拟时间，并发步骤的等待互相重叠而不是累加：
+    新线程通过 bind() 从启动它的线程的当前时间开始，等待线程结束时用 advance_to() 追上。
+    """
+
+    def __init__(self, start=0.0):
+        self._latest = start       # 所有线程中最晚的虚拟时间
+        self._local = threading.local()
+        self._local.now = start    # 创建时钟的线程（主线程）
+        self._lock = threading.Lock()
+        self.slept = 0.0           # 被跳过的等待总时长（并发的等待分别计入）
+
+    def _current(self):
+        # 未经 bind() 启动的线程从最晚的虚拟时间开始
+        return getattr(self._local, 'now', self._latest)
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._local.now = self._current() + seconds
+            self._latest = max(self._latest, self._local.now)
+            self.slept += seconds
+
+    def monotonic(self):
+        """当前线程的虚拟时间"""
+        with self._lock:
+            return self._current()
+
+    def bind(self, func):
+        """包装在新线程中执行的函数：该线程的虚拟时间从当前线程此刻的时间开始"""
+        start = self.monotonic()
+
+        def run(*args, **kwargs):
+            self._local.now = start
+            return func(*args, **kwargs)
+        return run
+
+    def advance_to(self, now):
+        """当前线程等待其他线程结束后，虚拟时间推进到 now（不会倒退）"""
+        with self._lock:
+            self._local.now = max(self._current(), now)
+            self._latest = max(self._latest, self._local.now)
+
+
+# ---- 输入 ----
+
+class DesktopInput:
+    """真实键盘/鼠标/窗口操作"""
+
+    def __init__(self, fast_mouse=False):
+        """
+        :param fast_mouse: 鼠标移动直接跳到目标（校正一次），不走移动轨迹
+        """
+        self.fast_mouse = fast_mouse
+        self._mouse = None
+        self._keyboard = None
+
+    def press(self, key):
+        import pyautogui
+        pyautogui.press(key)
+
+    def hotkey(self, *keys):
+        import pyautogui
+        pyautogui.hotkey(*keys)
+
+    def type_text(self, text, interval=0.1, strategy='auto'):
+        if self._keyboard is None:
+            from keyboard_controller import KeyboardController
+            self._keyboard = KeyboardController()
+        used = self._keyboard.type_text(text, interval=interval, strategy=strategy)
+        print(f"[KEYBOARD] 输入 {len(text)} 个字符，方式: {used}")
+
+    def move_to(self, x, y, duration=0.5):
+        if self._mouse is None:
+            from mouse_controller import MouseController
+            self._mouse = MouseController()
+        self._mouse.move_to(x, y, duration=duration, fast=self.fast_mouse)
+
+    def click(self, button='left'):
+        import pyautogui
+        pyautogui.click(button=button)
+
+    def maximize_top_window(self):
+        from window_util import maximize_top_window
+        return maximize_top_window()
+
+
+class FakeInput:
+    """假输入：记录操作并推进虚拟时钟"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+        self.position = (0, 0)
+
+    def press(self, key):
+        self.calls.append(('press', key))
+
+    def hotkey(self, *keys):
+        self.calls.append(('hotkey',) + keys)
+
+    def type_text(self, text, interval=0.1, strategy='auto'):
+        self.calls.append(('type_text', text))
+        if strategy == 'char':
+            self.clock.sleep(len(text) * interval)
+
+    def move_to(self, x, y, duration=0.5):
+        self.calls.append(('move_to', x, y))
+        self.position = (x, y)
+        self.clock.sleep(duration)
+
+    def click(self, button='left'):
+        self.calls.append(('click', button))
+
+    def maximize_top_window(self):
+        self.calls.append(('maximize_top_window',))
+        return True
+
+
+# ---- 音频 ----
+
+class DeviceAudio:
+    """真实声卡播放/录音"""
+
+    def play(self, file, device=None, duration=None):
+        from audio_player import play_audio
+        return play_audio(file, device, duration)
+
+    def record(self, device, duration, file):
+        from audio_recorder import record_audio
+        return record_audio(device, duration, file)
+
+    def stop_record(self):
+        from audio_recorder import stop_record
+        return stop_record()
+
+
+def _wav_duration(path):
+    """WAV文件时长（秒），无法读取时返回0"""
+    try:
+        with wave.open(path, 'rb') as f:
+            return f.getnframes() / float(f.getframerate())
+    except (OSError, wave.Error, EOFError):
+        return 0.0
+
+
+class FakeAudio:
+    """假音频：不访问声卡，按播放/录音时长推进虚拟时钟"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def play(self, file, device=None, duration=None):
+        self.calls.append(('play', file, device))
+        self.clock.sleep(duration if duration is not None else _wav_duration(file))
+        return True
+
+    def record(self, device, duration, file):
+        self.calls.append(('record', file, device))
+        self.clock.sleep(duration)
+        return True
+
+    def stop_record(self):
+        self.calls.append(('stop_record',))
+
+
+# ---- 网络 ----
+
+class P2PBackend:
+    """真实P2P网络（p2p_network 全局实例）"""
+
+    def init(self, local_port=9998, peer_host=None, peer_port=9998, peers=None, name=None):
+        from p2p_network import init_network
+        return init_network(local_port, peer_host, peer_port, peers=peers, name=name)
+
+    def send(self, event, data=None, to=None):
+        from p2p_network import get_network
+        network = get_network()
+        print(f"[DEBUG] 对端连接状态: {[str(peer) for peer in network.peers.values()]}")
+        return network.send(event, data, to=to)
+
+    def receive(self, event=None, timeout=30, sender=None):
+        from p2p_network import get_network
+        return get_network().receive(event, timeout, sender=sender)
+
+    def stop(self):
+        from p2p_network import stop_network
+        stop_network()
+
+
+class FakeNetwork:
+    """
+    假网络：发送的消息只记录下来；接收时优先返回预置的消息，
+    auto_reply=True 时模拟对端立即发来所等待的事件，否则按超时推进虚拟时钟后返回None。
+    发送给未配置的对端名称时与真实网络一样报错。
+    """
+
+    def __init__(self, clock, auto_reply=True):
+        self.clock = clock
+        self.auto_reply = auto_reply
+        self.initialized = False
+        self.peers = {}
+        self.sent = []
+        self.inbox = []
+        self._lock = threading.Lock()
+
+    def init(self, local_port=9998, peer_host=None, peer_port=9998, peers=None, name=None):
+        self.initialized = True
+        if peer_host:
+            self.peers[f"{peer_host}:{peer_port}"] = (peer_host, peer_port)
+        self.peers.update(peers or {})
+        return self
+
+    def send(self, event, data=None, to=None):
+        if to not in (None, '*'):
+            unknown = [name for name in ([to] if isinstance(to, str) else to) if name not in self.peers]
+            if unknown:
+                raise ValueError(f"未知的对端: {unknown}，已配置: {list(self.peers)}")
+        with self._lock:
+            self.sent.append({'event': str(event), 'data': data, 'to': to})
+        return self.initialized
+
+    def receive(self, event=None, timeout=30, sender=None):
+        with self._lock:
+            for i, msg in enumerate(self.inbox):
+                if (event is None or msg.get('event') == event) and (sender is None or msg.get('sender') == sender):
+                    return self.inbox.pop(i)
+        if self.auto_reply:
+            return {'event': event or 'ready', 'data': {}, 'timestamp': self.clock.monotonic(),
+                    'sender': sender or next(iter(self.peers), None)}
+        self.clock.sleep(timeout)
+        return None
+
+    def stop(self):
+        self.initialized = False
+
+
+# ---- OCR ----
+
+class FakeOcr:
+    """
+    假OCR，接口与 OcrTool 一致。
+    visible_texts 为None时视为任何被查找的文本都在屏幕上（位置按文本确定性生成）；
+    否则只能找到列表中的文本。
+    """
+
+    def __init__(self, visible_texts=None, screen_size=(1920, 1080)):
+        self.visible_texts = visible_texts
+        self.screen_size = screen_size
+        self.calls = 0
+
+    def _position(self, text):
+        w, h = self.screen_size
+        seed = sum(ord(c) for c in text)
+        return seed * 37 % w, seed * 17 % h
+
+    def readtext(self, screenshot=None, region=None):
+        self.calls += 1
+        results = []
+        for text in self.visible_texts or ():
+            x, y = self._position(text)
+            bbox = [(x - 10, y - 10), (x + 10, y - 10), (x + 10, y + 10), (x - 10, y + 10)]
+            results.append((bbox, text, 1.0))
+        return results
+
+    def find_text_positions(self, targets, screenshot=None, fuzzy=True, region=None):
+        self.calls += 1
+        return {t: self._position(t) if self.visible_texts is None or t in self.visible_texts else None
+                for t in targets}
+
+    def find_text_position(self, target, screenshot=None, fuzzy=True, region=None):
+        return self.find_text_positions([target], screenshot, fuzzy, region)[target]
+
+    def clear_cache(self):
+        pass
+
+
+class Backends:
+    """执行器使用的一组后端"""
+
+    def __init__(self, input=None, audio=None, network=None, clock=None, ocr=None, dry_run=False):
+        """
+        :param ocr: OCR对象（OcrTool接口），None表示使用 ocr_tool 中懒加载的真实引擎
+        """
+        self.input = input or DesktopInput()
+        self.audio = audio or DeviceAudio()
+        self.network = network or P2PBackend()
+        self.clock = clock or Clock()
+        self.ocr = ocr
+        self.dry_run = dry_run
+
+
+def dry_run_backends(screen_size=(1920, 1080), auto_reply=True, visible_texts=None):
+    """
+    创建演练模式后端，并把截图服务换成返回空白帧的假截图源（使用虚拟时钟）。
+    :return: Backends
+    """
+    from screen_capture import ScreenCapture, FakeFrameSource, set_screen_capture
+    clock = VirtualClock()
+    w, h = screen_size
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+    set_screen_capture(ScreenCapture(source=FakeFrameSource([frame]), clock=clock.monotonic))
+    return Backends(
+        input=FakeInput(clock),
+        audio=FakeAudio(clock),
+        network=FakeNetwork(clock, auto_reply=auto_reply),
+        clock=clock,
+        ocr=FakeOcr(visible_texts, screen_size),
+        dry_run=True,
+    )
+
+
+# 全局后端（默认真实后端）
+_backends = Backends()
+
+
+def get_backends():
+    """获取当前使用的后端"""
+    return _backends
+
+
+def set_backends(backends):
+    """替换全局后端（例如演练模式）"""
+    global _backends
+    _backends = backends
+
+
+def get_clock():
+    """当前后端的时钟"""
+    return _backends.clock
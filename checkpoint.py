@@ -0,0 +1,208 @@
+"""
+checkpoint.py
+断点续跑：每执行完一个步骤，把进度写入旁路文件（<xml>.checkpoint）。
+- 记录已完成的用例，以及每个未完成用例的下一个步骤序号和网络/音频状态标记
+- 失败后用 --resume 从断点继续；恢复时按标记重新初始化网络连接
+- 后台（detach）步骤组在 <join> 之后才算完成，之前断点停留在组的位置
+- XML文件修改（mtime/大小变化）后断点失效
+"""
+import json
+import os
+import time
+
+from testcase_plan import GROUP_TAG, JOIN_TAG, iter_steps, last_index
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+CHECKPOINT_VERSION = 3
+
+
+def update_markers(state, step):
+    """
+    根据已执行的步骤更新网络/音频状态标记。
+    :param state: 断点字典（包含 'network'、'audio' 键）
+    :param step: 已执行的步骤（<parallel>组会展开子步骤）
+    """
+    for s in iter_steps([step]):
+        if s.type == 'network':
+            if s.action == 'init':
+                state['network'] = {'local_port': s.params['local_port'], 'peers': s.params['peers'],
+                                    'name': s.params['name']}
+            elif s.action == 'stop':
+                state['network'] = None
+        elif s.type == 'audio':
+            if s.action == 'record_async':
+                state['audio'] = {'recording': s.params['file'], 'device': s.params['device'],
+                                  'duration': s.params['duration'], 'started': time.time()}
+            elif s.action == 'stop_record':
+                state['audio'] = None
+
+
+def expire_markers(markers, now=None):
+    """后台录音到达录音时长后已自行结束，去掉录音标记"""
+    audio = markers.get('audio')
+    now = time.time() if now is None else now
+    if audio and audio.get('duration') is not None and now >= audio['started'] + audio['duration']:
+        markers['audio'] = None
+    return markers
+
+
+def _is_detached_group(step):
+    return step.type == GROUP_TAG and step.params['detach']
+
+
+class CheckpointStore:
+    """断点文件的读写"""
+
+    def __init__(self, xml_path, path=None):
+        """
+        :param xml_path: 用例XML路径
+        :param path: 断点文件路径，默认 <xml>.checkpoint
+        """
+        self.xml_path = xml_path
+        self.path = path or xml_path + CHECKPOINT_SUFFIX
+        stat = os.stat(xml_path)
+        self.state = {
+            'version': CHECKPOINT_VERSION,
+            'xml': os.path.abspath(xml_path),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'completed': [],
+            # 用例名称 -> {'next_step', 'network', 'audio'}
+            'running': {},
+        }
+        # 当前进程中的网络/音频状态（跨用例延续）
+        self.markers = {'network': None, 'audio': None}
+        # 已启动、尚未 join 的后台步骤组
+        self._pending_groups = []
+        self._testcase = None
+
+    def load(self):
+        """
+        读取断点，文件不存在、版本不符或XML已修改时返回None。
+        读取成功后后续写入在此基础上继续。
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get('version') != CHECKPOINT_VERSION or state.get('mtime') != self.state['mtime']
+                or state.get('size') != self.state['size']):
+            print(f"[CHECKPOINT] 断点文件与当前XML不匹配（XML已修改），忽略: {self.path}")
+            return None
+        for entry in state['running'].values():
+            if entry.get('network') and entry['network'].get('peers'):
+                entry['network']['peers'] = {name: tuple(peer) for name, peer in entry['network']['peers'].items()}
+        self.state = state
+        return state
+
+    def begin_testcase(self, name, start=0):
+        self._testcase = name
+        self._pending_groups = []
+        if name in self.state['completed']:
+            self.state['completed'].remove(name)
+        self._save_progress(start)
+
+    def step_done(self, step):
+        """步骤执行成功后记录进度"""
+        if _is_detached_group(step):
+            # 后台组此时才刚启动，等 <join> 之后再记为完成
+            self._pending_groups.append(step)
+        else:
+            update_markers(self.markers, step)
+            if step.type == JOIN_TAG:
+                self._join_groups(step.params['name'])
+        if self._pending_groups:
+            next_step = self._pending_groups[0].index
+        else:
+            next_step = last_index(step) + 1
+        self._save_progress(next_step)
+
+    def end_testcase(self, name):
+        # 用例结束时已等待全部后台组
+        self._join_groups(None)
+        if name not in self.state['completed']:
+            self.state['completed'].append(name)
+        self.state['running'].pop(name, None)
+        self._testcase = None
+        self._write()
+
+    def clear(self, names=None):
+        """
+        用例执行成功后清除断点。
+        :param names: 本次执行完的用例名称，None表示全部用例都已通过（删除断点文件）
+        """
+        if names is not None:
+            for name in names:
+                self.state['running'].pop(name, None)
+                if name in self.state['completed']:
+                    self.state['completed'].remove(name)
+            if self.state['running']:
+                # 其他用例还有未完成的断点，保留
+                self._write()
+                return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _join_groups(self, name):
+        joined = [g for g in self._pending_groups if name is None or g.params['name'] == name]
+        for group in joined:
+            update_markers(self.markers, group)
+        self._pending_groups = [g for g in self._pending_groups if g not in joined]
+
+    def _save_progress(self, next_step):
+        expire_markers(self.markers)
+        self.state['running'][self._testcase] = dict(self.markers, next_step=next_step)
+        self._write()
+
+    def _write(self):
+        # 先写临时文件再替换，进程中途被杀时不会留下损坏的断点
+        self.state['updated'] = time.time()
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[CHECKPOINT] 写入断点失败: {self.path}, 原因: {e}")
+
+
+def resume_plan(plans, state=None, testcase_name=None, step_number=None):
+    """
+    计算续跑位置。
+    :param plans: 按执行顺序排列的 [TestcasePlan, ...]
+    :param state: 已读取的断点（None表示没有断点）
+    :param testcase_name: 配合step_number指定从哪个用例继续，默认第一个用例
+    :param step_number: 指定从第几步继续（从1开始），优先于断点中的位置
+    :return: ([(plan, 起始步骤序号), ...], 续跑前应恢复的状态标记 {'network', 'audio'})
+    """
+    markers = {'network': None, 'audio': None}
+    if step_number is not None:
+        names = [plan.name for plan in plans]
+        target = testcase_name if testcase_name is not None else (names[0] if names else None)
+        if target not in names:
+            raise ValueError(f"未找到用例: {target}")
+        position = names.index(target)
+        start = step_number - 1
+        # 指定步骤时根据之前的步骤推算网络/音频状态
+        for step in plans[position].steps:
+            if last_index(step) >= start:
+                break
+            update_markers(markers, step)
+        return [(plans[position], start)] + [(plan, 0) for plan in plans[position + 1:]], markers
+    if state is None:
+        return [(plan, 0) for plan in plans], markers
+    completed = set(state.get('completed', ()))
+    running = state.get('running', {})
+    selected = []
+    for plan in plans:
+        if plan.name in completed:
+            continue
+        entry = running.get(plan.name)
+        if not selected and entry:
+            # 按第一个续跑用例中断时的状态恢复
+            markers = {'network': entry.get('network'), 'audio': entry.get('audio')}
+        selected.append((plan, entry['next_step'] if entry else 0))
+    return selected, expire_markers(markers)
@@ -0,0 +1,129 @@
+"""
+debug_artifacts.py
+调试产物（匹配区域截图等）输出模块。
+默认关闭；启用后每次查找最多保存若干张图片，PNG编码和写盘在后台线程完成，
+所有文件写入本次运行独立的目录，不会影响匹配耗时。
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+
+class DebugArtifacts:
+    """调试产物写入器：队列 + 后台写盘线程"""
+
+    def __init__(self, root='debug_artifacts', enabled=False, max_per_lookup=5, queue_size=256):
+        """
+        :param root: 产物根目录，每次运行在其下创建独立子目录
+        :param enabled: 是否启用
+        :param max_per_lookup: 单次查找最多保存的图片数
+        :param queue_size: 待写队列上限，队列满时丢弃新图片而不阻塞调用方
+        """
+        self.root = root
+        self.enabled = enabled
+        self.max_per_lookup = max_per_lookup
+        self.run_dir = None
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lookup_seq = 0
+        self._lock = threading.Lock()
+
+    def enable(self, root=None, max_per_lookup=None):
+        """启用调试产物输出"""
+        if root is not None:
+            self.root = root
+        if max_per_lookup is not None:
+            self.max_per_lookup = max_per_lookup
+        self.enabled = True
+
+    def new_lookup(self, label):
+        """
+        开始一次新的查找，返回用于文件名的前缀。
+        :param label: 查找标签（如模板文件名）
+        """
+        with self._lock:
+            self._lookup_seq += 1
+            seq = self._lookup_seq
+        stem = os.path.splitext(os.path.basename(str(label)))[0]
+        return f"{seq:04d}_{stem}"
+
+    def save_image(self, name, image):
+        """
+        异步保存图片，调用方只付出一次小数组拷贝的开销。
+        :param name: 文件名（相对本次运行目录）
+        :param image: numpy数组（RGB）或PIL.Image
+        :return: 是否已加入写入队列
+        """
+        if not self.enabled:
+            return False
+        if isinstance(image, np.ndarray):
+            image = np.ascontiguousarray(image).copy()
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((name, image))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=None):
+        """等待队列中的图片全部写完"""
+        if self._thread is None:
+            return
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(0.01)
+
+    def close(self, timeout=10):
+        """写完剩余图片并停止后台线程"""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._queue.put((None, None))
+        self._thread.join(timeout)
+        self._thread = None
+        if self.dropped:
+            print(f"[DEBUG] 写入队列已满，丢弃调试图片 {self.dropped} 张")
+        if self.run_dir:
+            print(f"[DEBUG] 调试图片已保存到: {self.run_dir}")
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.run_dir is None:
+                run_name = time.strftime('run_%Y%m%d_%H%M%S') + f"_{os.getpid()}"
+                self.run_dir = os.path.join(self.root, run_name)
+            os.makedirs(self.run_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self._thread.start()
+
+    def _writer_loop(self):
+        while True:
+            name, image = self._queue.get()
+            try:
+                if name is None:
+                    return
+                if isinstance(image, np.ndarray):
+                    image = Image.fromarray(image)
+                image.save(os.path.join(self.run_dir, name))
+            except Exception as e:
+                print(f"保存调试图片失败: {name}, 原因: {e}")
+            finally:
+                self._queue.task_done()
+
+
+# 全局调试产物写入器（默认关闭）
+_artifacts = DebugArtifacts(enabled=os.environ.get('AUTOCONTROL_DEBUG_ARTIFACTS') == '1')
+
+
+def get_debug_artifacts():
+    """获取全局调试产物写入器"""
+    return _artifacts
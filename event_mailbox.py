@@ -0,0 +1,111 @@
+"""
+event_mailbox.py
+按事件名分队列的消息邮箱：收到消息时用条件变量唤醒等待的接收方，不需要轮询。
+- 每个事件一个 deque，按事件取消息为 O(1)，不随积压消息增多而变慢
+- 不指定事件时按到达顺序取最早的一条（比较各队列队首的序号）
+- 可以只取某个发送方的消息（消息的 'sender' 键），其他发送方的消息留在队列中
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class EventMailbox:
+    """线程安全的事件邮箱"""
+
+    def __init__(self):
+        self._queues = {}                  # 事件名 -> deque[(序号, 消息)]
+        self._seq = itertools.count()
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def put(self, message):
+        """放入一条消息（消息为包含 'event' 键的字典）"""
+        self.put_many((message,))
+
+    def put_many(self, messages):
+        """批量放入消息，只唤醒一次等待方"""
+        with self._cond:
+            for message in messages:
+                event = message.get('event') if isinstance(message, dict) else None
+                queue = self._queues.get(event)
+                if queue is None:
+                    queue = self._queues[event] = deque()
+                queue.append((next(self._seq), message))
+                self._count += 1
+            # 等待不同事件的接收方可能同时存在，全部唤醒各自检查
+            self._cond.notify_all()
+
+    def get(self, event=None, timeout=None, sender=None):
+        """
+        取出一条消息，没有时阻塞等待。
+        :param event: 事件名，None表示任意事件（按到达顺序）
+        :param timeout: 最长等待时间（秒），None表示一直等待
+        :param sender: 只取该发送方的消息，None表示任意发送方
+        :return: 消息，超时返回None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                message = self._pop(event, sender)
+                if message is not None:
+                    return message
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def get_nowait(self, event=None, sender=None):
+        """不等待，没有消息时返回None"""
+        with self._cond:
+            return self._pop(event, sender)
+
+    def _pop(self, event, sender=None):
+        if sender is not None:
+            return self._pop_from(event, sender)
+        if event is None:
+            heads = [(queue[0][0], name) for name, queue in self._queues.items() if queue]
+            if not heads:
+                return None
+            _, event = min(heads)
+        queue = self._queues.get(event)
+        if not queue:
+            return None
+        self._count -= 1
+        return queue.popleft()[1]
+
+    def _pop_from(self, event, sender):
+        # 按发送方筛选需要扫描队列，取各队列中该发送方最早的一条再比较序号
+        best = None
+        for name in (self._queues if event is None else (event,)):
+            for position, (seq, message) in enumerate(self._queues.get(name, ())):
+                if isinstance(message, dict) and message.get('sender') == sender:
+                    if best is None or seq < best[0]:
+                        best = (seq, name, position)
+                    break
+        if best is None:
+            return None
+        _, name, position = best
+        queue = self._queues[name]
+        message = queue[position][1]
+        del queue[position]
+        self._count -= 1
+        return message
+
+    def snapshot(self):
+        """按到达顺序返回当前所有消息（不取出）"""
+        with self._cond:
+            items = [item for queue in self._queues.values() for item in queue]
+        return [message for _, message in sorted(items, key=lambda item: item[0])]
+
+    def clear(self):
+        with self._cond:
+            self._queues.clear()
+            self._count = 0
+
+    def __len__(self):
+        return self._count
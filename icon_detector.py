@@ -3,83 +3,373 @@ icon_detector.py
 图标检测模块，基于OpenCV模板匹配。
 用法：给定模板图片和待检测截图，返回所有匹配位置。
 """
+import os
+import threading
+from collections import OrderedDict
+
 import cv2
 import numpy as np
-from PIL import ImageGrab, Image
+from PIL import Image
+
+from debug_artifacts import get_debug_artifacts
+from screen_capture import get_screen_capture
+from run_report import timed
+
+
+class TemplateEntry:
+    """单个模板的缓存项：灰度图及其下采样金字塔"""
+
+    def __init__(self, path, mtime, gray, pyramid):
+        self.path = path
+        self.mtime = mtime
+        self.gray = gray            # 原始分辨率灰度模板
+        self.pyramid = pyramid      # [gray, 1/2, 1/4, ...]，由细到粗
+
+    @property
+    def size(self):
+        """模板尺寸 (w, h)"""
+        h, w = self.gray.shape[:2]
+        return w, h
+
+
+class TemplateStore:
+    """
+    模板缓存：每个模板文件只读取、灰度化一次，按LRU淘汰。
+    文件修改时间变化时自动重新加载；同时预先计算金字塔层级，供由粗到细匹配使用。
+    """
+
+    def __init__(self, max_items=64, pyramid_levels=3, min_size=8):
+        """
+        :param max_items: 最多缓存的模板数
+        :param pyramid_levels: 除原图外额外生成的下采样层数
+        :param min_size: 金字塔层的最小边长，低于此值不再下采样
+        """
+        self.max_items = max_items
+        self.pyramid_levels = pyramid_levels
+        self.min_size = min_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template_path):
+        """
+        获取模板缓存项，未缓存或文件已修改时重新加载。
+        :param template_path: 模板图片路径
+        :return: TemplateEntry
+        """
+        key = os.path.abspath(template_path)
+        try:
+            mtime = os.path.getmtime(key)
+        except OSError:
+            with self._lock:
+                self._items.pop(key, None)
+            raise FileNotFoundError(f"模板图片未找到: {template_path}")
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry.mtime == mtime:
+                self._items.move_to_end(key)
+                return entry
+        entry = self._load(key, mtime, template_path)
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return entry
+
+    def invalidate(self, template_path=None):
+        """清除指定模板的缓存，不传参数则清空全部"""
+        with self._lock:
+            if template_path is None:
+                self._items.clear()
+            else:
+                self._items.pop(os.path.abspath(template_path), None)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _load(self, key, mtime, template_path):
+        template = cv2.imread(key)
+        if template is None:
+            raise FileNotFoundError(f"模板图片未找到: {template_path}")
+        gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        return TemplateEntry(key, mtime, gray, self._build_pyramid(gray))
+
+    def _build_pyramid(self, gray):
+        pyramid = [gray]
+        for _ in range(self.pyramid_levels):
+            h, w = pyramid[-1].shape[:2]
+            if min(h, w) // 2 < self.min_size:
+                break
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+
+# 进程内共享的模板缓存
+_default_store = TemplateStore()
+
+
+def get_template_store():
+    """获取全局模板缓存"""
+    return _default_store
+
 
 class IconDetector:
-    def __init__(self, threshold=0.8):
+    def __init__(self, threshold=0.8, store=None):
         self.threshold = threshold  # 匹配阈值，越高越严格
+        self.store = store if store is not None else _default_store  # 模板缓存
 
     def find_icons(self, template_path, screenshot=None, max_results=5):
         """
         检测截图中所有与模板相似的图标位置。
         :param template_path: 模板图片路径
-        :param screenshot: PIL.Image 或 None（自动截图）
+        :param screenshot: PIL.Image、numpy数组(RGB) 或 None（从截图服务取帧）
         :param max_results: 返回最多匹配数
         :return: [(center_x, center_y, score), ...]
         """
+        img_rgb, img_gray = self._prepare_screenshot(screenshot)
+        # 模板匹配耗时计入执行报告
+        with timed('match'):
+            template_gray = self.store.get(template_path).gray
+            h, w = template_gray.shape[:2]
+            res = cv2.matchTemplate(img_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+            # 峰值提取与非极大值抑制（防止重叠区域多次计数）
+            peaks = self._extract_peaks(res, w, h, self.threshold, max_results)
+            matches = [(x + w // 2, y + h // 2, score) for x, y, score in peaks]
+        self._dump_matches(template_path, img_rgb, matches, [(w, h)] * len(matches))
+        return matches
+
+    def find_icons_multiscale(self, template_path, screenshot=None, max_results=5,
+                              scales=(1.0,), coarse_level=2, coarse_margin=0.2):
+        """
+        由粗到细的多尺度模板匹配，返回格式与find_icons相同。
+        先在下采样后的截图上粗匹配找出候选峰值，再只在候选附近做全分辨率精匹配；
+        同时在多个模板缩放比例上搜索，以适应DPI缩放导致的图标尺寸变化。
+        :param template_path: 模板图片路径
+        :param screenshot: PIL.Image、numpy数组(RGB) 或 None（从截图服务取帧）
+        :param max_results: 返回最多匹配数
+        :param scales: 模板缩放比例列表，例如 (1.0, 1.25, 1.5)
+        :param coarse_level: 粗匹配的金字塔层级，每层分辨率减半
+        :param coarse_margin: 粗匹配阈值相对threshold的放宽量
+        :return: [(center_x, center_y, score), ...]
+        """
+        img_rgb, img_gray = self._prepare_screenshot(screenshot)
+        # 模板匹配耗时计入执行报告
+        with timed('match'):
+            entry = self.store.get(template_path)
+            # 截图金字塔只需计算一次，所有缩放比例共用
+            screen_pyramid = [img_gray]
+            for _ in range(coarse_level):
+                screen_pyramid.append(cv2.pyrDown(screen_pyramid[-1]))
+
+            matches = []
+            for scale in scales:
+                template = self._scaled_template(entry, scale)
+                h, w = template.shape[:2]
+                if h > img_gray.shape[0] or w > img_gray.shape[1]:
+                    continue
+                level = self._usable_level(template, coarse_level)
+                if level == 0:
+                    # 模板太小无法下采样，直接全分辨率匹配
+                    res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
+                    candidates = self._extract_peaks(res, w, h, self.threshold, max_results * 4)
+                    for x, y, score in candidates:
+                        matches.append((x + w // 2, y + h // 2, score, w, h))
+                    continue
+                coarse_tpl = entry.pyramid[level] if scale == 1.0 and level < len(entry.pyramid) else None
+                if coarse_tpl is None:
+                    coarse_tpl = template
+                    for _ in range(level):
+                        coarse_tpl = cv2.pyrDown(coarse_tpl)
+                factor = 2 ** level
+                ch, cw = coarse_tpl.shape[:2]
+                res = cv2.matchTemplate(screen_pyramid[level], coarse_tpl, cv2.TM_CCOEFF_NORMED)
+                candidates = self._extract_peaks(res, cw, ch, self.threshold - coarse_margin, max_results * 4)
+                for cx, cy, _ in candidates:
+                    refined = self._refine(img_gray, template, cx * factor, cy * factor, factor * 2)
+                    if refined is not None and refined[2] >= self.threshold:
+                        x, y, score = refined
+                        matches.append((x + w // 2, y + h // 2, score, w, h))
+            # 各匹配按自己所在缩放比例的模板尺寸计算重叠
+            widths = np.array([m[3] for m in matches], dtype=np.int64)
+            heights = np.array([m[4] for m in matches], dtype=np.int64)
+            matches = self._nms(matches, widths, heights)
+            matches = sorted(matches, key=lambda x: -x[2])[:max_results]
+        self._dump_matches(template_path, img_rgb, [m[:3] for m in matches], [m[3:] for m in matches])
+        return [m[:3] for m in matches]
+
+    def _dump_matches(self, template_path, img_rgb, matches, sizes):
+        # 调试模式下异步保存匹配区域截图，单次查找有数量上限；sizes为各匹配的模板尺寸 [(w, h), ...]
+        artifacts = get_debug_artifacts()
+        if not artifacts.enabled:
+            return
+        lookup = artifacts.new_lookup(template_path)
+        for idx, ((x, y, score), (w, h)) in enumerate(zip(matches[:artifacts.max_per_lookup], sizes)):
+            left, top = max(0, x - w // 2), max(0, y - h // 2)
+            crop = img_rgb[top:top + h, left:left + w]
+            artifacts.save_image(f"{lookup}_match{idx + 1}_{score:.2f}.png", crop)
+
+    def _prepare_screenshot(self, screenshot):
+        # 截图转为RGB数组及灰度图（numpy帧直接使用，不拷贝）
         if screenshot is None:
-            screenshot = ImageGrab.grab()
-        img_rgb = np.array(screenshot)
+            screenshot = get_screen_capture().grab()
+        img_rgb = np.asarray(screenshot)
         if img_rgb.shape[2] == 4:
             img_rgb = cv2.cvtColor(img_rgb, cv2.COLOR_RGBA2RGB)
-        # 转为灰度图
         img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
-        template = cv2.imread(template_path)
-        if template is None:
-            raise FileNotFoundError(f"模板图片未找到: {template_path}")
-        template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-        h, w = template_gray.shape[:2]
-        res = cv2.matchTemplate(img_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= self.threshold)
-        matches = []
-        for idx, pt in enumerate(zip(*loc[::-1])):
-            center_x = pt[0] + w // 2
-            center_y = pt[1] + h // 2
-            score = res[pt[1], pt[0]]
-            matches.append((center_x, center_y, score))
-            # 保存匹配区域截图
-            crop = img_rgb[pt[1]:pt[1]+h, pt[0]:pt[0]+w]
-            try:
-                crop_img = Image.fromarray(crop)
-                crop_img.save(f"debug_match_{idx+1}.png")
-            except Exception as e:
-                print(f"保存匹配区域截图失败: {e}")
-        # 去重（防止重叠区域多次计数）
-        matches = self._nms(matches, w, h)
-        matches = sorted(matches, key=lambda x: -x[2])[:max_results]
-        return matches
+        return img_rgb, img_gray
+
+    def _scaled_template(self, entry, scale):
+        # 按比例缩放模板，1.0直接使用缓存的灰度图
+        if scale == 1.0:
+            return entry.gray
+        w, h = entry.size
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        interp = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        return cv2.resize(entry.gray, size, interpolation=interp)
+
+    def _usable_level(self, template, coarse_level):
+        # 模板下采样后边长不能小于最小尺寸，否则粗匹配不可靠
+        min_size = self.store.min_size
+        h, w = template.shape[:2]
+        level = 0
+        while level < coarse_level and min(h, w) // 2 >= min_size:
+            h, w = (h + 1) // 2, (w + 1) // 2
+            level += 1
+        return level
+
+    def _refine(self, img_gray, template, x, y, pad):
+        # 在候选位置附近的小区域内做全分辨率匹配
+        h, w = template.shape[:2]
+        img_h, img_w = img_gray.shape[:2]
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(img_w, x + w + pad), min(img_h, y + h + pad)
+        if x1 - x0 < w or y1 - y0 < h:
+            return None
+        res = cv2.matchTemplate(img_gray[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        return (x0 + max_loc[0], y0 + max_loc[1], max_val)
+
+    def _extract_peaks(self, res, w, h, threshold, max_peaks, iou_thresh=0.3):
+        """
+        从匹配结果图中按分数从高到低提取峰值，结果与逐像素贪心NMS完全一致。
+        每次取剩余最大值，再用预先计算的IoU抑制核屏蔽与其重叠的位置，
+        循环次数不超过max_peaks，耗时与超过阈值的像素数量无关。
+        :return: [(left, top, score), ...]，坐标为匹配框左上角
+        """
+        kernel = self._suppression_kernel(w, h, iou_thresh)
+        ry, rx = kernel.shape[0] // 2, kernel.shape[1] // 2
+        scores = np.where(res >= threshold, res, -np.inf).astype(np.float32, copy=False)
+        rh, rw = scores.shape[:2]
+        peaks = []
+        while len(peaks) < max_peaks:
+            # argmax返回行优先的首个最大值，与原排序的稳定次序一致
+            idx = int(np.argmax(scores))
+            y, x = divmod(idx, rw)
+            if scores[y, x] == -np.inf:
+                break
+            peaks.append((x, y, res[y, x]))
+            y0, y1 = max(0, y - ry), min(rh, y + ry + 1)
+            x0, x1 = max(0, x - rx), min(rw, x + rx + 1)
+            mask = kernel[y0 - (y - ry):y1 - (y - ry), x0 - (x - rx):x1 - (x - rx)]
+            scores[y0:y1, x0:x1][mask] = -np.inf
+            scores[y, x] = -np.inf
+        return peaks
+
+    def _suppression_kernel(self, w, h, iou_thresh):
+        # 同尺寸框的IoU只取决于偏移量，预先算出需要抑制的偏移区域
+        bw, bh = (w // 2) * 2, (h // 2) * 2
+        dx = np.abs(np.arange(-max(bw - 1, 0), max(bw - 1, 0) + 1))
+        dy = np.abs(np.arange(-max(bh - 1, 0), max(bh - 1, 0) + 1))
+        inter = np.outer(np.maximum(0, bh - dy), np.maximum(0, bw - dx)).astype(np.float64)
+        area = float(bw * bh)
+        iou = inter / (2 * area - inter + 1e-6)
+        return iou >= iou_thresh
 
     def _nms(self, matches, w, h, iou_thresh=0.3):
-        # 非极大值抑制，去除重叠框
-        boxes = [((x-w//2, y-h//2, x+w//2, y+h//2), score) for x, y, score in matches]
-        boxes = sorted(boxes, key=lambda x: -x[1])
+        # 非极大值抑制，去除重叠框（按分数降序贪心保留，IoU以数组运算）
+        # w、h为所有框共用的尺寸，或与matches等长的数组（每个框各自的尺寸）
+        if not matches:
+            return []
+        centers = np.array([m[:2] for m in matches], dtype=np.int64)
+        scores = np.array([m[2] for m in matches], dtype=np.float64)
+        x1, y1 = centers[:, 0] - w // 2, centers[:, 1] - h // 2
+        x2, y2 = centers[:, 0] + w // 2, centers[:, 1] + h // 2
+        areas = (x2 - x1) * (y2 - y1)
+        alive = np.ones(len(matches), dtype=bool)
         keep = []
-        while boxes:
-            box, score = boxes.pop(0)
-            keep.append((
-                (box[0]+box[2])//2,
-                (box[1]+box[3])//2,
-                score
-            ))
-            boxes = [b for b in boxes if self._iou(box, b[0]) < iou_thresh]
+        for i in np.argsort(-scores, kind='stable'):
+            if not alive[i]:
+                continue
+            keep.append(matches[i])
+            inter = (np.maximum(0, np.minimum(x2[i], x2) - np.maximum(x1[i], x1)) *
+                     np.maximum(0, np.minimum(y2[i], y2) - np.maximum(y1[i], y1)))
+            iou = inter / (areas[i] + areas - inter + 1e-6)
+            alive &= iou < iou_thresh
         return keep
 
-    def _iou(self, boxA, boxB):
-        # 计算两个框的交并比
-        xA = max(boxA[0], boxB[0])
-        yA = max(boxA[1], boxB[1])
-        xB = min(boxA[2], boxB[2])
-        yB = min(boxA[3], boxB[3])
-        interArea = max(0, xB - xA) * max(0, yB - yA)
-        boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
-        boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
-        iou = interArea / float(boxAArea + boxBArea - interArea + 1e-6)
-        return iou
+
+def _synthetic_screen(width, height, icon, positions, seed=0):
+    # 生成带渐变背景和干扰图形的合成截图，并在指定位置贴上图标
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)
+    screen = np.repeat(np.tile(gradient, (height, 1))[:, :, None], 3, axis=2).astype(np.uint8)
+    for _ in range(200):
+        x, y = int(rng.integers(0, width - 80)), int(rng.integers(0, height - 40))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(screen, (x, y), (x + int(rng.integers(20, 80)), y + int(rng.integers(10, 40))), color, -1)
+    for x, y in positions:
+        ih, iw = icon.shape[:2]
+        screen[y:y + ih, x:x + iw] = icon
+    return screen
+
+
+def _synthetic_icon(size=48):
+    icon = np.full((size, size, 3), 235, dtype=np.uint8)
+    cv2.circle(icon, (size // 2, size // 2), size // 3, (30, 120, 220), -1)
+    cv2.putText(icon, 'A', (size // 3, size * 2 // 3), cv2.FONT_HERSHEY_SIMPLEX, size / 40, (255, 255, 255), 2)
+    cv2.rectangle(icon, (2, 2), (size - 3, size - 3), (60, 60, 60), 2)
+    return icon
+
+
+def benchmark(width=3840, height=2160, repeat=5, threshold=0.8):
+    """
+    对比单尺度全分辨率匹配与由粗到细多尺度匹配的耗时，使用合成截图。
+    """
+    import tempfile
+    import time
+    icon = _synthetic_icon()
+    positions = [(500, 300), (2000, 1200), (3300, 1900)]
+    screen = Image.fromarray(_synthetic_screen(width, height, icon, positions))
+    scaled_icon = cv2.resize(icon, None, fx=1.25, fy=1.25, interpolation=cv2.INTER_LINEAR)
+    scaled_screen = Image.fromarray(_synthetic_screen(width, height, scaled_icon, positions))
+    with tempfile.TemporaryDirectory() as tmp:
+        template_path = os.path.join(tmp, 'icon.png')
+        cv2.imwrite(template_path, cv2.cvtColor(icon, cv2.COLOR_RGB2BGR))
+        detector = IconDetector(threshold=threshold, store=TemplateStore())
+        cases = [
+            ('单尺度 find_icons', lambda: detector.find_icons(template_path, screen)),
+            ('由粗到细 scales=(1.0,)', lambda: detector.find_icons_multiscale(template_path, screen)),
+            ('单尺度 (DPI 125%)', lambda: detector.find_icons(template_path, scaled_screen)),
+            ('由粗到细 scales=(1.0,1.25,1.5) (DPI 125%)',
+             lambda: detector.find_icons_multiscale(template_path, scaled_screen, scales=(1.0, 1.25, 1.5))),
+        ]
+        print(f"合成截图: {width}x{height}, 图标位置: {positions}, 重复{repeat}次")
+        for name, func in cases:
+            func()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                matches = func()
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            found = [(int(x), int(y), round(float(score), 3)) for x, y, score in matches]
+            print(f"  {name:<45} {elapsed:8.1f} ms  匹配: {found}")
+
 
 # 示例用法
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
+        sys.exit(0)
     detector = IconDetector(threshold=0.8)
     matches = detector.find_icons('icon_template.png')
     for i, (x, y, score) in enumerate(matches):
@@ -1,73 +1,204 @@
 """
 键盘控制模块
 提供键盘按键、输入文本等操作
+输入文本支持批量方式：按块发送，或长文本/中文通过剪贴板粘贴；只有目标程序需要时才逐字符输入
 """
 
-from pynput.keyboard import Controller, Key
+import sys
 import time
 
+# 输入策略：auto 自动选择，chunk 按块发送，paste 剪贴板粘贴，char 逐字符输入（带间隔）
+TYPE_STRATEGIES = ('auto', 'chunk', 'paste', 'char')
+# auto 策略下，文本长度达到该值或包含非ASCII字符（中文等）时使用剪贴板粘贴
+PASTE_MIN_LENGTH = 64
+# chunk 策略每次发送的字符数
+CHUNK_SIZE = 32
+# 粘贴后等待目标程序读取剪贴板的时间（秒），之后恢复原剪贴板内容
+# Ctrl+V 由目标窗口异步处理，繁忙的程序（如Electron客户端）读取剪贴板可能晚几百毫秒
+PASTE_SETTLE = 0.5
+
+
+class _Win32Clipboard:
+    """Windows剪贴板（pywin32）"""
+
+    def get_text(self):
+        import win32clipboard
+        import win32con
+        win32clipboard.OpenClipboard()
+        try:
+            if win32clipboard.IsClipboardFormatAvailable(win32con.CF_UNICODETEXT):
+                return win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
+            return None
+        finally:
+            win32clipboard.CloseClipboard()
+
+    def set_text(self, text):
+        import win32clipboard
+        import win32con
+        win32clipboard.OpenClipboard()
+        try:
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardData(win32con.CF_UNICODETEXT, text)
+        finally:
+            win32clipboard.CloseClipboard()
+
+
+class _PyperclipClipboard:
+    """其他平台的剪贴板（pyperclip）"""
+
+    def get_text(self):
+        import pyperclip
+        return pyperclip.paste()
+
+    def set_text(self, text):
+        import pyperclip
+        pyperclip.copy(text)
+
+
+def _probe_clipboard(clipboard):
+    """实际读写一次剪贴板（写回原内容），失败时返回None"""
+    try:
+        text = clipboard.get_text()
+        if text is not None:
+            clipboard.set_text(text)
+    except Exception as e:
+        # 例如 Linux 上缺少 xclip/xsel，或无图形会话
+        print(f"[KEYBOARD] 剪贴板不可用，文本改为逐字符输入: {e}")
+        return None
+    return clipboard
+
+
+def default_clipboard():
+    """返回可用的剪贴板实现，都不可用时返回None（粘贴策略回退为逐字符输入）"""
+    try:
+        import win32clipboard  # noqa: F401
+        return _probe_clipboard(_Win32Clipboard())
+    except ImportError:
+        pass
+    try:
+        import pyperclip  # noqa: F401
+        return _probe_clipboard(_PyperclipClipboard())
+    except ImportError:
+        return None
+
 
 class KeyboardController:
     """键盘控制类"""
     
-    def __init__(self):
-        self.keyboard = Controller()
+    def __init__(self, controller=None, clipboard=False, sleep=time.sleep, paste_settle=PASTE_SETTLE):
+        """
+        Args:
+            controller: pynput键盘控制器，默认创建 pynput.keyboard.Controller
+            clipboard: 剪贴板对象（get_text/set_text），默认自动检测；None表示不使用剪贴板
+            sleep: 休眠函数
+            paste_settle: 粘贴后等待多久再恢复原剪贴板内容（秒）；None表示不恢复
+        """
+        if controller is None:
+            from pynput.keyboard import Controller
+            controller = Controller()
+        self.keyboard = controller
+        self.clipboard = default_clipboard() if clipboard is False else clipboard
+        self.sleep = sleep
+        self.paste_settle = paste_settle
     
-    # 特殊键映射
+    # 特殊键映射：键名 -> pynput.keyboard.Key 的属性名
     SPECIAL_KEYS = {
-        'enter': Key.enter,
-        'return': Key.enter,
-        'tab': Key.tab,
-        'backspace': Key.backspace,
-        'delete': Key.delete,
-        'escape': Key.esc,
-        'esc': Key.esc,
-        'space': Key.space,
-        'home': Key.home,
-        'end': Key.end,
-        'pageup': Key.page_up,
-        'pagedown': Key.page_down,
-        'up': Key.up,
-        'down': Key.down,
-        'left': Key.left,
-        'right': Key.right,
-        'shift': Key.shift,
-        'ctrl': Key.ctrl,
-        'control': Key.ctrl,
-        'alt': Key.alt,
-        'altgr': Key.alt_gr,
-        'win': Key.cmd,
-        'cmd': Key.cmd,
-        'capslock': Key.caps_lock,
-        'numlock': Key.num_lock,
-        'scrolllock': Key.scroll_lock,
-        'print': Key.print_screen,
-        'insert': Key.insert,
-        'f1': Key.f1,
-        'f2': Key.f2,
-        'f3': Key.f3,
-        'f4': Key.f4,
-        'f5': Key.f5,
-        'f6': Key.f6,
-        'f7': Key.f7,
-        'f8': Key.f8,
-        'f9': Key.f9,
-        'f10': Key.f10,
-        'f11': Key.f11,
-        'f12': Key.f12,
+        'enter': 'enter',
+        'return': 'enter',
+        'tab': 'tab',
+        'backspace': 'backspace',
+        'delete': 'delete',
+        'escape': 'esc',
+        'esc': 'esc',
+        'space': 'space',
+        'home': 'home',
+        'end': 'end',
+        'pageup': 'page_up',
+        'pagedown': 'page_down',
+        'up': 'up',
+        'down': 'down',
+        'left': 'left',
+        'right': 'right',
+        'shift': 'shift',
+        'ctrl': 'ctrl',
+        'control': 'ctrl',
+        'alt': 'alt',
+        'altgr': 'alt_gr',
+        'win': 'cmd',
+        'cmd': 'cmd',
+        'capslock': 'caps_lock',
+        'numlock': 'num_lock',
+        'scrolllock': 'scroll_lock',
+        'print': 'print_screen',
+        'insert': 'insert',
+        'f1': 'f1',
+        'f2': 'f2',
+        'f3': 'f3',
+        'f4': 'f4',
+        'f5': 'f5',
+        'f6': 'f6',
+        'f7': 'f7',
+        'f8': 'f8',
+        'f9': 'f9',
+        'f10': 'f10',
+        'f11': 'f11',
+        'f12': 'f12',
     }
     
-    def type_text(self, text, interval=0.05):
+    def type_text(self, text, interval=0.05, strategy='auto', chunk_size=CHUNK_SIZE):
         """输入文本
         
         Args:
             text: 要输入的文本
-            interval: 每个字符之间的间隔（秒）
+            interval: 每个字符之间的间隔（秒），只用于 char 策略
+            strategy: 输入策略，见 TYPE_STRATEGIES
+            chunk_size: chunk 策略每次发送的字符数
+        
+        Returns:
+            实际使用的策略
+        """
+        strategy = self.choose_strategy(text, strategy)
+        if strategy == 'paste':
+            self.paste_text(text)
+        elif strategy == 'chunk':
+            for i in range(0, len(text), chunk_size):
+                self.keyboard.type(text[i:i + chunk_size])
+        else:
+            for char in text:
+                self.keyboard.type(char)
+                if interval > 0:
+                    self.sleep(interval)
+        return strategy
+    
+    def choose_strategy(self, text, strategy='auto'):
+        """确定实际使用的输入策略：auto 时长文本或非ASCII文本用粘贴，其余按块发送；
+        剪贴板不可用时粘贴回退为逐字符输入"""
+        if strategy not in TYPE_STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        if strategy == 'auto':
+            strategy = 'paste' if len(text) >= PASTE_MIN_LENGTH or not text.isascii() else 'chunk'
+        if strategy == 'paste' and self.clipboard is None:
+            strategy = 'char'
+        return strategy
+    
+    def paste_text(self, text):
+        """通过剪贴板粘贴文本，等待 paste_settle 秒后恢复原剪贴板内容（paste_settle 为None时不恢复）
+        
+        Args:
+            text: 要粘贴的文本
         """
-        for char in text:
-            self.keyboard.type(char)
-            if interval > 0:
-                time.sleep(interval)
+        previous = None
+        if self.paste_settle is not None:
+            try:
+                previous = self.clipboard.get_text()
+            except Exception:
+                previous = None
+        self.clipboard.set_text(text)
+        self.key_combination('cmd' if sys.platform == 'darwin' else 'ctrl', 'v')
+        if previous is not None:
+            # 目标程序处理粘贴消息时才读取剪贴板，过早恢复会粘贴出原来的内容
+            self.sleep(self.paste_settle)
+            self.clipboard.set_text(previous)
     
     def press_key(self, key_name):
         """按下键（不释放）
@@ -99,7 +230,7 @@ class KeyboardController:
             self.press_key(key_name)
             self.release_key(key_name)
             if count > 1:
-                time.sleep(interval)
+                self.sleep(interval)
     
     def key_combination(self, *keys):
         """按下多个键的组合（如Ctrl+C）
@@ -128,7 +259,7 @@ class KeyboardController:
             duration: 持续时间（秒）
         """
         self.press_key(key_name)
-        time.sleep(duration)
+        self.sleep(duration)
         self.release_key(key_name)
     
     def _get_key(self, key_name):
@@ -143,8 +274,71 @@ class KeyboardController:
         key_name_lower = str(key_name).lower()
         
         if key_name_lower in self.SPECIAL_KEYS:
-            return self.SPECIAL_KEYS[key_name_lower]
+            from pynput.keyboard import Key
+            return getattr(Key, self.SPECIAL_KEYS[key_name_lower])
         elif len(key_name) == 1:
             return key_name
         else:
             raise ValueError(f"Unknown key: {key_name}")
+
+
+class _FakeKeyboard:
+    """只计数的假键盘，用于基准测试；每个按键事件按 key_cost 秒模拟系统注入开销"""
+
+    def __init__(self, key_cost=0.0):
+        self.key_cost = key_cost
+        self.chars = 0
+        self.calls = 0
+
+    def type(self, text):
+        self.calls += 1
+        self.chars += len(text)
+        if self.key_cost:
+            time.sleep(self.key_cost * len(text))
+
+    def press(self, key):
+        self.calls += 1
+
+    def release(self, key):
+        pass
+
+
+class _FakeClipboard:
+    def __init__(self):
+        self.text = None
+
+    def get_text(self):
+        return self.text
+
+    def set_text(self, text):
+        self.text = text
+
+
+def benchmark(length=200, interval=0.05, key_cost=0.0005, real=False):
+    """对比各输入策略每秒输入的字符数
+    
+    Args:
+        length: 测试文本长度
+        interval: char 策略的字符间隔（秒）
+        key_cost: 假键盘每个字符的模拟注入耗时（秒）
+        real: 使用真实键盘和剪贴板（会向当前焦点窗口输入文本）
+    """
+    text = ('AutoControlPC 测试文本 0123456789 ' * (length // 20 + 1))[:length]
+    print(f"文本长度 {length}，char 策略间隔 {interval}s" + ("" if real else f"，假键盘单字符耗时 {key_cost * 1000:.1f}ms"))
+    if real:
+        print("3秒后开始向当前焦点窗口输入...")
+        time.sleep(3)
+    for strategy in ('char', 'chunk', 'paste'):
+        if real:
+            controller = KeyboardController()
+        else:
+            controller = KeyboardController(controller=_FakeKeyboard(key_cost), clipboard=_FakeClipboard())
+        start = time.perf_counter()
+        used = controller.type_text(text, interval=interval, strategy=strategy)
+        elapsed = time.perf_counter() - start
+        print(f"  {strategy:<6} 实际策略 {used:<6} {elapsed * 1000:9.1f} ms  {length / elapsed:10.0f} 字符/秒")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark(real='--real' in sys.argv)
@@ -1,41 +1,110 @@
 """
 鼠标控制模块
 提供鼠标移动、点击、滚动等操作
+移动轨迹用NumPy一次算好（支持缓动曲线），按截止时间逐点发出，总耗时与duration一致
 """
 
-from pynput.mouse import Controller, Button
 import time
 
+import numpy as np
+
+# 轨迹点发送频率（每秒点数）
+MOVE_RATE = 60
+
+# 缓动曲线：进度 t∈[0,1] -> 位移比例
+EASINGS = {
+    'linear': lambda t: t,
+    'ease_in': lambda t: t * t,
+    'ease_out': lambda t: t * (2 - t),
+    'ease_in_out': lambda t: t * t * (3 - 2 * t),
+}
+
+
+def mouse_path(start, end, duration, rate=MOVE_RATE, easing='ease_in_out'):
+    """计算移动轨迹
+
+    Args:
+        start: 起点 (x, y)
+        end: 终点 (x, y)
+        duration: 移动耗时（秒）
+        rate: 每秒轨迹点数
+        easing: 缓动曲线名称，见 EASINGS
+
+    Returns:
+        (offsets, points)：每个点相对开始时刻的发送时间（秒）和整数坐标 (N, 2)；
+        相邻重复的点已去掉，最后一个点一定是终点，且发送时间为 duration
+    """
+    steps = max(1, int(round(duration * rate)))
+    t = np.arange(1, steps + 1, dtype=np.float64) / steps
+    progress = EASINGS[easing](t)
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    points = np.rint(start + (end - start) * progress[:, None]).astype(np.int64)
+    keep = np.ones(steps, dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    offsets = t[keep] * duration
+    # 缓动曲线末段变化很小，终点常常提前出现；终点仍在移动结束时刻发送
+    offsets[-1] = duration
+    return offsets, points[keep]
+
+
+def _button(name):
+    from pynput.mouse import Button
+    return Button.left if name == 'left' else Button.right if name == 'right' else Button.middle
+
 
 class MouseController:
     """鼠标控制类"""
     
-    def __init__(self):
-        self.mouse = Controller()
+    def __init__(self, controller=None, clock=time.perf_counter, sleep=time.sleep):
+        """
+        Args:
+            controller: pynput鼠标控制器（需要 position 属性），默认创建 pynput.mouse.Controller
+            clock: 计时函数
+            sleep: 休眠函数
+        """
+        if controller is None:
+            from pynput.mouse import Controller
+            controller = Controller()
+        self.mouse = controller
+        self.clock = clock
+        self.sleep = sleep
     
     def get_position(self):
         """获取当前鼠标位置"""
         return self.mouse.position
     
-    def move_to(self, x, y, duration=0.5):
+    def move_to(self, x, y, duration=0.5, easing='ease_in_out', fast=False):
         """移动鼠标到指定位置
         
         Args:
             x: 目标X坐标
             y: 目标Y坐标
             duration: 移动耗时（秒），0表示立即移动
+            easing: 缓动曲线名称，见 EASINGS
+            fast: 快速模式，直接跳到目标并校正一次，忽略duration
         """
-        if duration > 0:
-            current_x, current_y = self.mouse.position
-            steps = int(duration * 60)  # 假设60fps
-            for i in range(steps):
-                progress = (i + 1) / steps
-                new_x = current_x + (x - current_x) * progress
-                new_y = current_y + (y - current_y) * progress
-                self.mouse.position = (new_x, new_y)
-                time.sleep(1/60)
-        else:
-            self.mouse.position = (x, y)
+        target = (int(round(x)), int(round(y)))
+        if fast or duration <= 0:
+            self.mouse.position = target
+            # 部分系统（DPI缩放、多屏边界）首次设置后位置有偏差，校正一次
+            if tuple(self.mouse.position) != target:
+                self.mouse.position = target
+            return
+        offsets, points = mouse_path(self.mouse.position, target, duration, easing=easing)
+        start = self.clock()
+        last = len(points) - 1
+        i = 0
+        while i <= last:
+            now = self.clock() - start
+            # 落后于计划时跳过已过期的中间点，保证总耗时不被拖长
+            while i < last and offsets[i + 1] <= now:
+                i += 1
+            remaining = offsets[i] - now
+            if remaining > 0:
+                self.sleep(remaining)
+            self.mouse.position = (int(points[i][0]), int(points[i][1]))
+            i += 1
     
     def move_relative(self, dx, dy, duration=0.5):
         """相对当前位置移动鼠标
@@ -61,12 +130,12 @@ class MouseController:
         if x is not None and y is not None:
             self.move_to(x, y, duration=0.2)
         
-        btn = Button.left if button == 'left' else Button.right if button == 'right' else Button.middle
+        btn = _button(button)
         
         for _ in range(count):
             self.mouse.click(btn, 1)
             if count > 1:
-                time.sleep(interval)
+                self.sleep(interval)
     
     def left_click(self, x=None, y=None, count=1, interval=0.1):
         """左键点击"""
@@ -105,7 +174,57 @@ class MouseController:
         """
         self.move_to(start_x, start_y, duration=0.2)
         
-        btn = Button.left if button == 'left' else Button.right if button == 'right' else Button.middle
+        btn = _button(button)
         
         with self.mouse.pressed(btn):
             self.move_to(end_x, end_y, duration=duration)
+
+
+def _legacy_move(mouse, x, y, duration):
+    # 旧实现：逐点插值，每步固定 sleep(1/60)，用于基准对比
+    current_x, current_y = mouse.position
+    steps = int(duration * 60)
+    for i in range(steps):
+        progress = (i + 1) / steps
+        mouse.position = (current_x + (x - current_x) * progress, current_y + (y - current_y) * progress)
+        time.sleep(1 / 60)
+
+
+class _FakeMouse:
+    """只记录位置的假鼠标，用于基准测试"""
+
+    def __init__(self):
+        self._position = (0, 0)
+        self.moves = 0
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
+        self.moves += 1
+
+
+def benchmark(durations=(0.1, 0.3, 0.5, 1.0), target=(1500, 900)):
+    """对比旧的逐点sleep移动与按截止时间移动的实际耗时（使用假鼠标，不需要桌面）"""
+    print(f"移动 (0,0) -> {target}")
+    for duration in durations:
+        fake = _FakeMouse()
+        start = time.perf_counter()
+        _legacy_move(fake, target[0], target[1], duration)
+        legacy = time.perf_counter() - start
+        fake = _FakeMouse()
+        controller = MouseController(controller=fake)
+        start = time.perf_counter()
+        controller.move_to(target[0], target[1], duration)
+        elapsed = time.perf_counter() - start
+        print(f"  duration={duration:.1f}s  旧实现 {legacy * 1000:7.1f} ms   "
+              f"新实现 {elapsed * 1000:7.1f} ms（{fake.moves} 个点，终点 {fake.position}）")
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
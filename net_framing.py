@@ -0,0 +1,127 @@
+"""
+net_framing.py
+P2P消息的分帧协议：每条消息为 4字节大端长度 + UTF-8 JSON。
+- 接收端用可复用的缓冲区增量解码：TCP把多条消息合并成一个分段、或一条大消息被拆成多段时都能正确还原
+- 兼容旧版本对端发来的无长度前缀的裸JSON（首字节为 '{'，作为长度会超过上限，不会与帧头混淆）
+"""
+import json
+import struct
+
+HEADER = struct.Struct('>I')
+# 单条消息的最大长度（字节），超过视为协议错误
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# 单次 recv_into 读取的字节数
+RECV_SIZE = 64 * 1024
+
+_LEGACY_START = ord('{')
+
+
+class FrameError(ValueError):
+    """收到的数据不符合分帧协议（长度超限等），连接应关闭"""
+
+
+def encode_frame(message):
+    """
+    编码一条消息。
+    :param message: 可JSON序列化的对象
+    :return: bytes，帧头 + JSON
+    """
+    payload = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"消息过大: {len(payload)} 字节（上限 {MAX_FRAME_SIZE}）")
+    return HEADER.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    """增量解码器：feed() 收到的字节，返回其中已完整的消息"""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.invalid = 0               # 无法解析为JSON的帧数
+        self._buf = bytearray()
+        self._legacy = None            # None 未确定；True 对端使用旧的裸JSON格式
+        self._json = json.JSONDecoder()
+
+    def feed(self, data):
+        """
+        :param data: bytes / bytearray / memoryview
+        :return: [消息, ...]
+        :raises FrameError: 帧长度超过上限
+        """
+        buf = self._buf
+        buf += data
+        if self._legacy is None and buf:
+            self._legacy = buf[0] == _LEGACY_START
+        if self._legacy:
+            return self._feed_legacy()
+        messages = []
+        offset = 0
+        size = len(buf)
+        while size - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(buf, offset)
+            if length > self.max_frame_size:
+                raise FrameError(f"帧长度 {length} 超过上限 {self.max_frame_size}")
+            end = offset + HEADER.size + length
+            if end > size:
+                break
+            payload = bytes(buf[offset + HEADER.size:end])
+            offset = end
+            try:
+                messages.append(json.loads(payload.decode('utf-8')))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                self.invalid += 1
+                print(f"[P2P] 无效的JSON帧（{length} 字节），已跳过")
+        if offset:
+            # 每批只整理一次缓冲区，未完整的帧留到下一次
+            del buf[:offset]
+        return messages
+
+    def _feed_legacy(self):
+        # 旧格式：连续的JSON对象，用 raw_decode 逐个切出
+        buf = self._buf
+        try:
+            text = buf.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # 多字节字符被截断在末尾，等待后续数据
+            text = buf[:e.start].decode('utf-8')
+        messages = []
+        pos = 0
+        while True:
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+            if pos >= len(text):
+                break
+            try:
+                message, pos = self._json.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break
+            messages.append(message)
+        del buf[:len(text[:pos].encode('utf-8'))]
+        if len(buf) > self.max_frame_size:
+            raise FrameError("旧格式消息超过长度上限或不是合法JSON")
+        return messages
+
+    @property
+    def buffered(self):
+        """缓冲区中尚未组成完整消息的字节数"""
+        return len(self._buf)
+
+
+class FrameReader:
+    """从socket读取消息：复用固定大小的接收缓冲区，避免每次recv分配新对象"""
+
+    def __init__(self, sock, recv_size=RECV_SIZE, decoder=None):
+        self.sock = sock
+        self.decoder = decoder or FrameDecoder()
+        self._chunk = bytearray(recv_size)
+        self._view = memoryview(self._chunk)
+
+    def read(self):
+        """
+        阻塞读取一次，返回本次解码出的消息列表；对端关闭连接时返回None。
+        :raises FrameError: 协议错误
+        """
+        n = self.sock.recv_into(self._view)
+        if not n:
+            return None
+        return self.decoder.feed(self._view[:n])
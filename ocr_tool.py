@@ -4,14 +4,66 @@ ocr_tool.py
 """
 
 import os
-import easyocr
-from PIL import ImageGrab
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import numpy as np
 import cv2
 
+from screen_capture import get_screen_capture
+from run_report import timed
+
 # 禁用CUDA加速，避免"no accelerator is found"警告
 os.environ['CUDA_VISIBLE_DEVICES'] = ''
 
+# 模糊匹配允许的最大编辑距离
+FUZZY_MAX_DISTANCE = 2
+
+
+def bounded_levenshtein(a, b, max_dist=FUZZY_MAX_DISTANCE):
+    """
+    有上界的Levenshtein距离：只计算对角线附近宽度为max_dist的带状区域，
+    长度差超过上界时直接返回，某一行最小值超过上界时提前退出。
+    :return: 实际距离（<=max_dist时），否则返回max_dist+1
+    """
+    if a == b:
+        return 0
+    too_far = max_dist + 1
+    if abs(len(a) - len(b)) > max_dist:
+        return too_far
+    if len(a) < len(b):
+        a, b = b, a
+    len_b = len(b)
+    if len_b == 0:
+        return len(a)
+    previous_row = list(range(len_b + 1))
+    for i, c1 in enumerate(a, 1):
+        lo, hi = max(1, i - max_dist), min(len_b, i + max_dist)
+        current_row = [too_far] * (len_b + 1)
+        if lo == 1:
+            current_row[0] = min(i, too_far)
+        row_min = current_row[0]
+        for j in range(lo, hi + 1):
+            value = min(previous_row[j] + 1,
+                        current_row[j - 1] + 1,
+                        previous_row[j - 1] + (c1 != b[j - 1]),
+                        too_far)
+            current_row[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_dist:
+            return too_far
+        previous_row = current_row
+    return previous_row[len_b]
+
+
+@lru_cache(maxsize=8192)
+def fuzzy_match(target, text, max_dist=FUZZY_MAX_DISTANCE):
+    """判断两个字符串的编辑距离是否不超过max_dist，结果跨调用缓存"""
+    return bounded_levenshtein(target, text, max_dist) <= max_dist
+
+
 class OcrTool:
     def __init__(self, lang_list=None, gpu=False, model_storage_directory='.easyocr'):
         if lang_list is None:
@@ -19,67 +71,218 @@ class OcrTool:
         # gpu=False: 不使用GPU加速，仅CPU运行
         # model_storage_directory: 模型缓存目录，避免重复下载
         # verbose=False: 不输出详细日志信息
+        # easyocr依赖torch，导入本身就很慢，延迟到真正创建引擎时再导入
+        import easyocr
         self.reader = easyocr.Reader(lang_list, gpu=gpu, model_storage_directory=model_storage_directory, verbose=False)
+        # 识别结果缓存：按(画面哈希, 区域)缓存readtext输出，同一帧不重复识别
+        self.cache_size = 8
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def readtext(self, screenshot=None, region=None):
+        """
+        识别截图（或其中一个区域）中的所有文本，同一画面的结果会被缓存。
+        :param screenshot: PIL.Image 或 numpy数组(RGB)，未提供则从截图服务取帧
+        :param region: 识别区域 (left, top, right, bottom)，None表示整张截图
+        :return: [(bbox, text, confidence), ...]，bbox坐标相对整张截图
+        """
+        if screenshot is None:
+            screenshot = get_screen_capture().grab()
+        if not isinstance(screenshot, np.ndarray) and screenshot.mode != 'RGB':
+            screenshot = screenshot.convert('RGB')
+        img_array = np.asarray(screenshot)
+        left, top = 0, 0
+        if region is not None:
+            left, top, right, bottom = (int(v) for v in region)
+            img_array = img_array[top:bottom, left:right]
+        key = (self._frame_hash(img_array), left, top)
+        with self._cache_lock:
+            results = self._cache.get(key)
+            if results is not None:
+                self._cache.move_to_end(key)
+                return results
+        img_bgr = cv2.cvtColor(np.ascontiguousarray(img_array), cv2.COLOR_RGB2BGR)
+        with timed('ocr'):
+            results = self.reader.readtext(img_bgr)
+        if left or top:
+            results = [([[p[0] + left, p[1] + top] for p in bbox], text, conf)
+                       for bbox, text, conf in results]
+        with self._cache_lock:
+            self._cache[key] = results
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+    def clear_cache(self):
+        """清空识别结果缓存"""
+        with self._cache_lock:
+            self._cache.clear()
 
-    def find_text_position(self, target_text, screenshot=None, fuzzy=True):
+    @staticmethod
+    def _frame_hash(img_array):
+        # 画面内容哈希（含尺寸），用作识别缓存的键
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(img_array.shape).encode())
+        digest.update(np.ascontiguousarray(img_array).data)
+        return digest.hexdigest()
+
+    def find_text_position(self, target_text, screenshot=None, fuzzy=True, region=None):
         """
         查找目标文本在屏幕上的中心坐标。
         支持模糊匹配（Levenshtein距离<=2）。
         :param target_text: 目标字符串
         :param screenshot: PIL.Image，可选，未提供则自动截图
         :param fuzzy: 是否启用模糊匹配
+        :param region: 只在该区域 (left, top, right, bottom) 内查找，坐标仍相对整张截图
         :return: (x, y) 或 None
         """
-        if screenshot is None:
-            screenshot = ImageGrab.grab()
-        img_array = np.array(screenshot)
-        img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        results = self.reader.readtext(img_bgr)
-        target_lower = target_text.lower()
-        candidates = []
-
-        def levenshtein(a, b):
-            # 简单Levenshtein距离实现
-            if len(a) < len(b):
-                a, b = b, a
-            if len(b) == 0:
-                return len(a)
-            previous_row = range(len(b) + 1)
-            for i, c1 in enumerate(a):
-                current_row = [i + 1]
-                for j, c2 in enumerate(b):
-                    insertions = previous_row[j + 1] + 1
-                    deletions = current_row[j] + 1
-                    substitutions = previous_row[j] + (c1 != c2)
-                    current_row.append(min(insertions, deletions, substitutions))
-                previous_row = current_row
-            return previous_row[-1]
+        return self.find_text_positions([target_text], screenshot, fuzzy, region)[target_text]
+
+    def find_text_positions(self, target_texts, screenshot=None, fuzzy=True, region=None):
+        """
+        一次识别同时查找多个目标文本，返回每个目标的中心坐标。
+        匹配规则与find_text_position相同，但所有目标共用一次OCR识别。
+        :param target_texts: 目标字符串列表
+        :param screenshot: PIL.Image，可选，未提供则自动截图
+        :param fuzzy: 是否启用模糊匹配
+        :param region: 只在该区域 (left, top, right, bottom) 内查找，坐标仍相对整张截图
+        :return: {目标字符串: (x, y) 或 None}
+        """
+        results = self.readtext(screenshot, region)
 
+        # 识别结果只预处理一次：小写文本和中心坐标
+        entries = []
         for (bbox, text, confidence) in results:
-            text_stripped = text.strip()
-            text_lower = text_stripped.lower()
-            match = False
-            # 精确或包含匹配
-            if target_lower in text_lower or text_lower in target_lower:
-                match = True
-            # 模糊匹配
-            elif fuzzy and levenshtein(target_lower, text_lower) <= 2:
-                match = True
-            if match:
-                x_coords = [point[0] for point in bbox]
-                y_coords = [point[1] for point in bbox]
-                center_x = int(sum(x_coords) / 4)
-                center_y = int(sum(y_coords) / 4)
-                candidates.append((center_x, center_y, confidence))
-        if candidates:
-            # 返回置信度最高的
-            best = max(candidates, key=lambda x: x[2])
-            return (best[0], best[1])
+            x_coords = [point[0] for point in bbox]
+            y_coords = [point[1] for point in bbox]
+            center = (int(sum(x_coords) / 4), int(sum(y_coords) / 4))
+            entries.append((text.strip().lower(), center, confidence))
+
+        positions = {}
+        for target_text in target_texts:
+            target_lower = target_text.lower()
+            best = None
+            for text_lower, center, confidence in entries:
+                # 精确或包含匹配，其次模糊匹配
+                if (target_lower in text_lower or text_lower in target_lower
+                        or (fuzzy and fuzzy_match(target_lower, text_lower))):
+                    # 保留置信度最高的
+                    if best is None or confidence > best[1]:
+                        best = (center, confidence)
+            positions[target_text] = best[0] if best else None
+        return positions
+
+# 全局OCR引擎注册表：按(语言列表, gpu)缓存，首次使用时才加载模型
+_engines = {}
+_engine_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _engine_key(lang_list, gpu):
+    return (tuple(lang_list or ['en']), bool(gpu))
+
+
+def get_ocr(lang_list=None, gpu=False):
+    """
+    获取进程内共享的OCR引擎，不存在时才创建（加载easyocr模型）。
+    同一语言组合只会加载一次；若后台预热正在进行，则等待其完成。
+    :param lang_list: 语言列表，默认['en']
+    :param gpu: 是否使用GPU
+    :return: OcrTool
+    """
+    key = _engine_key(lang_list, gpu)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _registry_lock:
+        lock = _engine_locks.setdefault(key, threading.Lock())
+    with lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = OcrTool(list(key[0]), gpu=gpu)
+            _engines[key] = engine
+    return engine
+
+
+def warmup_ocr(lang_list=None, gpu=False):
+    """
+    在后台线程中预加载OCR引擎，前面的步骤可以与模型加载并行执行。
+    :return: 预热线程；引擎已存在时返回None
+    """
+    if _engine_key(lang_list, gpu) in _engines:
         return None
 
+    def _warmup():
+        try:
+            get_ocr(lang_list, gpu)
+        except Exception as e:
+            print(f"[OCR] 后台预热失败: {e}")
+
+    thread = threading.Thread(target=_warmup, daemon=True)
+    thread.start()
+    return thread
+
+
+def _levenshtein(a, b):
+    # 完整DP的Levenshtein距离，仅用于基准对比
+    if len(a) < len(b):
+        a, b = b, a
+    if len(b) == 0:
+        return len(a)
+    previous_row = range(len(b) + 1)
+    for i, c1 in enumerate(a):
+        current_row = [i + 1]
+        for j, c2 in enumerate(b):
+            insertions = previous_row[j + 1] + 1
+            deletions = current_row[j] + 1
+            substitutions = previous_row[j] + (c1 != c2)
+            current_row.append(min(insertions, deletions, substitutions))
+        previous_row = current_row
+    return previous_row[-1]
+
+
+def benchmark(result_count=300, targets=20, repeat=20, seed=0):
+    """
+    模糊匹配微基准：模拟几百条OCR结果，对比完整DP与有界匹配（含缓存）的耗时。
+    """
+    import random
+    import time
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz 0123456789'
+    texts = [''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 30))) for _ in range(result_count)]
+    queries = [rng.choice(texts)[:rng.randint(3, 12)] for _ in range(targets)]
+
+    def run(matcher):
+        hits = 0
+        for q in queries:
+            for t in texts:
+                hits += matcher(q, t)
+        return hits
+
+    cases = [
+        ('完整DP', lambda q, t: _levenshtein(q, t) <= FUZZY_MAX_DISTANCE),
+        ('有界DP（无缓存）', lambda q, t: bounded_levenshtein(q, t) <= FUZZY_MAX_DISTANCE),
+        ('有界DP + 缓存', fuzzy_match),
+    ]
+    print(f"OCR结果 {result_count} 条 x 目标 {targets} 个，重复{repeat}次")
+    baseline = None
+    for name, matcher in cases:
+        fuzzy_match.cache_clear()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hits = run(matcher)
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        baseline = baseline or elapsed
+        print(f"  {name:<16} {elapsed:8.2f} ms/轮  命中 {hits}  加速 {baseline / elapsed:5.1f}x")
+
+
 # 示例用法
 if __name__ == '__main__':
-    ocr = OcrTool(['en', 'ch_sim'], gpu=False)
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
+        sys.exit(0)
+    ocr = get_ocr(['en', 'ch_sim'], gpu=False)
     pos = ocr.find_text_position('Cui Ji')
     if pos:
         print(f"找到 'Cui Ji' 位置: {pos}")
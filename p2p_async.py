@@ -0,0 +1,378 @@
+"""
+p2p_async.py
+基于asyncio的P2P传输，接口与 P2PNetwork 相同（init/send/receive/stop）。
+- 所有连接由后台线程中的一个事件循环统一复用，不再为每个连接启动一个线程
+- 对端表、发送目标和发送方标记与 P2PNetwork 共用（PeerMesh），广播时各对端的发送在事件循环中并发进行
+- 连接由事件循环中的后台任务建立（与 P2PNetwork 相同的退避策略和发送队列）
+- 同步外观：send/receive 等方法在调用方线程中阻塞等待结果，run_testcase 的网络步骤无需修改
+- 消息分帧与 P2PNetwork 相同（net_framing），两种实现可以互相通信
+"""
+import asyncio
+import socket
+import threading
+import time
+from collections import deque
+
+from net_framing import FrameDecoder, FrameError, RECV_SIZE
+from p2p_network import (ALL_PEERS, CONNECT_TIMEOUT, OUTBOX_SIZE, STOP_FLUSH_TIMEOUT, P2PNetwork, PeerMesh,
+                         backoff_delays, describe_peers, get_local_ip, peer_address)
+
+
+class _LoopThread:
+    """在后台守护线程中运行的事件循环（进程内共享）"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='p2p-asyncio', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """在事件循环中执行协程，阻塞等待结果"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
+
+
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def get_loop_thread():
+    """获取共享的事件循环线程（首次调用时启动）"""
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = _LoopThread()
+        return _loop_thread
+
+
+class AsyncPeerConnection:
+    """连接池中的一项：到对端的 StreamWriter，以及连接建立前的发送队列（锁和事件在事件循环中创建）"""
+
+    def __init__(self, name, host, port):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.address = peer_address(host, port)
+        self.writer = None
+        self.lock = None                    # asyncio.Lock：发送和清空发送队列时持有
+        self.outbox = deque()               # 连接建立前待发送的帧
+        self.connector = None               # 后台连接任务
+        self.wake = None                    # asyncio.Event：提前结束重试等待
+
+    @property
+    def sock(self):
+        return self.writer.get_extra_info('socket') if self.writer is not None else None
+
+    def __repr__(self):
+        return (f"AsyncPeerConnection({self.name!r}, {self.host}:{self.port}, connected={self.writer is not None}, "
+                f"queued={len(self.outbox)})")
+
+    def ensure_primitives(self):
+        # 在事件循环线程中调用
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+            self.wake = asyncio.Event()
+
+
+class AsyncP2PNetwork(PeerMesh):
+    """asyncio实现的P2P对等网络，提供与 P2PNetwork 相同的同步接口"""
+
+    peer_class = AsyncPeerConnection
+    # 每个对端发送队列的上限
+    outbox_size = OUTBOX_SIZE
+
+    def __init__(self, local_port=9998, peer_host=None, peer_port=9998, name=None, peers=None, loop_thread=None):
+        """
+        :param local_port: 本地监听端口
+        :param peer_host: 对端地址（可选，连接时提供）
+        :param peer_port: 对端端口
+        :param name: 本机名称（随消息发送，默认 本机IP:监听端口）
+        :param peers: 多个对端，格式见 p2p_network.normalize_peers
+        :param loop_thread: 运行连接的事件循环线程，默认进程内共享的一个
+        """
+        super().__init__(local_port, peer_host, peer_port, name, peers)
+        self._loop = loop_thread or get_loop_thread()
+        self._server = None
+        self._handlers = set()
+        self._stopped = False
+
+    @property
+    def client_socket(self):
+        """到第一个对端的连接对应的socket（未连接时为None）"""
+        peer = self._default_peer()
+        return peer.sock if peer else None
+
+    def init(self, peer_host=None, peer_port=9998, peers=None):
+        """启动接收服务器，在后台连接所有对端后立即返回"""
+        if peer_host:
+            self.add_peer(f"{peer_host}:{peer_port}", peer_host, peer_port)
+        self.add_peers(peers)
+        self.local_ip = get_local_ip(self.peer_host, self.peer_port)
+        self._start_server()
+        self.connect()
+        print(f"[P2P] 网络已初始化(asyncio) - 本机:{self.name}, 本地:{self.local_port}, "
+              f"对端:{describe_peers(self.peer_table())}（后台连接中）")
+        return True
+
+    def _start_server(self):
+        """启动接收服务器"""
+        try:
+            self._loop.run(self._serve())
+            self.running = True
+            print(f"[P2P] ✓ 接收服务器启动(asyncio)")
+            print(f"[P2P]   本地端口: {self.local_port}")
+            print(f"[P2P]   可连接地址: {self.local_ip}:{self.local_port}")
+            return True
+        except Exception as e:
+            print(f"[P2P] 启动接收服务器失败: {e}")
+            return False
+
+    async def _serve(self):
+        self._server = await asyncio.start_server(self._handle_client, '0.0.0.0', self.local_port,
+                                                  reuse_address=True)
+
+    async def _handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        addr = writer.get_extra_info('peername')
+        print(f"[P2P] 收到连接: {addr}")
+        self._wake_connectors(addr)
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                messages = decoder.feed(data)
+                if messages:
+                    self._tag_sender(messages, addr)
+                    self.mailbox.put_many(messages)
+        except FrameError as e:
+            print(f"[P2P] 协议错误，关闭连接 {addr}: {e}")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    def _peer_seen(self, peer):
+        # 在事件循环线程中调用
+        if peer.writer is None and peer.wake is not None:
+            peer.wake.set()
+
+    def connect(self, wait=None):
+        """
+        在后台连接所有尚未连接的对端（失败后指数退避重试，直到连接成功或网络停止）
+        :param wait: 最多等待连接建立的秒数，None表示不等待
+        :return: 是否所有对端都已连接
+        """
+        async def start():
+            tasks = [self._start_connect(peer) for peer in self.peers.values()]
+            tasks = [task for task in tasks if task is not None]
+            if wait is not None and tasks:
+                await asyncio.wait(tasks, timeout=wait)
+            return all(peer.writer is not None for peer in self.peers.values())
+
+        return self._loop.run(start())
+
+    def wait_connected(self, timeout=None, peers=None):
+        """等待对端（默认全部）连接建立，超时前全部连接成功返回True"""
+        targets = self._targets(peers)
+
+        async def wait():
+            tasks = [peer.connector for peer in targets if peer.writer is None and peer.connector is not None]
+            if tasks:
+                await asyncio.wait(tasks, timeout=timeout)
+            return all(peer.writer is not None for peer in targets)
+
+        return self._loop.run(wait())
+
+    def _start_connect(self, peer):
+        # 在事件循环线程中调用；返回正在进行的连接任务（已连接时为None）
+        peer.ensure_primitives()
+        if peer.writer is not None or self._stopped:
+            return None
+        if peer.connector is None or peer.connector.done():
+            peer.connector = asyncio.ensure_future(self._connect_loop(peer))
+        return peer.connector
+
+    async def _connect_loop(self, peer):
+        """后台连接任务：失败后按指数退避加随机抖动重试，连接成功后先发出队列中的消息"""
+        delays = backoff_delays()
+        attempt = 0
+        last_logged = None
+        while not self._stopped and self.peers.get(peer.name) is peer:
+            attempt += 1
+            try:
+                writer = await self._open(peer)
+            except (OSError, asyncio.TimeoutError) as e:
+                delay = next(delays)
+                last_logged = self._log_connect_failure(peer, attempt, repr(e), last_logged)
+                await self._backoff(peer, delay)
+                continue
+            flushed = await self._attach(peer, writer)
+            if flushed is not None:
+                print(f"[P2P] ✓ 已连接到对端 {peer.name} {peer.host}:{peer.port} (第 {attempt} 次尝试)"
+                      + (f"，发出排队消息 {flushed} 条" if flushed else ""))
+                return
+            await self._backoff(peer, next(delays))
+
+    async def _backoff(self, peer, delay):
+        try:
+            await asyncio.wait_for(peer.wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        peer.wake.clear()
+
+    async def _open(self, peer):
+        _, writer = await asyncio.wait_for(asyncio.open_connection(peer.host, peer.port), CONNECT_TIMEOUT)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return writer
+
+    async def _attach(self, peer, writer, timeout=CONNECT_TIMEOUT):
+        # 按顺序发出发送队列中的消息，然后把连接放入连接池；失败返回None
+        async with peer.lock:
+            flushed = len(peer.outbox)
+            try:
+                for frame in peer.outbox:
+                    writer.write(frame)
+                await asyncio.wait_for(writer.drain(), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"[P2P] 向 {peer.name} 发送排队消息失败，重新连接: {e!r}")
+                writer.close()
+                return None
+            peer.outbox.clear()
+            if self._stopped:
+                writer.close()
+                return None
+            peer.writer = writer
+            return flushed
+
+    async def _send_frame(self, peer, frame, timeout):
+        # 通过连接池中的连接向一个对端发送；未连接或连接断开时放入发送队列并在后台（重新）连接
+        peer.ensure_primitives()
+        async with peer.lock:
+            if peer.writer is not None:
+                try:
+                    peer.writer.write(frame)
+                    # 不等待连接时也不让写缓冲区无限期阻塞
+                    await asyncio.wait_for(peer.writer.drain(), timeout or CONNECT_TIMEOUT)
+                    return True
+                except (OSError, asyncio.TimeoutError) as e:
+                    # 连接已断开：这条消息改为排队，后台重新连接后发出
+                    print(f"[P2P] 发送到 {peer.name} 出错，后台重新连接: {e!r}")
+                    peer.writer.close()
+                    peer.writer = None
+            if len(peer.outbox) >= self.outbox_size:
+                print(f"[P2P] 发送失败: 对端 {peer.name} 仍未连接，发送队列已满（{self.outbox_size} 条）")
+                return False
+            peer.outbox.append(frame)
+            queued = len(peer.outbox)
+        self._start_connect(peer)
+        print(f"[P2P] 对端 {peer.name} 尚未连接，消息已加入发送队列（待发送 {queued} 条）")
+        return True
+
+    def send(self, event, data=None, timeout=None, to=None):
+        """
+        发送消息
+        :param timeout: 对端尚未连接时最多等待消息发出的秒数；None表示不等待，消息留在发送队列中
+        :param to: 接收的对端：None/'*' 全部对端（广播），对端名称，或名称列表
+        :return: 全部目标对端都已发出返回True；timeout为None时已加入发送队列也返回True。
+                 发送队列已满或等待超时返回False
+        """
+        event_name, frame = self._encode(event, data)
+        targets = self._targets(to)
+        if not targets:
+            print(f"[P2P] 发送失败: 没有配置对端")
+            return False
+
+        async def fanout():
+            return await asyncio.gather(*(self._send_frame(peer, frame, timeout) for peer in targets))
+
+        results = self._loop.run(fanout())
+        return self._finish_send(event_name, data, targets, results, timeout)
+
+    def broadcast(self, event, data=None, timeout=None):
+        """向全部对端发送消息"""
+        return self.send(event, data, timeout, to=ALL_PEERS)
+
+    def _drop_peer(self, peer):
+        # 在事件循环线程中调用
+        if peer.connector is not None:
+            peer.connector.cancel()
+        if peer.writer is not None:
+            peer.writer.close()
+            peer.writer = None
+        if peer.outbox:
+            print(f"[P2P] 对端 {peer.name} 始终未连接，{len(peer.outbox)} 条排队消息未发出")
+            peer.outbox.clear()
+
+    def _close_peer(self, peer):
+        self._loop.loop.call_soon_threadsafe(self._drop_peer, peer)
+
+    async def _close(self):
+        for peer in self.peers.values():
+            self._drop_peer(peer)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._handlers):
+            task.cancel()
+
+    def stop(self, flush_timeout=STOP_FLUSH_TIMEOUT):
+        """
+        停止网络连接
+        :param flush_timeout: 还有排队消息的对端，最多等待其连接建立、消息发出的秒数
+        """
+        pending = [peer.name for peer in self.peers.values() if peer.outbox]
+        if pending and flush_timeout:
+            print(f"[P2P] 等待排队消息发出: {pending}（最多 {flush_timeout} 秒）")
+            self.wait_connected(flush_timeout, pending)
+        self.running = False
+        self._stopped = True
+        try:
+            self._loop.run(self._close(), timeout=5)
+        except Exception as e:
+            print(f"[P2P] 关闭连接出错: {e!r}")
+        print("[P2P] 网络已停止")
+
+
+def benchmark(port=29970, peers=200):
+    """
+    多连接测试：peers 个发送方同时连接一个接收方并各发一条消息，
+    对比线程实现与asyncio实现的接收耗时和线程数。
+    """
+    import contextlib
+    import io
+    print(f"{peers} 个发送方连接同一个接收方")
+    for name, cls in (('thread', P2PNetwork), ('asyncio', AsyncP2PNetwork)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            receiver = cls(local_port=port)
+            receiver._start_server()
+            senders = [AsyncP2PNetwork(local_port=0, peer_host='127.0.0.1', peer_port=port) for _ in range(peers)]
+            start = time.perf_counter()
+            for i, sender in enumerate(senders):
+                sender.send('ready', {'i': i})
+            while len(receiver.mailbox) < peers and time.perf_counter() - start < 30:
+                time.sleep(0.001)
+            elapsed = time.perf_counter() - start
+            threads = threading.active_count()
+            received = len(receiver.mailbox)
+            for sender in senders:
+                sender.stop()
+            receiver.stop()
+        print(f"  接收方 {name:<8} 收到 {received}/{peers}，{elapsed * 1000:8.1f} ms，进程线程数 {threads}")
+        port += 1
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
@@ -1,18 +1,347 @@
 """
 p2p_network.py
-P2P对等网络通信 - 两方都能发送和接收消息
+P2P对等网络通信 - 各方都能发送和接收消息
+可配置多个命名的对端：连接池保持到每个对端的持久连接，消息可发给一个对端、一组对端或广播给全部对端，
+收到的消息带有发送方名称（'sender'）
+消息按 net_framing 的长度前缀格式收发，大消息和TCP合并的连续消息都能完整还原
+连接在后台建立（指数退避 + 随机抖动重试），init/send 不会阻塞等待对端上线；
+连接建立前发送的消息进入每个对端有上限的发送队列，连接成功后按顺序发出
 """
+import os
 import socket
 import json
+import random
 import threading
 import time
+from collections import deque
 from network_event import NetworkEvent, EVENTS
+from net_framing import FrameReader, FrameError, encode_frame
+from event_mailbox import EventMailbox
 
+# 日志中消息内容的最大显示长度
+LOG_PREVIEW = 200
 
-class P2PNetwork:
-    """P2P对等网络 - 同时支持接收和发送"""
+
+def log_preview(value):
+    """日志中显示的消息内容（过长时截断）"""
+    text = str(value)
+    return text if len(text) <= LOG_PREVIEW else text[:LOG_PREVIEW] + f"...（共{len(text)}字符）"
+
+
+def get_local_ip(peer_host=None, peer_port=None):
+    """获取本机可用的IP地址（有对端时取连接对端所用的地址）"""
+    try:
+        # 尝试连接到对端，从而获取本机对外的IP
+        if peer_host:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect((peer_host, peer_port or 9999))
+            ip = s.getsockname()[0]
+            s.close()
+            return ip
+    except:
+        pass
     
-    def __init__(self, local_port=9998, peer_host=None, peer_port=9998):
+    # 备选方案：获取第一个非环回地址
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except:
+        return "127.0.0.1"
+
+
+# 发送目标：全部对端
+ALL_PEERS = '*'
+
+# 单次连接尝试的超时（秒）
+CONNECT_TIMEOUT = 10
+# 连接失败后的重试间隔：从 BACKOFF_INITIAL 开始按 BACKOFF_FACTOR 倍增长，不超过 BACKOFF_MAX
+BACKOFF_INITIAL = 0.1
+BACKOFF_FACTOR = 2
+BACKOFF_MAX = 2.0
+# 每个对端在连接建立前最多缓存的消息数，超过时发送失败
+OUTBOX_SIZE = 1000
+# stop 时等待排队消息发出的最长时间（秒）
+STOP_FLUSH_TIMEOUT = 5.0
+# 对端持续连接失败时，相同错误最多每隔这么多秒打印一次
+CONNECT_LOG_INTERVAL = 30.0
+
+
+def backoff_delays(initial=BACKOFF_INITIAL, factor=BACKOFF_FACTOR, maximum=BACKOFF_MAX, rng=random):
+    """
+    重试间隔序列（无限）：指数增长，每次取 [间隔/2, 间隔] 内的随机值，
+    避免多台PC同时启动时按相同节奏反复撞到对端。
+    """
+    delay = initial
+    while True:
+        yield delay / 2 + rng.uniform(0, delay / 2)
+        delay = min(delay * factor, maximum)
+
+
+def _parse_peer_entry(entry):
+    # 'name=host:port' 或 'host:port'（以 host:port 为名称）
+    name, _, address = entry.strip().rpartition('=')
+    host, port = address.rsplit(':', 1)
+    return (name or address), host, int(port)
+
+
+def normalize_peers(peers):
+    """
+    把对端列表规范化为 {名称: (host, port)}，保持顺序。
+    :param peers: {名称: (host, port)}、[(名称, host, port)]、[(host, port)]，
+                  或 'alice=192.168.1.101:9998,bob=192.168.1.102:9998'（未命名的对端以 host:port 为名称）
+    """
+    if not peers:
+        return {}
+    if isinstance(peers, dict):
+        return {name: (host, int(port)) for name, (host, port) in peers.items()}
+    if isinstance(peers, str):
+        peers = [entry for entry in peers.split(',') if entry.strip()]
+    result = {}
+    for entry in peers:
+        if isinstance(entry, str):
+            name, host, port = _parse_peer_entry(entry)
+        elif len(entry) == 2:
+            host, port = entry
+            name = f"{host}:{port}"
+        else:
+            name, host, port = entry
+        result[name] = (host, int(port))
+    return result
+
+
+def describe_peers(peers):
+    """日志用的对端列表：'B=192.168.1.102:9998, 192.168.1.103:9998'（未命名的只显示地址）"""
+    parts = []
+    for name, (host, port) in normalize_peers(peers).items():
+        address = f"{host}:{port}"
+        parts.append(address if name == address else f"{name}={address}")
+    return ', '.join(parts)
+
+
+def peer_address(host, port):
+    """对端的 (IP, 监听端口)，主机名解析为IP，用于识别收到的消息来自哪个对端"""
+    try:
+        return socket.gethostbyname(host), port
+    except (OSError, UnicodeError):
+        return host, port
+
+
+class PeerConnection:
+    """连接池中到一个对端的持久连接"""
+
+    def __init__(self, name, host, port):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.address = peer_address(host, port)
+        self.sock = None
+        self.lock = threading.Lock()        # 发送和清空发送队列时持有，保证帧不交错、顺序不乱
+        self.outbox = deque()               # 连接建立前待发送的帧
+        self.connected = threading.Event()
+        self.connector = None               # 后台连接线程
+        self.wake = threading.Event()       # 提前结束重试等待（对端已连上本机、网络停止）
+
+    def __repr__(self):
+        return (f"PeerConnection({self.name!r}, {self.host}:{self.port}, connected={self.sock is not None}, "
+                f"queued={len(self.outbox)})")
+
+
+class PeerMesh:
+    """
+    多对端网络的公共部分：命名的对端表、发送目标解析、收到消息的发送方标记、按事件/发送方接收。
+    每条消息带上本机名称和监听端口，接收方据此把消息标记为自己配置中的对端名称。
+    """
+
+    peer_class = PeerConnection
+
+    def __init__(self, local_port=9998, peer_host=None, peer_port=9998, name=None, peers=None):
+        """
+        :param local_port: 本地监听端口
+        :param peer_host: 单个对端地址（兼容旧接口，等同于只有一个对端）
+        :param peer_port: 单个对端端口
+        :param name: 本机名称，随消息发送；默认 本机IP:监听端口
+        :param peers: 对端列表，格式见 normalize_peers
+        """
+        self.local_port = local_port
+        self.peers = {}                     # 名称 -> PeerConnection，按配置顺序
+        self._addresses = {}                # (IP, 监听端口) -> 名称
+        self.running = False
+        self.mailbox = EventMailbox()       # 接收到的消息，按事件分队列
+        if peer_host:
+            self.add_peer(f"{peer_host}:{peer_port}", peer_host, peer_port)
+        self.add_peers(peers)
+        # 获取本机IP地址
+        self.local_ip = get_local_ip(self.peer_host, self.peer_port)
+        self.name = name or f"{self.local_ip}:{self.local_port}"
+
+    @property
+    def peer_host(self):
+        """第一个对端的地址（单对端时即对端地址）"""
+        peer = self._default_peer()
+        return peer.host if peer else None
+
+    @property
+    def peer_port(self):
+        peer = self._default_peer()
+        return peer.port if peer else None
+
+    @property
+    def message_queue(self):
+        """按到达顺序排列的待接收消息（只读快照）"""
+        return self.mailbox.snapshot()
+
+    def peer_table(self):
+        """{名称: (host, port)}"""
+        return {name: (peer.host, peer.port) for name, peer in self.peers.items()}
+
+    def _default_peer(self):
+        return next(iter(self.peers.values()), None)
+
+    def add_peer(self, name, host, port):
+        """添加（或替换）一个命名的对端，连接在首次发送或 init 时建立"""
+        old = self.peers.get(name)
+        if old is not None:
+            if (old.host, old.port) == (host, port):
+                return old
+            self._close_peer(old)
+            self._addresses.pop(old.address, None)
+        peer = self.peer_class(name, host, port)
+        self.peers[name] = peer
+        self._addresses[peer.address] = name
+        return peer
+
+    def add_peers(self, peers):
+        for name, (host, port) in normalize_peers(peers).items():
+            self.add_peer(name, host, port)
+
+    def _close_peer(self, peer):
+        raise NotImplementedError
+
+    def _targets(self, to=None):
+        """
+        :param to: None 或 '*' 表示全部对端；对端名称；名称列表（一组对端）
+        :raises ValueError: 未知的对端名称
+        """
+        if to is None or to == ALL_PEERS:
+            return list(self.peers.values())
+        names = [to] if isinstance(to, str) else list(to)
+        unknown = [n for n in names if n not in self.peers]
+        if unknown:
+            raise ValueError(f"未知的对端: {unknown}，已配置: {list(self.peers)}")
+        return [self.peers[n] for n in names]
+
+    def _encode(self, event, data):
+        """:return: (事件名, 帧)"""
+        event_name = event.value if isinstance(event, NetworkEvent) else str(event)
+        message = {
+            'event': event_name,
+            'data': data or {},
+            'timestamp': time.time(),
+            'sender': self.name,
+            'sender_port': self.local_port,
+        }
+        return event_name, encode_frame(message)
+
+    def _tag_sender(self, messages, addr):
+        """把收到的消息的 sender 换成本机配置中的对端名称（按来源IP和对端监听端口匹配）"""
+        for message in messages:
+            if not isinstance(message, dict):
+                continue
+            name = self._addresses.get((addr[0], message.get('sender_port')))
+            if name is None and 'sender_port' not in message:
+                # 旧版本对端不带发送方信息，按IP匹配唯一的对端
+                names = [n for (ip, _), n in self._addresses.items() if ip == addr[0]]
+                name = names[0] if len(names) == 1 else None
+            message['sender'] = name or message.get('sender') or f"{addr[0]}:{addr[1]}"
+
+    def _wake_connectors(self, addr):
+        """收到来自 addr 的连接：该地址上的对端已经上线，还没连上它的不必等到下一次重试"""
+        for peer in list(self.peers.values()):
+            if peer.address[0] == addr[0]:
+                self._peer_seen(peer)
+
+    def _peer_seen(self, peer):
+        pass
+
+    def _log_connect_failure(self, peer, attempt, error, last):
+        """
+        连接失败日志：只打印第一次失败、错误变化，以及相同错误每 CONNECT_LOG_INTERVAL 秒一次的提示
+        :param last: 上次打印的 (错误描述, 时间)，首次为None
+        :return: 新的 last
+        """
+        now = time.monotonic()
+        if last is not None and last[0] == error and now - last[1] < CONNECT_LOG_INTERVAL:
+            return last
+        if last is None or last[0] != error:
+            print(f"[P2P] 连接对端 {peer.name} {peer.host}:{peer.port} 失败 (第 {attempt} 次): {error}，后台持续重试")
+        else:
+            print(f"[P2P] 仍在重试连接对端 {peer.name} {peer.host}:{peer.port} (已尝试 {attempt} 次): {error}")
+        return error, now
+
+    def _finish_send(self, event_name, data, targets, results, timeout):
+        """
+        记录发送结果；timeout不为None时，最多等待排队的消息发出
+        :return: 见 send
+        """
+        self._log_sent(event_name, data, targets, results)
+        if not all(results):
+            return False
+        queued = [peer.name for peer in targets if peer.outbox]
+        if queued and timeout is not None and not self.wait_connected(timeout, queued):
+            still = [peer.name for peer in targets if peer.outbox]
+            print(f"[P2P] 发送超时: 对端 {still} 在 {timeout} 秒内未连接，消息仍在发送队列中")
+            return False
+        return True
+
+    def _log_sent(self, event_name, data, targets, results):
+        failed = [peer.name for peer, ok in zip(targets, results) if not ok]
+        if len(targets) == 1:
+            if not failed:
+                print(f"[P2P] 发送消息: {event_name} -> {targets[0].name}, 数据: {log_preview(data)}")
+            return
+        sent = [peer.name for peer, ok in zip(targets, results) if ok]
+        print(f"[P2P] 广播消息: {event_name} -> {sent}, 数据: {log_preview(data)}")
+        if failed:
+            print(f"[P2P] 广播失败的对端: {failed}")
+
+    def receive(self, event=None, timeout=30, sender=None):
+        """
+        接收消息（阻塞等待）
+        
+        Args:
+            event: 等待的事件名称（None表示接收任何事件）
+            timeout: 等待超时时间（秒）
+            sender: 只接收该对端发来的消息（None表示任意对端）
+        
+        Returns:
+            收到的消息字典（'sender' 为发送方名称），超时返回None
+        """
+        if isinstance(event, NetworkEvent):
+            target_event = event.value
+        else:
+            target_event = str(event) if event else None
+        
+        # 消息到达时立即被唤醒，无需轮询
+        msg = self.mailbox.get(target_event, timeout, sender)
+        if msg is not None:
+            print(f"[P2P] 接收消息: {msg.get('event')}, 来自: {msg.get('sender')}, 数据: {log_preview(msg.get('data'))}")
+            return msg
+        
+        source = f", 对端: {sender}" if sender else ""
+        print(f"[P2P] 接收消息超时 (事件: {target_event}{source}, 超时: {timeout}秒)")
+        return None
+
+
+class P2PNetwork(PeerMesh):
+    """P2P对等网络 - 同时支持接收和发送，可连接多个命名的对端"""
+    
+    # 每个对端发送队列的上限
+    outbox_size = OUTBOX_SIZE
+    
+    def __init__(self, local_port=9998, peer_host=None, peer_port=9998, name=None, peers=None):
         """
         初始化P2P网络
         
@@ -20,65 +349,48 @@ class P2PNetwork:
             local_port: 本地监听端口
             peer_host: 对端地址（可选，连接时提供）
             peer_port: 对端端口
+            name: 本机名称（随消息发送，默认 本机IP:监听端口）
+            peers: 多个对端，{名称: (host, port)} 或 'alice=host:port,bob=host:port'
         """
-        self.local_port = local_port
-        self.peer_host = peer_host
-        self.peer_port = peer_port
-        
+        super().__init__(local_port, peer_host, peer_port, name, peers)
         self.server_socket = None       # 接收方socket
-        self.client_socket = None       # 发送方socket
-        self.running = False
         self.receive_thread = None
-        self.message_queue = []         # 接收到的消息队列
-        self.message_lock = threading.Lock()
-        
-        # 获取本机IP地址
-        self.local_ip = self._get_local_ip()
+        self._stopped = threading.Event()
+        self._connect_lock = threading.Lock()
 
-    def init(self, peer_host, peer_port):
+    @property
+    def client_socket(self):
+        """到第一个对端的连接（单对端时即发送方socket）"""
+        peer = self._default_peer()
+        return peer.sock if peer else None
+
+    def init(self, peer_host=None, peer_port=9998, peers=None):
         """
-        初始化网络连接
+        初始化网络连接：启动接收服务器，在后台连接对端后立即返回
         
         Args:
             peer_host: 对端地址
             peer_port: 对端端口
+            peers: 多个对端（格式见 normalize_peers）
         """
-        self.peer_host = peer_host
-        self.peer_port = peer_port
+        if peer_host:
+            self.add_peer(f"{peer_host}:{peer_port}", peer_host, peer_port)
+        self.add_peers(peers)
         # 重新获取本机IP（因为现在知道了对端信息）
-        self.local_ip = self._get_local_ip()
+        self.local_ip = get_local_ip(self.peer_host, self.peer_port)
         
         # 启动接收服务器
         self._start_server()
         
-        # 尝试连接到对端
-        self._connect_to_peer()
+        # 后台连接所有对端，用例的后续步骤与对端上线同时进行
+        self.connect()
         
-        print(f"[P2P] 网络已初始化 - 本地:{self.local_port}, 对端:{peer_host}:{peer_port}")
+        print(f"[P2P] 网络已初始化 - 本机:{self.name}, 本地:{self.local_port}, 对端:{describe_peers(self.peer_table())}（后台连接中）")
         return True
 
     def _get_local_ip(self):
         """获取本机可用的IP地址"""
-        try:
-            # 尝试连接到对端，从而获取本机对外的IP
-            if self.peer_host:
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                s.connect((self.peer_host, self.peer_port or 9999))
-                ip = s.getsockname()[0]
-                s.close()
-                return ip
-        except:
-            pass
-        
-        # 备选方案：获取第一个非环回地址
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "127.0.0.1"
+        return get_local_ip(self.peer_host, self.peer_port)
 
     def _start_server(self):
         """启动接收服务器"""
@@ -107,6 +419,7 @@ class P2PNetwork:
                 try:
                     client_socket, addr = self.server_socket.accept()
                     print(f"[P2P] 收到连接: {addr}")
+                    self._wake_connectors(addr)
                     
                     # 在新线程处理连接
                     thread = threading.Thread(
@@ -126,157 +439,226 @@ class P2PNetwork:
 
     def _handle_client(self, client_socket, addr):
         """处理客户端连接"""
+        reader = FrameReader(client_socket)
         try:
             while self.running:
-                data = client_socket.recv(4096)
-                if not data:
+                messages = reader.read()
+                if messages is None:
                     break
+                if not messages:
+                    continue
                 
-                try:
-                    message = json.loads(data.decode('utf-8'))
-                    
-                    # 将消息加入队列
-                    with self.message_lock:
-                        self.message_queue.append(message)
-                    
-                    print(f"[P2P] 收到消息: {message}")
-                except json.JSONDecodeError:
-                    print(f"[P2P] 无效的JSON: {data}")
+                # 一次读取可能包含多条消息，标记发送方后批量放入邮箱并唤醒等待的接收方
+                self._tag_sender(messages, addr)
+                self.mailbox.put_many(messages)
+                
+                for message in messages:
+                    print(f"[P2P] 收到消息: {log_preview(message)}")
+        except FrameError as e:
+            print(f"[P2P] 协议错误，关闭连接 {addr}: {e}")
         except Exception as e:
             print(f"[P2P] 客户端处理错误: {e}")
         finally:
             client_socket.close()
 
-    def _connect_to_peer(self):
-        """连接到对端（带重试机制）"""
-        if not self.peer_host:
-            print(f"[P2P] 跳过连接: peer_host为空")
-            return False
+    def connect(self, wait=None):
+        """
+        在后台连接所有尚未连接的对端（失败后指数退避重试，直到连接成功或网络停止）
         
-        max_retries = 5
-        retry_delay = 1
+        Args:
+            wait: 最多等待连接建立的秒数，None表示不等待
         
-        for attempt in range(max_retries):
-            try:
-                print(f"[P2P] 尝试连接到对端 {self.peer_host}:{self.peer_port} (第 {attempt+1}/{max_retries} 次)...")
-                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.client_socket.settimeout(10)  # 设置10秒连接超时
-                self.client_socket.connect((self.peer_host, self.peer_port))
-                self.client_socket.settimeout(None)  # 连接成功后移除超时
-                print(f"[P2P] ✓ 已连接到对端 {self.peer_host}:{self.peer_port}")
-                return True
-            except socket.timeout:
-                print(f"[P2P] 连接超时 (WinError 10060)，{retry_delay}秒后重试...")
-                self.client_socket = None
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                else:
-                    print(f"[P2P] ✗ 连接失败: 达到最大重试次数")
-                    return False
-            except Exception as e:
-                print(f"[P2P] 连接失败: {e}")
-                self.client_socket = None
-                if attempt < max_retries - 1:
-                    print(f"[P2P] {retry_delay}秒后重试...")
-                    time.sleep(retry_delay)
-                else:
-                    return False
+        Returns:
+            是否所有对端都已连接
+        """
+        for peer in self.peers.values():
+            self._start_connect(peer)
+        if wait is not None:
+            return self.wait_connected(wait)
+        return all(peer.connected.is_set() for peer in self.peers.values())
 
-    def send(self, event, data=None, timeout=5):
+    def wait_connected(self, timeout=None, peers=None):
         """
-        发送消息
+        等待对端连接建立
         
         Args:
-            event: 事件名称或NetworkEvent枚举
-            data: 事件数据
-            timeout: 发送超时时间（秒）
+            timeout: 最长等待秒数，None表示一直等待
+            peers: 对端名称或名称列表，默认全部对端
         
         Returns:
-            成功返回True，失败返回False
+            超时前全部连接成功返回True
         """
-        if isinstance(event, NetworkEvent):
-            event_name = event.value
-        else:
-            event_name = str(event)
-        
-        message = {
-            'event': event_name,
-            'data': data or {},
-            'timestamp': time.time()
-        }
-        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for peer in self._targets(peers):
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not peer.connected.wait(remaining):
+                return False
+        return True
+
+    def _peer_seen(self, peer):
+        if not peer.connected.is_set():
+            peer.wake.set()
+
+    def _start_connect(self, peer):
+        with self._connect_lock:
+            if peer.connected.is_set() or self._stopped.is_set():
+                return
+            if peer.connector is not None and peer.connector.is_alive():
+                return
+            peer.connector = threading.Thread(target=self._connect_loop, args=(peer,),
+                                              name=f"p2p-connect-{peer.name}", daemon=True)
+            peer.connector.start()
+
+    def _connect_loop(self, peer):
+        """后台连接线程：失败后按指数退避加随机抖动重试，连接成功后先发出队列中的消息"""
+        delays = backoff_delays()
+        attempt = 0
+        last_logged = None
+        while not self._stopped.is_set() and self.peers.get(peer.name) is peer:
+            attempt += 1
+            try:
+                sock = self._open(peer)
+            except OSError as e:
+                delay = next(delays)
+                last_logged = self._log_connect_failure(peer, attempt, str(e), last_logged)
+                peer.wake.wait(delay)
+                peer.wake.clear()
+                continue
+            flushed = self._attach(peer, sock)
+            if flushed is not None:
+                print(f"[P2P] ✓ 已连接到对端 {peer.name} {peer.host}:{peer.port} (第 {attempt} 次尝试)"
+                      + (f"，发出排队消息 {flushed} 条" if flushed else ""))
+                return
+            peer.wake.wait(next(delays))
+            peer.wake.clear()
+
+    def _open(self, peer):
+        """建立一次连接，失败抛出OSError"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            # 如果还没有连接，尝试连接
-            if not self.client_socket:
-                print(f"[P2P] 发送前检查: client_socket为None，peer_host={self.peer_host}:{self.peer_port}")
-                if not self._connect_to_peer():
-                    print(f"[P2P] 发送失败: 无法连接到对端")
-                    return False
-            
-            if self.client_socket:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect((peer.host, peer.port))
+            sock.settimeout(None)  # 连接成功后移除超时
+            # 事件消息很小，关闭Nagle算法减少延迟
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        except OSError:
+            sock.close()
+            raise
+
+    def _attach(self, peer, sock):
+        """
+        按顺序发出发送队列中的消息，然后把连接放入连接池。
+        持有发送锁期间新的 send 会等待，保证消息顺序；发送失败返回None
+        """
+        with peer.lock:
+            flushed = 0
+            try:
+                while peer.outbox:
+                    sock.sendall(peer.outbox[0])
+                    peer.outbox.popleft()
+                    flushed += 1
+            except OSError as e:
+                print(f"[P2P] 向 {peer.name} 发送排队消息失败，重新连接: {e}")
+                sock.close()
+                return None
+            if self._stopped.is_set():
+                sock.close()
+                return None
+            with self._connect_lock:
+                # 本线程即将退出，之后连接再断开时需要启动新的连接线程
+                peer.connector = None
+            peer.sock = sock
+            peer.connected.set()
+            return flushed
+
+    def _drop(self, peer):
+        # 调用方持有 peer.lock
+        if peer.sock:
+            try:
+                peer.sock.close()
+            except:
+                pass
+            peer.sock = None
+        peer.connected.clear()
+
+    def _send_frame(self, peer, frame):
+        """
+        通过连接池中的连接向一个对端发送；未连接或连接断开时放入发送队列并在后台（重新）连接。
+        返回False表示发送队列已满
+        """
+        with peer.lock:
+            if peer.sock is not None:
                 try:
-                    self.client_socket.sendall(json.dumps(message).encode('utf-8'))
-                    print(f"[P2P] 发送消息: {event_name}, 数据: {data}")
+                    peer.sock.sendall(frame)
                     return True
-                except Exception as e:
-                    # 连接可能已断开，清除socket重试
-                    print(f"[P2P] 发送出错，尝试重新连接: {e}")
-                    self.client_socket = None
-                    if self._connect_to_peer():
-                        self.client_socket.sendall(json.dumps(message).encode('utf-8'))
-                        print(f"[P2P] 重连后发送成功: {event_name}")
-                        return True
-                    return False
-            else:
-                print(f"[P2P] 发送失败: 未连接到对端")
+                except OSError as e:
+                    # 连接已断开：这条消息改为排队，后台重新连接后发出
+                    print(f"[P2P] 发送到 {peer.name} 出错，后台重新连接: {e}")
+                    self._drop(peer)
+            if len(peer.outbox) >= self.outbox_size:
+                print(f"[P2P] 发送失败: 对端 {peer.name} 仍未连接，发送队列已满（{self.outbox_size} 条）")
                 return False
-        except Exception as e:
-            print(f"[P2P] 发送错误: {e}")
-            return False
+            peer.outbox.append(frame)
+            queued = len(peer.outbox)
+        self._start_connect(peer)
+        print(f"[P2P] 对端 {peer.name} 尚未连接，消息已加入发送队列（待发送 {queued} 条）")
+        return True
 
-    def receive(self, event=None, timeout=30):
+    def send(self, event, data=None, timeout=None, to=None):
         """
-        接收消息（阻塞等待）
+        发送消息
         
         Args:
-            event: 等待的事件名称（None表示接收任何事件）
-            timeout: 等待超时时间（秒）
+            event: 事件名称或NetworkEvent枚举
+            data: 事件数据
+            timeout: 对端尚未连接时最多等待消息发出的秒数；None表示不等待，消息留在发送队列中由后台连接后发出
+            to: 接收的对端：None/'*' 全部对端（广播），对端名称，或名称列表
         
         Returns:
-            收到的消息字典，超时返回None
+            全部目标对端都已发出返回True；timeout为None时已加入发送队列也返回True。
+            发送队列已满或等待超时返回False
         """
-        if isinstance(event, NetworkEvent):
-            target_event = event.value
-        else:
-            target_event = str(event) if event else None
+        event_name, frame = self._encode(event, data)
+        targets = self._targets(to)
+        if not targets:
+            print(f"[P2P] 发送失败: 没有配置对端")
+            return False
         
-        start_time = time.time()
+        # 帧只编码一次；未连接的对端只是排队，不会阻塞其他对端
+        results = [self._send_frame(peer, frame) for peer in targets]
+        return self._finish_send(event_name, data, targets, results, timeout)
+
+    def broadcast(self, event, data=None, timeout=None):
+        """向全部对端发送消息"""
+        return self.send(event, data, timeout, to=ALL_PEERS)
+
+    def _close_peer(self, peer):
+        peer.wake.set()
+        with peer.lock:
+            self._drop(peer)
+            pending = len(peer.outbox)
+            peer.outbox.clear()
+        if pending:
+            print(f"[P2P] 对端 {peer.name} 始终未连接，{pending} 条排队消息未发出")
+
+    def stop(self, flush_timeout=STOP_FLUSH_TIMEOUT):
+        """
+        停止网络连接
         
-        while time.time() - start_time < timeout:
-            with self.message_lock:
-                # 查找匹配的消息
-                for i, msg in enumerate(self.message_queue):
-                    if target_event is None or msg.get('event') == target_event:
-                        # 找到匹配的消息，移除并返回
-                        self.message_queue.pop(i)
-                        print(f"[P2P] 接收消息: {msg.get('event')}, 数据: {msg.get('data')}")
-                        return msg
-            
-            time.sleep(0.1)  # 短暂等待后重试
+        Args:
+            flush_timeout: 还有排队消息的对端，最多等待其连接建立、消息发出的秒数
+        """
+        pending = [peer.name for peer in self.peers.values() if peer.outbox]
+        if pending and flush_timeout:
+            print(f"[P2P] 等待排队消息发出: {pending}（最多 {flush_timeout} 秒）")
+            self.wait_connected(flush_timeout, pending)
         
-        print(f"[P2P] 接收消息超时 (事件: {target_event}, 超时: {timeout}秒)")
-        return None
-
-    def stop(self):
-        """停止网络连接"""
         self.running = False
+        self._stopped.set()
         
-        if self.client_socket:
-            try:
-                self.client_socket.close()
-            except:
-                pass
-            self.client_socket = None
+        for peer in self.peers.values():
+            self._close_peer(peer)
         
         if self.server_socket:
             try:
@@ -291,21 +673,47 @@ class P2PNetwork:
 # 全局网络实例
 _global_network = None
 
+# 传输实现：thread 每个连接一个线程的阻塞socket；asyncio 单个事件循环线程复用所有连接
+TRANSPORTS = ('thread', 'asyncio')
+# 默认传输实现，可用环境变量 AUTOCONTROL_P2P_TRANSPORT 或 set_transport() 修改
+_transport = os.environ.get('AUTOCONTROL_P2P_TRANSPORT', 'thread')
+
+
+def set_transport(transport):
+    """设置之后创建的全局网络使用的传输实现"""
+    global _transport
+    if transport not in TRANSPORTS:
+        raise ValueError(f"未知的传输实现: {transport}，可选 {TRANSPORTS}")
+    _transport = transport
+
+
+def create_network(local_port=9998, peer_host=None, peer_port=9998, transport=None, name=None, peers=None):
+    """按传输实现创建网络实例"""
+    transport = transport or _transport
+    if transport == 'asyncio':
+        from p2p_async import AsyncP2PNetwork
+        return AsyncP2PNetwork(local_port, peer_host, peer_port, name=name, peers=peers)
+    return P2PNetwork(local_port, peer_host, peer_port, name=name, peers=peers)
+
 
 def get_network():
     """获取全局网络实例"""
     global _global_network
     if _global_network is None:
-        _global_network = P2PNetwork()
+        _global_network = create_network()
     return _global_network
 
 
-def init_network(local_port=9998, peer_host=None, peer_port=9998):
-    """初始化全局网络"""
+def init_network(local_port=9998, peer_host=None, peer_port=9998, transport=None, peers=None, name=None):
+    """
+    初始化全局网络
+    :param peers: 多个对端（格式见 normalize_peers），与 peer_host 可同时使用
+    :param name: 本机名称，默认 本机IP:监听端口
+    """
     global _global_network
-    _global_network = P2PNetwork(local_port, peer_host, peer_port)
-    if peer_host:
-        _global_network.init(peer_host, peer_port)
+    _global_network = create_network(local_port, peer_host, peer_port, transport, name=name, peers=peers)
+    if _global_network.peers:
+        _global_network.init()
     else:
         _global_network._start_server()
     return _global_network
@@ -319,6 +727,189 @@ def stop_network():
         _global_network = None
 
 
+def _legacy_receive_count(payloads):
+    # 旧协议：裸JSON + recv(4096)，统计一次突发发送后能正确解析的消息数
+    a, b = socket.socketpair()
+    received = 0
+
+    def reader():
+        nonlocal received
+        while True:
+            data = b.recv(4096)
+            if not data:
+                break
+            try:
+                json.loads(data.decode('utf-8'))
+                received += 1
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                pass
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    for payload in payloads:
+        a.sendall(json.dumps(payload).encode('utf-8'))
+    a.shutdown(socket.SHUT_WR)
+    thread.join()
+    a.close()
+    b.close()
+    return received
+
+
+def _poll_receive(mailbox, event, timeout):
+    # 旧的接收方式：检查一次，没有就sleep 100ms再查
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        msg = mailbox.get_nowait(event)
+        if msg is not None:
+            return msg
+        time.sleep(0.1)
+    return None
+
+
+def latency_benchmark(port=29990, rounds=30):
+    """
+    回环往返延迟测试：A发送ping，B收到后回复pong，A等待pong。
+    对比条件变量邮箱与旧的100ms轮询接收。
+    """
+    import contextlib
+    import io
+    import statistics
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        a = P2PNetwork(local_port=port, peer_host='127.0.0.1', peer_port=port + 1)
+        b = P2PNetwork(local_port=port + 1, peer_host='127.0.0.1', peer_port=port)
+        a._start_server()
+        b._start_server()
+        a.connect(wait=5)
+        b.connect(wait=5)
+    receivers = {
+        '条件变量邮箱': lambda net, event, timeout: net.mailbox.get(event, timeout),
+        '旧的100ms轮询': lambda net, event, timeout: _poll_receive(net.mailbox, event, timeout),
+    }
+    print(f"回环往返延迟（{rounds} 次 ping/pong）")
+    for name, receive in receivers.items():
+        samples = []
+        stop = threading.Event()
+
+        def responder():
+            while not stop.is_set():
+                msg = receive(b, 'ping', 0.2)
+                if msg:
+                    b.send('pong', msg['data'])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            thread = threading.Thread(target=responder, daemon=True)
+            thread.start()
+            for i in range(rounds):
+                start = time.perf_counter()
+                a.send('ping', {'i': i})
+                receive(a, 'pong', 5)
+                samples.append((time.perf_counter() - start) * 1000)
+            stop.set()
+            thread.join()
+        samples.sort()
+        print(f"  {name:<10} 中位数 {statistics.median(samples):8.3f} ms  "
+              f"p95 {samples[int(len(samples) * 0.95) - 1]:8.3f} ms  最大 {samples[-1]:8.3f} ms")
+    with quiet:
+        a.stop()
+        b.stop()
+
+
+def _legacy_connect(host, port, max_retries=5, retry_delay=1):
+    # 旧的连接方式：在调用线程中同步重试，固定间隔
+    for attempt in range(max_retries):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect((host, port))
+            sock.settimeout(None)
+            return sock
+        except OSError:
+            sock.close()
+            if attempt < max_retries - 1:
+                time.sleep(retry_delay)
+    return None
+
+
+def connect_benchmark(port=29960, delays=(0.3, 1.5, 3.5)):
+    """
+    对端晚启动测试：对端在 init 之后 delay 秒才上线。
+    对比旧的同步重试（init 阻塞到连接成功）、后台连接（init 立即返回，消息排队）、
+    以及对端上线后也连回本机（多PC用例的常见情况，收到连接时立即重试）三种情况下
+    init 的阻塞时间和第一条消息的送达时间。
+    """
+    import contextlib
+    import io
+    print("对端晚启动：init 阻塞时间 / 第一条消息送达时间")
+    for delay in delays:
+        row = []
+        for mode in ('legacy', 'background', 'mutual'):
+            with contextlib.redirect_stdout(io.StringIO()):
+                if mode == 'mutual':
+                    receiver = P2PNetwork(local_port=port, peer_host='127.0.0.1', peer_port=port + 1)
+                    timer = threading.Timer(delay, receiver.init)
+                else:
+                    receiver = P2PNetwork(local_port=port)
+                    timer = threading.Timer(delay, receiver._start_server)
+                start = time.perf_counter()
+                timer.start()
+                if mode == 'legacy':
+                    sock = _legacy_connect('127.0.0.1', port)
+                    ready = time.perf_counter() - start
+                    if sock is not None:
+                        sock.sendall(encode_frame({'event': 'ready', 'data': {}}))
+                else:
+                    sender = P2PNetwork(local_port=port + 1, peer_host='127.0.0.1', peer_port=port)
+                    sender.init()
+                    ready = time.perf_counter() - start
+                    sender.send('ready')
+                msg = receiver.mailbox.get('ready', 10)
+                delivered = time.perf_counter() - start
+                timer.join()
+                if mode == 'legacy':
+                    if sock is not None:
+                        sock.close()
+                else:
+                    sender.stop()
+                receiver.stop()
+            row.append(f"{ready * 1000:6.1f} / " + (f"{delivered * 1000:6.0f} ms" if msg else "未送达"))
+            port += 2
+        print(f"  对端 {delay:.1f}s 后上线: 同步重试(旧) {row[0]}  |  后台连接 {row[1]}  |  对端也连回本机 {row[2]}")
+
+
+def benchmark(port=29998, cases=((20000, 100), (2000, 8 * 1024), (200, 256 * 1024))):
+    """
+    本机回环吞吐测试：突发发送大量消息，统计全部到达接收队列的耗时。
+    同时给出旧协议（裸JSON + recv(4096)）在相同突发下能正确解析的消息数。
+    """
+    import contextlib
+    import io
+    for count, size in cases:
+        data = {'payload': 'x' * size}
+        with contextlib.redirect_stdout(io.StringIO()):
+            receiver = P2PNetwork(local_port=port)
+            receiver._start_server()
+            sender = P2PNetwork(local_port=port + 1, peer_host='127.0.0.1', peer_port=port)
+            sender.connect(wait=5)
+            start = time.perf_counter()
+            for i in range(count):
+                sender.send('data', data)
+            deadline = time.time() + 60
+            while len(receiver.mailbox) < count and time.time() < deadline:
+                time.sleep(0.001)
+            elapsed = time.perf_counter() - start
+            received = len(receiver.mailbox)
+            intact = sum(1 for m in receiver.message_queue if len(m['data']['payload']) == size)
+            sender.stop()
+            receiver.stop()
+        legacy = _legacy_receive_count([{'event': 'data', 'data': data}] * count)
+        megabytes = count * size / 1024 / 1024
+        print(f"  {count:6d} 条 x {size:7d} 字节: 收到 {received}/{count}（完整 {intact}），"
+              f"{elapsed * 1000:8.1f} ms，{count / elapsed:9.0f} 条/秒，{megabytes / elapsed:7.1f} MB/s"
+              f"  | 旧协议可解析 {legacy}/{count}")
+        port += 2
+
+
 if __name__ == '__main__':
     # 测试P2P网络
     import sys
@@ -327,11 +918,23 @@ if __name__ == '__main__':
         print("用法: python p2p_network.py <mode> [args...]")
         print("  模式1 (接收方): python p2p_network.py receiver 9998")
         print("  模式2 (发送方): python p2p_network.py sender 192.168.1.100 9998 9999")
+        print("  模式3 (回环吞吐测试): python p2p_network.py bench")
+        print("  模式4 (回环延迟测试): python p2p_network.py latency")
+        print("  模式5 (对端晚启动测试): python p2p_network.py connect")
         sys.exit(1)
     
     mode = sys.argv[1]
     
-    if mode == 'receiver':
+    if mode == 'bench':
+        benchmark()
+    
+    elif mode == 'latency':
+        latency_benchmark()
+    
+    elif mode == 'connect':
+        connect_benchmark()
+    
+    elif mode == 'receiver':
         local_port = int(sys.argv[2]) if len(sys.argv) > 2 else 9998
         network = P2PNetwork(local_port=local_port)
         network._start_server()
@@ -359,6 +962,5 @@ if __name__ == '__main__':
         
         print(f"[TEST] 发送模式: 发送给 {peer_host}:{peer_port}")
         
-        time.sleep(1)
         network.send(NetworkEvent.READY, {'message': 'hello'})
         network.stop()
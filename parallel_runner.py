@@ -0,0 +1,229 @@
+"""
+parallel_runner.py
+并行执行测试用例：按用例占用的资源（屏幕、鼠标、键盘、音频设备、端口等）打标签，
+资源互不冲突的用例分配到多个工作进程同时执行，最后合并为一份结果报告。
+占用同一资源的用例保持原有先后顺序串行执行。
+使用前面用例建立的网络连接或后台录音的用例，与建立该状态的用例分在一组，在同一个工作进程中按顺序执行。
+"""
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# 步骤类型/动作 -> 占用的共享桌面资源
+_DESKTOP_RESOURCES = {
+    'keyboard': {'keyboard'},
+    'mouse': {'mouse'},
+    'window': {'screen'},
+    'icon': {'screen', 'mouse'},
+    'ocr': {'screen', 'mouse'},
+    'check': {'screen', 'keyboard'},
+}
+
+
+def step_resources(step):
+    """
+    单个步骤占用的资源标签。
+    :param step: testcase_plan.Step
+    :return: set，例如 {'screen', 'mouse'}、{'audio_out:25'}、{'port:9998'}
+    """
+    if step.type in _DESKTOP_RESOURCES:
+        return set(_DESKTOP_RESOURCES[step.type])
+    params = step.params
+    if step.type == 'audio':
+        if step.action in ('play', 'play_async'):
+            return {f"audio_out:{params['device']}"}
+        if step.action in ('record', 'record_async'):
+            return {f"audio_in:{params['device']}"}
+        return set()
+    if step.type == 'network' and step.action == 'init':
+        resources = {f"port:{params['local_port']}"}
+        for host, port in (params['peers'] or {}).values():
+            resources.add("peer:%s:%d" % (host, port))
+        return resources
+    return set()
+
+
+# 依赖进程内状态（全局网络连接、后台录音）的步骤：(type, action) -> (状态类别, 是否建立该状态)
+_STATE_STEPS = {
+    ('network', 'init'): ('network', True),
+    ('network', 'send'): ('network', False),
+    ('network', 'receive'): ('network', False),
+    ('network', 'stop'): ('network', False),
+    ('audio', 'record_async'): ('recording', True),
+    ('audio', 'stop_record'): ('recording', False),
+}
+
+
+def state_usage(plan):
+    """
+    用例对进程内状态的使用情况。
+    :return: (needs, touches)：needs 为用例在自己建立之前就使用的状态类别，touches 为用例用到的全部状态类别
+    """
+    needs, created, touches = set(), set(), set()
+    for step in plan.iter_steps():
+        usage = _STATE_STEPS.get((step.type, step.action))
+        if usage is None:
+            continue
+        kind, creates = usage
+        touches.add(kind)
+        if creates:
+            created.add(kind)
+        elif kind not in created:
+            needs.add(kind)
+    return needs, touches
+
+
+def chain_plans(plans):
+    """
+    按进程内状态把用例分组：依赖前面用例的网络连接/后台录音的用例，与最近使用该状态的用例放在同一组。
+    :return: [[用例序号, ...], ...]，组内按原顺序排列，各组按第一个用例的顺序排列
+    """
+    group = list(range(len(plans)))  # 用例序号 -> 同组中的上一级序号（并查集）
+
+    def find(i):
+        while group[i] != i:
+            i = group[i]
+        return i
+
+    last = {}  # 状态类别 -> 最近使用该状态的用例序号
+    for index, plan in enumerate(plans):
+        needs, touches = state_usage(plan)
+        for kind in needs:
+            if kind in last:
+                group[find(index)] = find(last[kind])
+        for kind in touches:
+            last[kind] = index
+    chains = {}
+    for index in range(len(plans)):
+        chains.setdefault(find(index), []).append(index)
+    return list(chains.values())
+
+
+def testcase_resources(plan):
+    """用例占用的全部资源标签"""
+    resources = set()
+    for step in plan.iter_steps():
+        resources |= step_resources(step)
+    return frozenset(resources)
+
+
+def _run_plan_worker(plans, report=False, config=None):
+    # 工作进程入口：按顺序执行一组用例（见 chain_plans）并返回结果列表，异常不向外传播
+    import run_testcase
+    from backends import get_backends
+    from debug_artifacts import get_debug_artifacts
+    from run_report import get_run_report
+    # spawn 启动的子进程不继承主进程的演练后端、步骤节奏等设置，按配置重新设置
+    # （工作进程会被复用，同一进程中重复设置结果相同）
+    if config:
+        run_testcase.apply_run_config(config)
+    run_report = get_run_report()
+    if report:
+        run_report.enable()
+        run_report.testcases = []
+    results = []
+    failed = None
+    try:
+        for plan in plans:
+            result = {'name': plan.name, 'pid': os.getpid(), 'status': 'passed', 'error': None}
+            results.append(result)
+            if failed is not None:
+                # 依赖的前置用例失败，组内后面的用例不再执行
+                result.update(status='skipped', error=f"前置用例 '{failed}' 失败，未执行", duration=None)
+                continue
+            start = time.time()
+            dry_run = get_backends().dry_run
+            if dry_run:
+                before = run_testcase.dry_run_counters(get_backends())
+            try:
+                run_testcase.run_plan(plan)
+            except Exception as e:
+                result['status'] = 'failed'
+                result['error'] = f"{type(e).__name__}: {e}"
+                result['traceback'] = traceback.format_exc()
+                failed = plan.name
+            result['duration'] = time.time() - start
+            if dry_run:
+                # 演练计数随结果返回主进程汇总
+                after = run_testcase.dry_run_counters(get_backends())
+                result['dry_run'] = {key: after[key] - before[key] for key in after}
+            if report and run_report.testcases:
+                # 步骤耗时记录随结果返回主进程合并
+                result['report'] = run_report.testcases[-1]
+                run_report.testcases = []
+    finally:
+        # 等待后台写完调试图片
+        get_debug_artifacts().close()
+    return results
+
+
+def run_parallel(plans, max_workers=None, executor=None, worker=_run_plan_worker, report=False, config=None):
+    """
+    并行执行用例。
+    :param plans: [TestcasePlan, ...]
+    :param max_workers: 工作进程数，默认CPU核数
+    :param executor: 自定义Executor（需支持submit），默认ProcessPoolExecutor
+    :param worker: 按顺序执行一组用例的函数 (plans, report, config) -> [结果字典, ...]
+    :param report: 是否在工作进程中收集步骤耗时
+    :param config: 工作进程的运行配置（见 run_testcase.apply_run_config），如演练模式、步骤节奏
+    :return: 按输入顺序排列的结果列表
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    pending = []
+    for chain in chain_plans(plans):
+        resources = frozenset().union(*(testcase_resources(plans[i]) for i in chain))
+        pending.append((chain, resources))
+    results = [None] * len(plans)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    running = {}
+    held = set()
+    suite_start = time.time()
+    try:
+        while pending or running:
+            # 依次启动资源空闲的用例组；被跳过的组的资源也视为占用，保证冲突用例按原顺序执行
+            blocked = set()
+            for item in list(pending):
+                if len(running) >= max_workers:
+                    break
+                chain, resources = item
+                if resources & held or resources & blocked:
+                    blocked |= resources
+                    continue
+                names = [plans[i].name for i in chain]
+                print(f"[PARALLEL] 启动用例: {', '.join(names)}，资源: {sorted(resources) or '无'}")
+                running[executor.submit(worker, [plans[i] for i in chain], report, config)] = item
+                held |= resources
+                pending.remove(item)
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                chain, resources = running.pop(future)
+                held -= resources
+                try:
+                    chain_results = future.result()
+                except Exception as e:
+                    # 工作进程崩溃等情况
+                    chain_results = [{'name': plans[i].name, 'status': 'failed',
+                                      'error': f"{type(e).__name__}: {e}", 'duration': None} for i in chain]
+                for index, result in zip(chain, chain_results):
+                    results[index] = result
+                    print(f"[PARALLEL] 用例结束: {result['name']} - {result['status']}")
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    print_summary(results, time.time() - suite_start)
+    return results
+
+
+def print_summary(results, elapsed):
+    """打印合并后的结果汇总"""
+    passed = sum(1 for r in results if r['status'] == 'passed')
+    print(f"\n[PARALLEL] 共 {len(results)} 个用例，通过 {passed}，失败 {len(results) - passed}，总耗时 {elapsed:.1f}s")
+    for r in results:
+        duration = f"{r['duration']:.1f}s" if r.get('duration') is not None else '-'
+        line = f"  {'✓' if r['status'] == 'passed' else '✗'} {r['name']}  ({duration})"
+        if r.get('error'):
+            line += f"  {r['error']}"
+        print(line)
@@ -1,10 +1,8 @@
-import xml.etree.ElementTree as ET
 import os
+from testcase_loader import iter_selected
 
-def parse_testcases(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for testcase in root.findall('testcase'):
+def parse_testcases(xml_path, testcase_name=None):
+    for testcase in iter_selected(xml_path, testcase_name):
         print(f"用例: {testcase.get('name')}")
         for step in testcase.findall('step'):
             step_type = step.get('type')
@@ -0,0 +1,197 @@
+"""
+run_report.py
+执行耗时统计与机器可读报告。
+- 每个步骤记录墙钟时间、执行线程的CPU时间，以及其中OCR、模板匹配、截图、等待各自的耗时
+- 报告输出为JSON（整体文档）或JSONL（逐行记录），包含按用例汇总和最慢步骤列表
+- 未启用时 timed()/step() 返回共享的空上下文，几乎没有开销
+"""
+import contextlib
+import json
+import threading
+import time
+
+from backends import get_clock
+
+# 热点分类
+CATEGORIES = ('ocr', 'match', 'capture', 'sleep')
+
+_NULL = contextlib.nullcontext()
+
+
+class _Timed:
+    """累计一段代码的耗时到当前线程正在执行的步骤"""
+
+    __slots__ = ('report', 'category', 'start')
+
+    def __init__(self, report, category):
+        self.report = report
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.add(self.category, time.perf_counter() - self.start)
+        return False
+
+
+class _StepScope:
+    """记录单个步骤的耗时"""
+
+    __slots__ = ('report', 'record', 'wall', 'cpu', 'previous')
+
+    def __init__(self, report, record):
+        self.report = report
+        self.record = record
+
+    def __enter__(self):
+        local = self.report._local
+        self.previous = getattr(local, 'record', None)
+        local.record = self.record
+        self.wall = time.perf_counter()
+        # 线程CPU时间：<parallel> 组内的步骤同时执行，进程CPU时间会把其他步骤也算进来
+        self.cpu = time.thread_time()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        record = self.record
+        record['wall'] = time.perf_counter() - self.wall
+        record['cpu'] = time.thread_time() - self.cpu
+        if exc_type is not None:
+            record['status'] = 'failed'
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        self.report._local.record = self.previous
+        return False
+
+
+class RunReport:
+    """执行报告收集器"""
+
+    def __init__(self):
+        self.enabled = False
+        self.testcases = []
+        self._current = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def timed(self, category):
+        """统计一段代码的耗时，归入当前步骤的指定分类"""
+        if not self.enabled:
+            return _NULL
+        return _Timed(self, category)
+
+    def add(self, category, seconds):
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            with self._lock:
+                record[category] += seconds
+
+    def begin_testcase(self, name):
+        if not self.enabled:
+            return
+        self._current = {'name': name, 'status': 'passed', 'steps': [], 'start': time.time()}
+        with self._lock:
+            self.testcases.append(self._current)
+
+    def end_testcase(self, error=None):
+        if not self.enabled or self._current is None:
+            return
+        testcase = self._current
+        testcase['wall'] = time.time() - testcase.pop('start')
+        if error is not None:
+            testcase['status'] = 'failed'
+            testcase['error'] = f"{type(error).__name__}: {error}"
+        self._current = None
+
+    def step(self, step):
+        """
+        步骤计时上下文。
+        :param step: testcase_plan.Step
+        """
+        if not self.enabled:
+            return _NULL
+        record = {
+            'testcase': self._current['name'] if self._current else None,
+            'index': step.index,
+            'type': step.type,
+            'action': step.action,
+            'content': step.content,
+            'status': 'passed',
+        }
+        for category in CATEGORIES:
+            record[category] = 0.0
+        if self._current is not None:
+            with self._lock:
+                self._current['steps'].append(record)
+        return _StepScope(self, record)
+
+    def merge(self, testcases):
+        """合并其他进程返回的用例记录"""
+        with self._lock:
+            self.testcases.extend(testcases)
+
+    def summary(self, slowest=10):
+        """按用例汇总，并列出最慢的步骤"""
+        rollups = []
+        all_steps = []
+        for testcase in self.testcases:
+            steps = testcase['steps']
+            all_steps.extend(steps)
+            rollup = {
+                'name': testcase['name'],
+                'status': testcase['status'],
+                'wall': testcase.get('wall'),
+                'steps': len(steps),
+                'cpu': sum(s.get('cpu', 0.0) for s in steps),
+            }
+            for category in CATEGORIES:
+                rollup[category] = sum(s[category] for s in steps)
+            if testcase.get('error'):
+                rollup['error'] = testcase['error']
+            rollups.append(rollup)
+        ranked = sorted(all_steps, key=lambda s: -s.get('wall', 0.0))[:slowest]
+        return {'testcases': rollups, 'slowest_steps': ranked}
+
+    def write(self, path):
+        """
+        写出报告：.jsonl 每行一条记录（kind: step/testcase/slowest_step），其他后缀写整体JSON。
+        """
+        summary = self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                for testcase in self.testcases:
+                    for record in testcase['steps']:
+                        f.write(json.dumps(dict(record, kind='step'), ensure_ascii=False) + '\n')
+                for rollup in summary['testcases']:
+                    f.write(json.dumps(dict(rollup, kind='testcase'), ensure_ascii=False) + '\n')
+                for record in summary['slowest_steps']:
+                    f.write(json.dumps(dict(record, kind='slowest_step'), ensure_ascii=False) + '\n')
+            else:
+                json.dump({'testcases': self.testcases, 'summary': summary}, f, ensure_ascii=False, indent=2)
+        print(f"[REPORT] 执行报告已保存: {path}")
+
+
+# 全局报告收集器（默认关闭）
+_report = RunReport()
+
+
+def get_run_report():
+    """获取全局报告收集器"""
+    return _report
+
+
+def timed(category):
+    """统计耗时到全局报告（未启用时为空操作）"""
+    if not _report.enabled:
+        return _NULL
+    return _Timed(_report, category)
+
+
+def sleep(seconds):
+    """按当前后端时钟等待（演练模式下不阻塞），并把等待时间计入当前步骤的sleep分类"""
+    with timed('sleep'):
+        get_clock().sleep(seconds)
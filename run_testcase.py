@@ -1,263 +1,553 @@
-import xml.etree.ElementTree as ET
 import os
 import time
 import threading
 
 
-import pyautogui
 import sys
 import numpy as np
 
 
-# OCR工具实例
-from ocr_tool import OcrTool
-ocr = OcrTool(['en', 'ch_sim'], gpu=False)
+# OCR工具：首次执行ocr/check步骤时才加载模型，避免非OCR用例承担启动开销
+from ocr_tool import get_ocr, warmup_ocr
+OCR_LANGS = ['en', 'ch_sim']
+OCR_STEP_TYPES = ('ocr', 'check')
+# 会产生键盘/鼠标输入的步骤类型
+INPUT_STEP_TYPES = ('keyboard', 'mouse', 'window', 'icon', 'ocr', 'check')
 
-# P2P网络支持
-from p2p_network import get_network, init_network, stop_network
+
+def get_ocr_tool():
+    """获取共享的OCR引擎（懒加载；演练模式下为假OCR）"""
+    return get_backends().ocr or get_ocr(OCR_LANGS, gpu=False)
+
+# 键盘鼠标、音频、P2P网络等外部I/O都通过后端访问，演练模式下替换为假后端
+from backends import get_backends, get_clock, set_backends, dry_run_backends, Backends, DesktopInput
 from network_event import NetworkEvent, EVENTS
+from p2p_network import TRANSPORTS, describe_peers, set_transport
+from debug_artifacts import get_debug_artifacts
+from screen_capture import get_screen_capture
+from testcase_loader import iter_selected
+from run_report import get_run_report, sleep as report_sleep
+from step_pacing import get_step_pacer, set_step_pacer, StepPacer, FIXED_POLICY, IDLE_POLICIES
+from step_groups import get_step_groups
+from checkpoint import CheckpointStore, resume_plan
+from testcase_plan import Step, STEP_HANDLERS, TestcaseCompileError, step_handler, compile_step, compile_testcase
+from PIL import Image
+
+@step_handler('keyboard', 'press_key')
+def _keyboard_press_key(step):
+    get_backends().input.press(step.params['key'])
+
+
+@step_handler('keyboard', 'type_text')
+def _keyboard_type_text(step):
+    params = step.params
+    get_backends().input.type_text(params['text'], interval=params['interval'], strategy=params['mode'])
+
+
+@step_handler('mouse', 'move_mouse')
+def _mouse_move(step):
+    x, y = step.params['point']
+    get_backends().input.move_to(x, y, duration=0.5)
+
+
+@step_handler('mouse', 'click')
+def _mouse_click(step):
+    get_backends().input.click(step.params['button'])
+
+
+@step_handler('audio', 'play')
+def _audio_play(step):
+    content = step.params['file']
+    device_idx = step.params['device']
+    device_arg = device_idx if device_idx >= 0 else None
+    duration_arg = step.params['duration']
+    ok = get_backends().audio.play(content, device_arg, duration_arg)
+    print(f"[AUDIO] 播放音频: {content} {'成功' if ok else '失败'}" + (f" (时长: {duration_arg}s)" if duration_arg else ""))
+
+
+@step_handler('audio', 'play_async')
+def _audio_play_async(step):
+    # 异步播放，不阻塞后续步骤
+    content = step.params['file']
+    device_idx = step.params['device']
+    device_arg = device_idx if device_idx >= 0 else None
+    duration_arg = step.params['duration']
+    # 演练模式下后台线程有自己的虚拟时间，播放时长不累加到用例的时间上
+    thread = threading.Thread(target=get_clock().bind(get_backends().audio.play),
+                              args=(content, device_arg, duration_arg), daemon=True)
+    thread.start()
+    print(f"[AUDIO] 异步播放音频: {content}，设备: {device_idx if device_idx >= 0 else '默认'}" + (f", 时长: {duration_arg}s" if duration_arg else ""))
+
+
+@step_handler('audio', 'record')
+def _audio_record(step):
+    # 同步录音
+    output_file = step.params['file']
+    get_backends().audio.record(step.params['device'], step.params['duration'], output_file)
+    print(f"[AUDIO] 录音完成: {output_file}")
+
+
+@step_handler('audio', 'record_async')
+def _audio_record_async(step):
+    # 异步录音，不阻塞后续步骤
+    device_idx = step.params['device']
+    duration = step.params['duration']
+    output_file = step.params['file']
+    thread = threading.Thread(target=get_clock().bind(get_backends().audio.record),
+                              args=(device_idx, duration, output_file), daemon=True)
+    thread.start()
+    print(f"[AUDIO] 异步录音开始，设备: {device_idx}，时长: {duration}s，输出: {output_file}")
+
+
+@step_handler('audio', 'stop_record')
+def _audio_stop_record(step):
+    # 停止录音
+    get_backends().audio.stop_record()
+
+
+@step_handler('network', 'init')
+def _network_init(step):
+    # network init: 初始化网络连接
+    # content: peer_host:peer_port (例如: 192.168.1.101:9998)
+    #          多个对端: name=host:port,... (例如: bob=192.168.1.102:9998,carol=192.168.1.103:9998)
+    # 属性: local_port (本地监听端口，默认9998), name (本机名称，可选)
+    local_port = step.params['local_port']
+    peers = step.params['peers']
+    try:
+        if peers:
+            print(f"[NETWORK] 初始化网络: 本地端口={local_port}, 对端={describe_peers(peers)}")
+            get_backends().network.init(local_port, peers=peers, name=step.params['name'])
+        else:
+            print(f"[NETWORK] 初始化网络: 本地端口={local_port}（仅启动服务器）")
+            get_backends().network.init(local_port=local_port, name=step.params['name'])
+        print(f"[NETWORK] ✓ 网络初始化成功")
+    except Exception as e:
+        print(f"[NETWORK] ✗ 网络初始化失败: {e}")
+        raise RuntimeError(f"网络初始化失败，停止测试: {e}")
+
+
+@step_handler('network', 'send')
+def _network_send(step):
+    # network send: 发送消息
+    # content: 事件名称 (例如: call_start)
+    # 属性: data (消息数据，JSON格式，可选), to (接收的对端名称，逗号分隔，缺省发给全部对端)
+    event_name = step.params['event']
+    data = step.params['data'] or {}
+    to = step.params['to']
+    print(f"[DEBUG] 开始发送消息: 事件={event_name}, 数据={data}, 对端={to or '全部'}")
+    success = get_backends().network.send(event_name, data, to=to)
+    print(f"[NETWORK] 发送消息: {event_name}, 成功={success}")
+    if not success:
+        print(f"[NETWORK] ✗ 消息发送失败")
+        raise RuntimeError(f"消息发送失败（事件: {event_name}），停止测试")
+
+
+@step_handler('network', 'receive')
+def _network_receive(step):
+    # network receive: 接收消息（阻塞）
+    # content: 事件名称 (例如: call_answer)，为空表示接收任何事件
+    # 属性: timeout (等待超时秒数，默认30), from (只接收该对端的消息，可选)
+    event_name = step.params['event'] or None
+    timeout = step.params['timeout']
+    sender = step.params['sender']
+    print(f"[DEBUG] 开始等待接收: 事件={event_name}, 对端={sender or '任意'}, 超时={timeout}秒")
+    message = get_backends().network.receive(event_name, timeout, sender=sender)
+    if message:
+        print(f"[NETWORK] ✓ 接收成功: {message}")
+    else:
+        print(f"[NETWORK] ✗ 接收超时或失败: 事件={event_name}, 超时={timeout}秒")
+        raise RuntimeError(f"消息接收失败或超时（事件: {event_name}），停止测试")
+
+
+@step_handler('network', 'stop')
+def _network_stop(step):
+    # network stop: 停止网络连接
+    print(f"[NETWORK] 停止网络连接")
+    get_backends().network.stop()
+
+
+@step_handler('check', 'input_method')
+def _check_input_method(step):
+    content = step.params['expected']
+    capture = get_screen_capture()
+    w, h = capture.screen_size()
+    # 只识别右下角输入法指示区域，'英'/'中'共用同一次识别结果
+    region = (w-200, h-80, w, h)
+    ocr = get_ocr_tool()
+    found = ocr.find_text_positions(['英', '中'], capture.grab(region=region))
+    status, status_cn = found['英'], found['中']
+    print(f"[CHECK] OCR识别右下角：'英'={status}, '中'={status_cn}")
+    need_switch = False
+    if content == '英语(美国)':
+        if not status:
+            print("[CHECK] 当前不是英文输入状态，尝试切换...")
+            need_switch = True
+    elif content == '中文(简体，中国)':
+        if not status_cn:
+            print("[CHECK] 当前不是中文输入状态，尝试切换...")
+            need_switch = True
+    if need_switch:
+        for i in range(5):
+            get_backends().input.hotkey('ctrlleft', 'space')
+            report_sleep(2.0)
+            # 切换后只重新截取右下角区域
+            found = ocr.find_text_positions(['英', '中'], capture.grab(region=region, fresh=True))
+            status, status_cn = found['英'], found['中']
+            print(f"[CHECK] 切换后OCR：'英'={status}, '中'={status_cn}")
+            if (content == '英语(美国)' and status) or (content == '中文(简体，中国)' and status_cn):
+                print("[CHECK] 输入法切换成功！")
+                break
+        else:
+            print("[CHECK] 输入法切换失败，当前OCR状态未达期望")
+    else:
+        print("[CHECK] 当前输入法已是期望值，无需切换")
+
+
+@step_handler('wait', 'sleep')
+@step_handler('wait', None)
+def _wait_sleep(step):
+    report_sleep(step.params['seconds'])
+
+
+@step_handler('ocr', 'find_and_click')
+def _ocr_find_and_click(step):
+    from screen_wait import wait_for_screen
+    content = step.params['text']
+    # 属性region（"left,top,right,bottom"）限定识别区域，只截取该区域
+    region = step.params['region']
+    left, top = (region[0], region[1]) if region else (0, 0)
+    ocr = get_ocr_tool()
+
+    def find(frame):
+        # 截图只含region区域，识别到的坐标换算回屏幕坐标
+        pos = ocr.find_text_position(content, frame)
+        return (pos[0] + left, pos[1] + top) if pos else pos
+
+    # 轮询等待画面稳定并找到目标，最长等待timeout秒（默认2秒，与原固定等待相同）
+    pos, screenshot = wait_for_screen(check=find, timeout=step.params['timeout'],
+                                      sleep=report_sleep, region=region)
+    if pos:
+        print(f"[OCR] 找到'{content}'，点击位置: {pos}")
+        get_backends().input.move_to(pos[0], pos[1], duration=0.5)
+        get_backends().input.click('left')
+    else:
+        print(f"[OCR] 未找到'{content}'，跳过点击")
+        print("[OCR] 本次截图所有识别结果：")
+        # 与上面最后一次查找是同一帧，直接复用缓存的识别结果
+        results = ocr.readtext(screenshot)
+        for bbox, text, conf in results:
+            print(f"  文本: '{text}'  置信度: {conf:.2f}")
+        Image.fromarray(np.asarray(screenshot)).save(f"ocr_debug_{content}.png")
+        print(f"[OCR] 已保存调试截图: ocr_debug_{content}.png")
+
+
+@step_handler('ocr', 'check_texts')
+def _ocr_check_texts(step):
+    # 一次识别检查多个文本，content用'|'分隔，例如 "确定|取消"
+    screenshot = get_screen_capture().grab()
+    found = get_ocr_tool().find_text_positions(step.params['texts'], screenshot, region=step.params['region'])
+    print(f"[OCR] 文本位置: {found}")
+    missing = [t for t, pos in found.items() if pos is None]
+    if missing:
+        raise RuntimeError(f"OCR未找到文本: {missing}，停止测试")
+
+
+@step_handler('window', 'maximize_top')
+def _window_maximize_top(step):
+    ok = get_backends().input.maximize_top_window()
+    print(f"[WINDOW] 最大化最上层窗口: {'成功' if ok else '失败'}")
+
+
+@step_handler('icon', 'find_and_move')
+def _icon_find_and_move(step):
+    from icon_detector import IconDetector
+    content = step.params['template']
+    detector = IconDetector(threshold=0.6)
+    # 属性scales（如 "1.0,1.25,1.5"）启用由粗到细的多尺度匹配
+    scales = step.params['scales']
+    if scales:
+        matches = detector.find_icons_multiscale(content, scales=scales)
+    else:
+        matches = detector.find_icons(content)
+    if matches:
+        x, y, score = matches[0]
+        print(f"[ICON] 检测到图标，位置=({x},{y}), 置信度={score:.2f}，自动移动鼠标")
+        get_backends().input.move_to(x, y, duration=0.3)
+    else:
+        print(f"[ICON] 未检测到图标: {content}")
+
+
+@step_handler('parallel', None)
+def _parallel_group(step):
+    report = get_run_report()
+
+    def run_child(child):
+        with report.step(child):
+            execute_step(child)
+
+    group = get_step_groups().start(step, run_child)
+    if not step.params['detach']:
+        group.wait()
+
+
+@step_handler('join', None)
+def _join_groups(step):
+    get_step_groups().join(step.params['name'], step.params['timeout'])
+
 
 def execute_step(step):
-    step_type = step.get('type')
-    action = step.get('action')
-    content = step.get('content')
-    print(f"执行: type={step_type}, action={action}, content={content}")
-    if step_type == 'keyboard':
-        if action == 'press_key':
-            pyautogui.press(content)
-        elif action == 'type_text':
-            pyautogui.typewrite(content, interval=0.1)
-    elif step_type == 'mouse':
-        if action == 'move_mouse':
-            x, y = map(int, content.split(','))
-            pyautogui.moveTo(x, y, duration=0.5)
-        elif action == 'click':
-            if content == 'left':
-                pyautogui.click()
-            elif content == 'right':
-                pyautogui.click(button='right')
-    elif step_type == 'audio':
-        if action == 'play':
-            from audio_player import play_audio
-            device_idx = int(step.get('device', -1))
-            device_arg = device_idx if device_idx >= 0 else None
-            time_duration = step.get('time')
-            duration_arg = float(time_duration) if time_duration else None
-            ok = play_audio(content, device_arg, duration_arg)
-            print(f"[AUDIO] 播放音频: {content} {'成功' if ok else '失败'}" + (f" (时长: {duration_arg}s)" if duration_arg else ""))
-        elif action == 'play_async':
-            # 异步播放，不阻塞后续步骤
-            from audio_player import play_audio
-            device_idx = int(step.get('device', -1))
-            device_arg = device_idx if device_idx >= 0 else None
-            time_duration = step.get('time')
-            duration_arg = float(time_duration) if time_duration else None
-            thread = threading.Thread(target=play_audio, args=(content, device_arg, duration_arg), daemon=True)
-            thread.start()
-            print(f"[AUDIO] 异步播放音频: {content}，设备: {device_idx if device_idx >= 0 else '默认'}" + (f", 时长: {duration_arg}s" if duration_arg else ""))
-        elif action == 'record':
-            # 同步录音
-            from audio_recorder import record_audio
-            device_idx = int(step.get('device', 0))
-            duration = float(step.get('duration', 5))
-            output_file = content
-            record_audio(device_idx, duration, output_file)
-            print(f"[AUDIO] 录音完成: {output_file}")
-        elif action == 'record_async':
-            # 异步录音，不阻塞后续步骤
-            from audio_recorder import record_audio
-            device_idx = int(step.get('device', 0))
-            duration = float(step.get('duration', 5))
-            output_file = content
-            thread = threading.Thread(target=record_audio, args=(device_idx, duration, output_file), daemon=True)
-            thread.start()
-            print(f"[AUDIO] 异步录音开始，设备: {device_idx}，时长: {duration}s，输出: {output_file}")
-        elif action == 'stop_record':
-            # 停止录音
-            from audio_recorder import stop_record
-            stop_record()
-    elif step_type == 'network':
-        if action == 'init':
-            # network init: 初始化网络连接
-            # content: peer_host:peer_port (例如: 192.168.1.101:9998)
-            # 属性: local_port (本地监听端口，默认9998)
-            local_port = int(step.get('local_port', 9998))
-            
+    """
+    执行单个步骤。
+    :param step: 编译后的Step，或XML <step>元素（现场编译）
+    """
+    if not isinstance(step, Step):
+        step = compile_step(step)
+    print(f"执行: type={step.type}, action={step.action}, content={step.content}")
+    handler = STEP_HANDLERS.get(step.key)
+    if handler is None:
+        print(f"[PLAN] 跳过未知步骤: type={step.type}, action={step.action}")
+        return
+    handler(step)
+    # 输入类操作会改变画面，使缓存的截图失效
+    if step.type in INPUT_STEP_TYPES:
+        get_screen_capture().mark_dirty()
+    # 按步骤类型等待界面稳定（非UI步骤不等待）
+    get_step_pacer().after_step(step)
+
+
+def compile_testcases(xml_path, testcase_name=None):
+    """
+    解析并编译XML中的测试用例（执行前完成全部校验）。
+    :return: [TestcasePlan, ...]
+    :raises TestcaseCompileError: XML中存在非法步骤
+    """
+    # 流式读取：指定名称时通过索引直接定位，否则逐个用例解析后释放
+    return [compile_testcase(testcase) for testcase in iter_selected(xml_path, testcase_name)]
+
+
+def run_plan(plan, start=0, checkpoint=None):
+    """
+    执行单个已编译的用例。
+    :param start: 从该序号的步骤开始执行（断点续跑）
+    :param checkpoint: CheckpointStore，每步执行完后记录进度
+    """
+    import glob
+    tc_name = plan.name
+    report = get_run_report()
+    steps = plan.steps_from(start)
+    if start:
+        print(f"\n从第{steps[0].index + 1 if steps else start + 1}步继续执行用例: {tc_name}"
+              f"（跳过 {len(plan.steps) - len(steps)} 个步骤）")
+    else:
+        print(f"\n开始执行用例: {tc_name}")
+    report.begin_testcase(tc_name)
+    if checkpoint is not None:
+        checkpoint.begin_testcase(tc_name, start)
+    # 用例包含OCR步骤时，在后台预热OCR引擎，与前面的步骤并行
+    if plan.step_types() & set(OCR_STEP_TYPES) and get_backends().ocr is None:
+        warmup_ocr(OCR_LANGS, gpu=False)
+    groups = get_step_groups()
+    try:
+        for step in steps:
+            with report.step(step):
+                execute_step(step)
+            if checkpoint is not None:
+                checkpoint.step_done(step)
+        # 用例结束前等待仍在后台执行的步骤组
+        groups.join()
+    except Exception as e:
+        groups.abandon_all()
+        report.end_testcase(e)
+        raise
+    report.end_testcase()
+    if checkpoint is not None:
+        checkpoint.end_testcase(tc_name)
+    print(f"用例 '{tc_name}' 执行完毕\n")
+    # 删除执行过程中生成的图片等文件
+    patterns = ["last_rainbow_screenshot.png", "after_cui_ji_click.png", "after_call_click.png"]
+    for pat in patterns:
+        for f in glob.glob(pat):
             try:
-                if content and ':' in content:
-                    parts = content.split(':')
-                    peer_host = parts[0]
-                    peer_port = int(parts[1])
-                    print(f"[NETWORK] 初始化网络: 本地端口={local_port}, 对端={peer_host}:{peer_port}")
-                    init_network(local_port, peer_host, peer_port)
-                else:
-                    print(f"[NETWORK] 初始化网络: 本地端口={local_port}（仅启动服务器）")
-                    init_network(local_port=local_port)
-                print(f"[NETWORK] ✓ 网络初始化成功")
+                os.remove(f)
+                # print(f"已删除文件: {f}")
             except Exception as e:
-                print(f"[NETWORK] ✗ 网络初始化失败: {e}")
-                raise RuntimeError(f"网络初始化失败，停止测试: {e}")
-        
-        elif action == 'send':
-            # network send: 发送消息
-            # content: 事件名称 (例如: call_start)
-            # 属性: data (消息数据，JSON格式，可选)
-            event_name = content
-            data_str = step.get('data', '{}')
-            
-            try:
-                import json
-                data = json.loads(data_str)
-            except:
-                data = {'message': data_str}
-            
-            network = get_network()
-            print(f"[DEBUG] 开始发送消息: 事件={event_name}, 数据={data}")
-            print(f"[DEBUG] client_socket状态: {network.client_socket}")
-            success = network.send(event_name, data)
-            print(f"[NETWORK] 发送消息: {event_name}, 成功={success}")
-            
-            if not success:
-                print(f"[NETWORK] ✗ 消息发送失败")
-                raise RuntimeError(f"消息发送失败（事件: {event_name}），停止测试")
-        
-        elif action == 'receive':
-            # network receive: 接收消息（阻塞）
-            # content: 事件名称 (例如: call_answer)，为空表示接收任何事件
-            # 属性: timeout (等待超时秒数，默认30)
-            event_name = content if content else None
-            timeout = float(step.get('timeout', 30))
-            
-            network = get_network()
-            print(f"[DEBUG] 开始等待接收: 事件={event_name}, 超时={timeout}秒")
-            message = network.receive(event_name, timeout)
-            
-            if message:
-                print(f"[NETWORK] ✓ 接收成功: {message}")
-            else:
-                print(f"[NETWORK] ✗ 接收超时或失败: 事件={event_name}, 超时={timeout}秒")
-                raise RuntimeError(f"消息接收失败或超时（事件: {event_name}），停止测试")
-        
-        elif action == 'stop':
-            # network stop: 停止网络连接
-            print(f"[NETWORK] 停止网络连接")
-            stop_network()
-    elif step_type == 'check':
-        if action == 'input_method':
-            from PIL import ImageGrab
-            import auto_controller as ac
-            screen = ImageGrab.grab()
-            w, h = screen.size
-            region = screen.crop((w-200, h-80, w, h))
-            status = ocr.find_text_position('英', region)
-            status_cn = ocr.find_text_position('中', region)
-            print(f"[CHECK] OCR识别右下角：'英'={status}, '中'={status_cn}")
-            need_switch = False
-            if content == '英语(美国)':
-                if not status:
-                    print("[CHECK] 当前不是英文输入状态，尝试切换...")
-                    need_switch = True
-            elif content == '中文(简体，中国)':
-                if not status_cn:
-                    print("[CHECK] 当前不是中文输入状态，尝试切换...")
-                    need_switch = True
-            if need_switch:
-                for i in range(5):
-                    pyautogui.hotkey('ctrlleft', 'space')
-                    time.sleep(2.0)
-                    screen = ImageGrab.grab()
-                    region = screen.crop((w-200, h-80, w, h))
-                    status = ocr.find_text_position('英', region)
-                    status_cn = ocr.find_text_position('中', region)
-                    print(f"[CHECK] 切换后OCR：'英'={status}, '中'={status_cn}")
-                    if (content == '英语(美国)' and status) or (content == '中文(简体，中国)' and status_cn):
-                        print("[CHECK] 输入法切换成功！")
-                        break
-                else:
-                    print("[CHECK] 输入法切换失败，当前OCR状态未达期望")
-            else:
-                print("[CHECK] 当前输入法已是期望值，无需切换")
-    elif step_type == 'wait':
-        if action == 'sleep':
-            time.sleep(float(content))
-    elif step_type == 'ocr':
-        if action == 'find_and_click':
-            time.sleep(2)
-            from PIL import ImageGrab
-            import auto_controller as ac
-            screenshot = ImageGrab.grab()
-            pos = ocr.find_text_position(content, screenshot)
-            if pos:
-                print(f"[OCR] 找到'{content}'，点击位置: {pos}")
-                ac.move_mouse(pos[0], pos[1], duration=0.5)
-                ac.left_click()
-            else:
-                print(f"[OCR] 未找到'{content}'，跳过点击")
-                print("[OCR] 本次截图所有识别结果：")
-                results = ocr.reader.readtext(np.array(screenshot))
-                for bbox, text, conf in results:
-                    print(f"  文本: '{text}'  置信度: {conf:.2f}")
-                screenshot.save(f"ocr_debug_{content}.png")
-                print(f"[OCR] 已保存调试截图: ocr_debug_{content}.png")
-    elif step_type == 'window':
-        if action == 'maximize_top':
-            from window_util import maximize_top_window
-            ok = maximize_top_window()
-            print(f"[WINDOW] 最大化最上层窗口: {'成功' if ok else '失败'}")
-    elif step_type == 'icon':
-        if action == 'find_and_move':
-            from icon_detector import IconDetector
-            from mouse_controller import MouseController
-            detector = IconDetector(threshold=0.6)
-            matches = detector.find_icons(content)
-            if matches:
-                x, y, score = matches[0]
-                print(f"[ICON] 检测到图标，位置=({x},{y}), 置信度={score:.2f}，自动移动鼠标")
-                MouseController().move_to(x, y, duration=0.3)
+                print(f"删除文件失败: {f}, 原因: {e}")
+
+
+def restore_markers(markers):
+    """断点续跑前恢复网络/音频状态"""
+    network = markers.get('network')
+    if network:
+        peers = network['peers']
+        print(f"[CHECKPOINT] 恢复网络连接: 本地端口={network['local_port']}, 对端={peers}")
+        get_backends().network.init(local_port=network['local_port'], peers=peers, name=network['name'])
+    audio = markers.get('audio')
+    if audio:
+        # 中断前的后台录音无法接续，只给出提示
+        print(f"[CHECKPOINT] 注意: 中断前正在后台录音 {audio['recording']}（设备 {audio['device']}），该文件可能不完整")
+
+
+def apply_run_config(config):
+    """
+    按运行配置设置后端、步骤节奏、调试图片和P2P实现。
+    --parallel 的工作进程不继承主进程中的这些设置（spawn启动），需在子进程中再次调用。
+    :param config: dict，键 dry_run / fast_mouse / pacing / debug_artifacts / debug_max_per_lookup / p2p_transport
+    """
+    if config.get('dry_run'):
+        set_backends(dry_run_backends())
+    elif config.get('fast_mouse'):
+        set_backends(Backends(input=DesktopInput(fast_mouse=True)))
+    if config.get('p2p_transport'):
+        set_transport(config['p2p_transport'])
+    pacing = config.get('pacing')
+    if pacing == 'fixed':
+        set_step_pacer(StepPacer(fixed=FIXED_POLICY, sleep=report_sleep))
+    elif pacing == 'idle':
+        set_step_pacer(StepPacer(policies=IDLE_POLICIES, sleep=report_sleep))
+    if config.get('debug_artifacts'):
+        get_debug_artifacts().enable(config['debug_artifacts'], config.get('debug_max_per_lookup'))
+
+
+def execute_testcases(xml_path, testcase_name=None, parallel=None, resume=False, resume_step=None,
+                      run_config=None):
+    """
+    执行XML中的测试用例。
+    :param parallel: 工作进程数；大于1时资源不冲突的用例并行执行，返回合并后的结果列表
+    :param resume: 从上次的断点（<xml>.checkpoint）继续执行
+    :param resume_step: 从指定用例（testcase_name，默认第一个）的第N步（从1开始）继续执行
+    :param run_config: 传给并行工作进程的运行配置（见 apply_run_config）
+    """
+    # 先编译全部用例，XML有误时在执行任何步骤前报错
+    plans = compile_testcases(xml_path, testcase_name)
+    if parallel and parallel > 1:
+        from parallel_runner import run_parallel
+        results = run_parallel(plans, max_workers=parallel, report=get_run_report().enabled,
+                               config=run_config)
+        # 合并各工作进程的步骤耗时记录
+        get_run_report().merge([r['report'] for r in results if r.get('report')])
+        return results
+    checkpoint = CheckpointStore(xml_path)
+    state = None
+    if resume and resume_step is None:
+        state = checkpoint.load()
+        if state is None:
+            print(f"[CHECKPOINT] 没有可用的断点，从头执行")
+    elif testcase_name is not None:
+        # 只执行指定用例时保留其他用例的断点
+        checkpoint.load()
+    selected, markers = resume_plan(plans, state, testcase_name, resume_step)
+    if state is not None or resume_step is not None:
+        restore_markers(markers)
+        checkpoint.markers.update(markers)
+    # 演练模式不写断点，避免覆盖真实执行留下的断点
+    dry_run = get_backends().dry_run
+    for plan, start in selected:
+        run_plan(plan, start, None if dry_run else checkpoint)
+    if not dry_run:
+        # 执行成功，清除本次执行的用例的断点（执行了全部用例时删除断点文件）
+        checkpoint.clear(None if testcase_name is None else [plan.name for plan, _ in selected])
+
+
+def dry_run_counters(backends):
+    """演练后端的累计计数（--parallel 时由工作进程按用例返回，主进程汇总）"""
+    clock = backends.clock
+    return {'virtual': clock.monotonic(), 'slept': clock.slept, 'input': len(backends.input.calls),
+            'audio': len(backends.audio.calls), 'sent': len(backends.network.sent), 'ocr': backends.ocr.calls}
+
+
+def merge_dry_run_counters(results):
+    """汇总 --parallel 各用例结果中的演练计数"""
+    total = dict.fromkeys(('virtual', 'slept', 'input', 'audio', 'sent', 'ocr'), 0)
+    for result in results:
+        for key, value in (result.get('dry_run') or {}).items():
+            total[key] += value
+    return total
+
+
+def print_dry_run_summary(counters, elapsed, parallel=False):
+    """演练模式结束时打印虚拟耗时与实际耗时"""
+    virtual = "虚拟耗时（各用例合计）" if parallel else "虚拟耗时"
+    print(f"\n[DRY-RUN] 实际耗时 {elapsed * 1000:.1f}ms，{virtual} {counters['virtual']:.1f}s"
+          f"（跳过等待 {counters['slept']:.1f}s）")
+    print(f"[DRY-RUN] 输入操作 {counters['input']} 次，音频操作 {counters['audio']} 次，"
+          f"发送网络消息 {counters['sent']} 条，OCR调用 {counters['ocr']} 次")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="执行XML测试用例",
+        epilog="示例: python run_testcase.py testcase/p2p_network_demo.xml P2P_Sender",
+    )
+    parser.add_argument('xml_file', help="xml文件路径")
+    parser.add_argument('testcase_name', nargs='?', default=None, help="只执行指定名称的testcase")
+    parser.add_argument('--debug-artifacts', nargs='?', const='debug_artifacts', default=None, metavar='DIR',
+                        help="保存图标匹配区域等调试图片到DIR下的本次运行目录（默认关闭）")
+    parser.add_argument('--debug-max-per-lookup', type=int, default=5, metavar='N',
+                        help="单次查找最多保存的调试图片数（默认5）")
+    parser.add_argument('--parallel', type=int, default=None, metavar='N',
+                        help="用N个工作进程并行执行资源互不冲突的用例（如网络、音频用例）")
+    parser.add_argument('--report', default=None, metavar='PATH',
+                        help="输出每个步骤的耗时报告（.jsonl逐行记录，其他后缀为JSON）")
+    parser.add_argument('--pacing', choices=('adaptive', 'idle', 'fixed'), default='adaptive',
+                        help="步骤间等待策略：adaptive按步骤类型等待（默认），idle点击/窗口操作后再等待画面稳定，fixed每步固定0.3秒")
+    parser.add_argument('--resume', action='store_true',
+                        help="从上次失败的断点继续执行（断点文件为 <xml>.checkpoint）")
+    parser.add_argument('--resume-step', type=int, default=None, metavar='N',
+                        help="从指定用例（默认第一个）的第N步开始执行")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="演练模式：使用假的键鼠/截图/音频/网络后端和虚拟时钟，不操作真实设备，用于检查流程和测量执行器开销")
+    parser.add_argument('--fast-mouse', action='store_true',
+                        help="鼠标移动直接跳到目标位置，不模拟移动轨迹")
+    parser.add_argument('--p2p-transport', choices=TRANSPORTS, default=None,
+                        help="P2P网络实现：thread 每个连接一个线程；asyncio 单个事件循环复用所有连接（默认 thread，可用环境变量 AUTOCONTROL_P2P_TRANSPORT 设置）")
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.xml_file):
+        print(f"未找到指定的xml文件: {args.xml_file}")
+        sys.exit(2)
+    if (args.resume or args.resume_step is not None) and args.parallel and args.parallel > 1:
+        print("--resume/--resume-step 不支持与 --parallel 同时使用")
+        sys.exit(2)
+    if args.resume_step is not None and args.resume_step < 1:
+        print("--resume-step 必须从1开始")
+        sys.exit(2)
+    run_config = {
+        'dry_run': args.dry_run,
+        'fast_mouse': args.fast_mouse,
+        'pacing': args.pacing,
+        'debug_artifacts': args.debug_artifacts,
+        'debug_max_per_lookup': args.debug_max_per_lookup,
+        'p2p_transport': args.p2p_transport,
+    }
+    apply_run_config(run_config)
+    report = get_run_report()
+    if args.report:
+        report.enable()
+    artifacts = get_debug_artifacts()
+    start = time.perf_counter()
+    results = None
+    try:
+        results = execute_testcases(args.xml_file, args.testcase_name, args.parallel,
+                                    resume=args.resume, resume_step=args.resume_step,
+                                    run_config=run_config)
+    except TestcaseCompileError as e:
+        print(f"测试用例XML有误，未执行任何步骤: {e}")
+        sys.exit(3)
+    finally:
+        # 等待后台写完调试图片（未启用时无操作）
+        artifacts.close()
+        if args.report:
+            report.write(args.report)
+        if args.dry_run:
+            elapsed = time.perf_counter() - start
+            if results is not None:
+                # --parallel：计数在各工作进程的假后端中
+                print_dry_run_summary(merge_dry_run_counters(results), elapsed, parallel=True)
             else:
-                print(f"[ICON] 未检测到图标: {content}")
-    time.sleep(0.3)
+                print_dry_run_summary(dry_run_counters(get_backends()), elapsed)
+    if results and any(r['status'] != 'passed' for r in results):
+        sys.exit(1)
 
-def execute_testcases(xml_path, testcase_name=None):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    import glob
-    for testcase in root.findall('testcase'):
-        tc_name = testcase.get('name')
-        # 如果指定了testcase_name，则只执行匹配的
-        if testcase_name and tc_name != testcase_name:
-            continue
-        print(f"\n开始执行用例: {tc_name}")
-        for step in testcase.findall('step'):
-            execute_step(step)
-        print(f"用例 '{tc_name}' 执行完毕\n")
-        # 删除执行过程中生成的图片等文件
-        patterns = ["last_rainbow_screenshot.png", "after_cui_ji_click.png", "after_call_click.png"]
-        for pat in patterns:
-            for f in glob.glob(pat):
-                try:
-                    os.remove(f)
-                    # print(f"已删除文件: {f}")
-                except Exception as e:
-                    print(f"删除文件失败: {f}, 原因: {e}")
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("用法: python run_testcase.py <xml文件路径> [testcase名称]")
-        print("示例: python run_testcase.py testcase/p2p_network_demo.xml P2P_Sender")
-        print("      python run_testcase.py testcase/rainbow_main.xml")
-        sys.exit(1)
-    xml_file = sys.argv[1]
-    testcase_name = sys.argv[2] if len(sys.argv) > 2 else None
-    if not os.path.isfile(xml_file):
-        print(f"未找到指定的xml文件: {xml_file}")
-        sys.exit(2)
-    execute_testcases(xml_file, testcase_name)
-    # 程序结束后清理所有 debug_match_*.png
-    import glob
-    for f in glob.glob('debug_match_*.png'):
-        try:
-            os.remove(f)
-            print(f"已删除调试图片: {f}")
-        except Exception as e:
-            print(f"删除调试图片失败: {f}, 原因: {e}")
+    main()
@@ -0,0 +1,149 @@
+"""
+screen_capture.py
+截图服务：缓存最近一帧并在步骤之间复用，减少重复的全屏截图。
+- 键盘/鼠标等输入操作后调用 mark_dirty()，下一次取帧会重新截图
+- 缓存帧超过 max_age 秒也会重新截图（画面可能因网络/音频事件变化）
+- 支持只截取指定区域；全屏帧可直接切片得到区域视图，不额外拷贝
+- 帧以只读 numpy 数组(RGB)共享给调用方
+"""
+import threading
+import time
+
+import numpy as np
+
+from run_report import timed
+
+
+def _imagegrab_source(bbox=None):
+    from PIL import ImageGrab
+    return ImageGrab.grab(bbox=bbox)
+
+
+class FakeFrameSource:
+    """
+    假的截图源，用于无桌面环境的测试：按顺序返回预设帧，最后一帧重复使用。
+    """
+
+    def __init__(self, frames):
+        """
+        :param frames: numpy数组(RGB)列表
+        """
+        self.frames = [np.asarray(f) for f in frames]
+        self.index = 0
+        self.calls = 0
+
+    def __call__(self, bbox=None):
+        self.calls += 1
+        frame = self.frames[min(self.index, len(self.frames) - 1)]
+        self.index += 1
+        if bbox is not None:
+            left, top, right, bottom = bbox
+            frame = frame[top:bottom, left:right]
+        return frame
+
+
+class ScreenCapture:
+    """截图服务：保存最近一帧及其时间戳和脏标记"""
+
+    def __init__(self, source=None, max_age=0.5, clock=time.monotonic):
+        """
+        :param source: 截图函数 source(bbox) -> PIL.Image 或 numpy数组，默认PIL.ImageGrab
+        :param max_age: 缓存帧最长复用时间（秒），None表示只依赖脏标记
+        :param clock: 时钟函数
+        """
+        self.source = source or _imagegrab_source
+        self.max_age = max_age
+        self.clock = clock
+        self.grab_count = 0        # 实际截图次数
+        self.reuse_count = 0       # 复用缓存帧次数
+        self._frame = None
+        self._bbox = None          # 缓存帧对应的屏幕区域 (left, top, right, bottom)
+        self._is_full = False      # 缓存帧是否为全屏截图
+        self._timestamp = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def mark_dirty(self):
+        """标记画面已变化（输入操作后调用），下一次取帧会重新截图"""
+        self._dirty = True
+
+    @property
+    def timestamp(self):
+        """最近一帧的截图时间"""
+        return self._timestamp
+
+    def latest(self):
+        """返回最近一帧及其时间戳，不触发截图"""
+        with self._lock:
+            return self._frame, self._timestamp
+
+    def grab(self, region=None, fresh=False):
+        """
+        获取屏幕帧（只读RGB数组）。缓存帧有效且覆盖所需区域时直接返回其切片视图。
+        :param region: 屏幕区域 (left, top, right, bottom)，None表示全屏
+        :param fresh: 是否强制重新截图
+        :return: numpy数组 (h, w, 3)
+        """
+        with self._lock:
+            if not fresh and self._is_valid():
+                view = self._slice(region)
+                if view is not None:
+                    self.reuse_count += 1
+                    return view
+            with timed('capture'):
+                frame = np.asarray(self.source(region))
+            if frame.ndim == 3 and frame.shape[2] == 4:
+                frame = np.ascontiguousarray(frame[:, :, :3])
+            frame.flags.writeable = False
+            h, w = frame.shape[:2]
+            left, top = (region[0], region[1]) if region is not None else (0, 0)
+            self._frame = frame
+            self._bbox = (left, top, left + w, top + h)
+            self._is_full = region is None
+            self._timestamp = self.clock()
+            self._dirty = False
+            self.grab_count += 1
+            return frame
+
+    def screen_size(self):
+        """屏幕尺寸 (w, h)：取自最近的全屏帧，没有时截一次全屏"""
+        with self._lock:
+            if self._frame is not None and self._is_full:
+                return self._bbox[2], self._bbox[3]
+        frame = self.grab()
+        return frame.shape[1], frame.shape[0]
+
+    def _is_valid(self):
+        if self._frame is None or self._dirty:
+            return False
+        if self.max_age is not None and self.clock() - self._timestamp > self.max_age:
+            return False
+        return True
+
+    def _slice(self, region):
+        left, top, right, bottom = self._bbox
+        if region is None:
+            return self._frame if self._is_full else None
+        r_left, r_top, r_right, r_bottom = region
+        if r_left < left or r_top < top or r_right > right or r_bottom > bottom:
+            return None
+        return self._frame[r_top - top:r_bottom - top, r_left - left:r_right - left]
+
+
+# 全局截图服务
+_capture = None
+
+
+def get_screen_capture():
+    """获取全局截图服务"""
+    global _capture
+    if _capture is None:
+        _capture = ScreenCapture()
+    return _capture
+
+
+def set_screen_capture(capture):
+    """替换全局截图服务（如使用假的截图源）"""
+    global _capture
+    _capture = capture
+    return capture
@@ -0,0 +1,107 @@
+"""
+screen_wait.py
+屏幕等待工具：轮询截图，等待画面稳定或目标出现，替代固定时长的sleep。
+画面比较使用下采样后的小灰度图，单次比较只需几毫秒。
+"""
+
+import cv2
+import numpy as np
+
+from backends import get_clock
+from screen_capture import get_screen_capture
+
+# 下采样尺寸 (宽, 高)
+DIFF_SIZE = (96, 54)
+# 两帧平均灰度差低于该值视为画面未变化（0-255）
+DIFF_THRESHOLD = 1.5
+# 画面持续变化（视频窗口、加载动画等）时，每隔多少次轮询仍强制检查一次
+CHECK_EVERY = 5
+
+
+def downsample(frame, size=DIFF_SIZE):
+    """
+    将截图缩小为灰度小图，用于快速比较。
+    :param frame: PIL.Image 或 numpy数组（RGB/RGBA/灰度）
+    :return: float32 灰度数组
+    """
+    img = np.asarray(frame)
+    if img.ndim == 3:
+        code = cv2.COLOR_RGBA2GRAY if img.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+        img = cv2.cvtColor(img, code)
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def frame_diff(small_a, small_b):
+    """两张下采样灰度图的平均绝对差"""
+    if small_a.shape != small_b.shape:
+        return float('inf')
+    return float(np.mean(np.abs(small_a - small_b)))
+
+
+def wait_for_screen(grab=None, check=None, timeout=2.0, interval=0.1, stable_frames=1,
+                    threshold=DIFF_THRESHOLD, sleep=None, now=None, region=None, check_every=CHECK_EVERY):
+    """
+    轮询截图，直到画面稳定（且check返回真值），或超时。
+    check只在画面稳定后、且画面与上次检查时不同才调用，避免重复做昂贵的识别；
+    画面一直不稳定时每隔check_every次轮询也检查一次，超时前对变化过的最后一帧再检查一次。
+    :param grab: 截图函数，返回PIL.Image或numpy数组，默认从截图服务强制取新帧（只截region区域）
+    :param check: 检查函数 frame -> 结果，返回真值表示目标已出现；None表示只等待画面稳定
+    :param timeout: 最长等待时间（秒）
+    :param interval: 轮询间隔（秒）
+    :param stable_frames: 连续多少次比较无变化视为稳定
+    :param threshold: 画面变化阈值（平均灰度差）
+    :param sleep: 休眠函数，默认使用当前后端时钟（演练模式下为虚拟时钟）
+    :param now: 时钟函数，默认使用当前后端时钟
+    :param region: 默认截图函数截取的屏幕区域 (left, top, right, bottom)，None表示全屏
+    :param check_every: 画面不稳定时每隔多少次轮询强制检查一次，None表示只在稳定时检查
+    :return: (结果, 帧)；无check时结果为是否稳定、帧为最后一帧；
+             有check时帧为最后一次检查的帧，超时时结果为None
+    """
+    if grab is None:
+        capture = get_screen_capture()
+        grab = lambda: capture.grab(region, fresh=True)
+    if sleep is None or now is None:
+        clock = get_clock()
+        sleep = sleep or clock.sleep
+        now = now or clock.monotonic
+    deadline = now() + timeout
+    previous = None
+    checked = None
+    checked_frame = None
+    stable_count = 0
+    unchecked_polls = 0
+    frame = None
+    small = None
+    while True:
+        frame = grab()
+        small = downsample(frame)
+        if previous is not None and frame_diff(previous, small) < threshold:
+            stable_count += 1
+        else:
+            stable_count = 0
+        previous = small
+        unchecked_polls += 1
+        if stable_count >= stable_frames and check is None:
+            return True, frame
+        forced = check_every is not None and unchecked_polls >= check_every
+        if check is not None and (stable_count >= stable_frames or forced):
+            if checked is None or frame_diff(checked, small) >= threshold:
+                checked = small
+                checked_frame = frame
+                unchecked_polls = 0
+                result = check(frame)
+                if result:
+                    return result, frame
+        if now() >= deadline:
+            break
+        sleep(interval)
+    if check is None:
+        return False, frame
+    # 最后一帧与上次检查的帧不同（或从未检查过）时再检查一次
+    if checked is None or frame_diff(checked, small) >= threshold:
+        result = check(frame)
+        if result:
+            return result, frame
+        checked_frame = frame
+    # 返回最后检查过的帧（而不是最后截取的帧），调用方可以复用该帧的识别缓存
+    return None, checked_frame
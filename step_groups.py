@@ -0,0 +1,165 @@
+"""
+step_groups.py
+并发步骤组的执行：<parallel> 内的子步骤提交到有界线程池同时执行，
+等待全部完成或超时；子步骤的异常汇总后在父用例中抛出。
+detach 的组在后台运行，由 <join> 或用例结束时统一等待。
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from backends import get_clock
+
+# 单个组默认最多同时执行的步骤数
+DEFAULT_MAX_WORKERS = 4
+
+
+class StepGroupError(RuntimeError):
+    """组内有步骤执行失败"""
+
+    def __init__(self, name, errors):
+        """
+        :param name: 组名
+        :param errors: [(子步骤, 异常), ...]
+        """
+        self.name = name
+        self.errors = errors
+        details = '; '.join(f"{step.type}/{step.action}: {type(e).__name__}: {e}" for step, e in errors)
+        super().__init__(f"步骤组 '{name}' 中 {len(errors)} 个步骤失败: {details}")
+
+
+class StepGroupTimeout(TimeoutError):
+    """组在超时时间内未全部完成"""
+
+    def __init__(self, name, timeout, unfinished):
+        self.name = name
+        self.timeout = timeout
+        self.unfinished = unfinished
+        super().__init__(f"步骤组 '{name}' 在 {timeout}s 内未完成，剩余 {len(unfinished)} 个步骤")
+
+
+class StepGroup:
+    """一个正在执行的步骤组"""
+
+    def __init__(self, name, steps, futures, executor, timeout):
+        self.name = name
+        self.steps = steps
+        self.futures = futures
+        self.executor = executor
+        self.timeout = timeout
+        self.start = time.monotonic()
+
+    def wait(self, timeout=None):
+        """
+        等待组内步骤全部结束。
+        :param timeout: 超时（秒），None时使用组自身的timeout，仍为None则一直等待
+        :raises StepGroupTimeout: 超时（已在执行的步骤无法中断，会在后台继续运行到结束）
+        :raises StepGroupError: 有步骤抛出异常
+        """
+        timeout = self.timeout if timeout is None else timeout
+        done, not_done = wait(self.futures, timeout=timeout)
+        if not_done:
+            self._cancel_pending()
+            unfinished = [step for step, f in zip(self.steps, self.futures) if f in not_done]
+            raise StepGroupTimeout(self.name, timeout, unfinished)
+        self.executor.shutdown(wait=False)
+        errors = [(step, f.exception()) for step, f in zip(self.steps, self.futures) if f.exception()]
+        if errors:
+            raise StepGroupError(self.name, errors) from errors[0][1]
+        # 子步骤返回各自结束时的时钟时间；演练模式下虚拟时间推进到最晚结束的步骤
+        get_clock().advance_to(max((f.result() for f in self.futures), default=0.0))
+        print(f"[GROUP] 步骤组 '{self.name}' 完成，耗时 {time.monotonic() - self.start:.2f}s")
+
+    def abandon(self):
+        """放弃等待：取消尚未开始的步骤"""
+        self._cancel_pending()
+
+    def _cancel_pending(self):
+        # shutdown(cancel_futures=True) 需要 Python 3.9+，这里逐个取消以兼容 3.8
+        for f in self.futures:
+            f.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class StepGroups:
+    """管理当前用例中启动的步骤组"""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._detached = OrderedDict()
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def start(self, group_step, run_step):
+        """
+        启动步骤组。
+        :param group_step: 编译后的<parallel>步骤（params['steps']为子步骤）
+        :param run_step: 执行单个子步骤的函数 step -> None
+        :return: StepGroup
+        """
+        params = group_step.params
+        steps = params['steps']
+        with self._lock:
+            self._count += 1
+            name = params['name'] or f"parallel#{self._count}"
+            previous = self._detached.pop(name, None) if params['detach'] else None
+        if previous is not None:
+            # 同名后台组再次启动前先等待上一次结束
+            previous.wait()
+        workers = min(len(steps), params['max_workers'] or self.max_workers)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"group-{name}")
+        clock = get_clock()
+
+        def run(step):
+            run_step(step)
+            return clock.monotonic()
+
+        futures = [executor.submit(clock.bind(run), step) for step in steps]
+        group = StepGroup(name, steps, futures, executor, params['timeout'])
+        print(f"[GROUP] 启动步骤组 '{name}'：{len(steps)} 个步骤，并发数 {workers}"
+              + ("，后台执行" if params['detach'] else ""))
+        if params['detach']:
+            with self._lock:
+                self._detached[name] = group
+        return group
+
+    def join(self, name=None, timeout=None):
+        """
+        等待后台组结束。
+        :param name: 组名，None表示全部后台组（按启动顺序）
+        :param timeout: 超时（秒），None时使用各组自身的timeout
+        """
+        with self._lock:
+            if name is None:
+                groups = list(self._detached.values())
+                self._detached.clear()
+            else:
+                group = self._detached.pop(name, None)
+                groups = [group] if group else []
+        if name is not None and not groups:
+            print(f"[GROUP] 没有正在执行的步骤组 '{name}'")
+        for i, group in enumerate(groups):
+            try:
+                group.wait(timeout)
+            except Exception:
+                for rest in groups[i + 1:]:
+                    rest.abandon()
+                raise
+
+    def abandon_all(self):
+        """用例失败时放弃所有后台组"""
+        with self._lock:
+            groups = list(self._detached.values())
+            self._detached.clear()
+        for group in groups:
+            group.abandon()
+
+
+# 全局步骤组管理器
+_groups = StepGroups()
+
+
+def get_step_groups():
+    """获取全局步骤组管理器"""
+    return _groups
@@ -0,0 +1,134 @@
+"""
+step_pacing.py
+步骤节奏控制：替代每个步骤之后固定的 sleep(0.3)。
+- 按步骤类型/动作给出不同的稳定等待策略：输入类步骤短暂等待，网络、音频、等待等非UI步骤不等待
+- 可选"等待画面空闲"：短暂等待后继续轮询截图，直到画面不再变化（或超时），默认关闭，
+  由 --pacing idle 对点击/窗口类步骤开启
+- 单个步骤可用 settle="秒数" / wait_idle="true|false" 属性覆盖默认策略
+"""
+import time
+
+from run_report import sleep as report_sleep
+from screen_wait import wait_for_screen
+
+
+# 等待画面稳定的最长时间，不超过旧的固定等待
+IDLE_TIMEOUT = 0.3
+
+
+class SettlePolicy:
+    """步骤完成后的等待策略"""
+
+    __slots__ = ('settle', 'wait_idle', 'idle_timeout')
+
+    def __init__(self, settle=0.0, wait_idle=False, idle_timeout=IDLE_TIMEOUT):
+        """
+        :param settle: 步骤完成后固定等待的秒数
+        :param wait_idle: 固定等待后是否继续等待画面稳定
+        :param idle_timeout: 等待画面稳定的最长时间（秒）
+        """
+        self.settle = settle
+        self.wait_idle = wait_idle
+        self.idle_timeout = idle_timeout
+
+    def __repr__(self):
+        return f"SettlePolicy(settle={self.settle}, wait_idle={self.wait_idle})"
+
+
+# 不需要等待的步骤
+NO_SETTLE = SettlePolicy()
+
+# (type, action) 或 (type, None 表示该类型的全部动作) -> 策略
+DEFAULT_POLICIES = {
+    ('keyboard', None): SettlePolicy(0.05),
+    ('mouse', 'move_mouse'): SettlePolicy(0.02),
+    ('mouse', 'click'): SettlePolicy(0.05),
+    ('window', None): SettlePolicy(0.1),
+    ('icon', None): SettlePolicy(0.02),
+    ('ocr', 'find_and_click'): SettlePolicy(0.05),
+    ('ocr', 'check_texts'): NO_SETTLE,
+    ('check', None): SettlePolicy(0.05),
+}
+
+# --pacing idle：点击、窗口操作后再等待画面稳定
+IDLE_POLICIES = dict(DEFAULT_POLICIES)
+IDLE_POLICIES.update({
+    ('mouse', 'click'): SettlePolicy(0.05, wait_idle=True),
+    ('window', None): SettlePolicy(0.1, wait_idle=True),
+    ('ocr', 'find_and_click'): SettlePolicy(0.05, wait_idle=True),
+})
+
+# 旧行为：所有步骤固定等待0.3秒
+FIXED_POLICY = SettlePolicy(0.3)
+
+
+class StepPacer:
+    """按步骤类型决定步骤之间的等待"""
+
+    def __init__(self, policies=None, default=NO_SETTLE, fixed=None, sleep=time.sleep, wait_idle=None):
+        """
+        :param policies: 策略表，默认 DEFAULT_POLICIES
+        :param default: 策略表中没有的步骤使用的策略
+        :param fixed: 不为None时所有步骤使用该策略（忽略策略表）
+        :param sleep: 休眠函数（用于统计耗时或虚拟时钟）
+        :param wait_idle: 等待画面稳定的函数 timeout -> 任意值，默认轮询截图服务
+        """
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.default = default
+        self.fixed = fixed
+        self.sleep = sleep
+        self.wait_idle = wait_idle or self._wait_screen_idle
+
+    def policy_for(self, step):
+        """
+        步骤的等待策略：步骤属性覆盖 > 固定策略 > (type, action) > (type, None) > 默认。
+        :param step: testcase_plan.Step
+        """
+        if self.fixed is not None:
+            policy = self.fixed
+        else:
+            policy = (self.policies.get((step.type, step.action))
+                      or self.policies.get((step.type, None))
+                      or self.default)
+        settle = step.params.get('settle')
+        wait_idle = step.params.get('wait_idle')
+        if settle is None and wait_idle is None:
+            return policy
+        return SettlePolicy(
+            policy.settle if settle is None else settle,
+            policy.wait_idle if wait_idle is None else wait_idle,
+            policy.idle_timeout,
+        )
+
+    def after_step(self, step):
+        """步骤执行完后按策略等待"""
+        policy = self.policy_for(step)
+        if policy.settle > 0:
+            self.sleep(policy.settle)
+        if policy.wait_idle:
+            self.wait_idle(policy.idle_timeout)
+        return policy
+
+    def _wait_screen_idle(self, timeout):
+        stable, _ = wait_for_screen(timeout=timeout, interval=0.05, sleep=self.sleep)
+        if not stable:
+            print(f"[PACING] 画面在 {timeout}s 内未稳定，继续执行")
+        return stable
+
+
+# 全局节奏控制器
+_pacer = None
+
+
+def get_step_pacer():
+    """获取全局节奏控制器（首次调用时创建）"""
+    global _pacer
+    if _pacer is None:
+        _pacer = StepPacer(sleep=report_sleep)
+    return _pacer
+
+
+def set_step_pacer(pacer):
+    """替换全局节奏控制器（例如 --pacing fixed）"""
+    global _pacer
+    _pacer = pacer
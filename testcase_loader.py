@@ -0,0 +1,134 @@
+"""
+testcase_loader.py
+测试用例XML的流式加载：
+- iter_testcases 基于 iterparse 逐个产出<testcase>，处理完即释放，不构建整棵树
+- 按名称加载时使用旁路索引文件（<xml>.idx）记录每个用例的字节偏移，直接定位读取；
+  XML文件修改（mtime/大小变化）后自动重建索引
+"""
+import json
+import os
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+
+def iter_testcases(xml_path, testcase_name=None):
+    """
+    流式遍历XML中的<testcase>元素。
+    :param xml_path: XML文件路径
+    :param testcase_name: 只产出指定名称的用例（None表示全部）
+    :return: 生成器，产出ET.Element；元素在下一次迭代时从树中释放
+    """
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = elem
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag == 'testcase':
+            if testcase_name is None or elem.get('name') == testcase_name:
+                yield elem
+            # 释放已处理的用例
+            root.clear()
+
+
+def build_index(xml_path):
+    """
+    扫描XML，记录每个顶层<testcase>的名称及字节范围 [start, end)。
+    :return: 索引字典 {'version', 'mtime', 'size', 'encoding', 'testcases': [[name, start, end], ...]}
+    """
+    stat = os.stat(xml_path)
+    entries = []
+    pending = []
+    state = {'depth': 0, 'encoding': None}
+    parser = xml.parsers.expat.ParserCreate()
+
+    def on_decl(version, encoding, standalone):
+        state['encoding'] = encoding
+
+    def on_start(name, attrs):
+        state['depth'] += 1
+        if state['depth'] == 2 and name == 'testcase':
+            pending.append([attrs.get('name'), parser.CurrentByteIndex])
+
+    def on_end(name):
+        if state['depth'] == 2 and name == 'testcase':
+            entry = pending.pop()
+            entries.append(entry + [parser.CurrentByteIndex])
+        state['depth'] -= 1
+
+    parser.XmlDeclHandler = on_decl
+    parser.StartElementHandler = on_start
+    parser.EndElementHandler = on_end
+    with open(xml_path, 'rb') as f:
+        parser.ParseFile(f)
+        # 结束事件的偏移指向 </testcase> 的起始位置，补齐到 '>' 之后；
+        # 自闭合的 <testcase/> 无法可靠定位，记为None，按名称加载时回退到流式扫描
+        for entry in entries:
+            f.seek(entry[2])
+            tail = f.read(64)
+            close = tail.find(b'>')
+            entry[2] = entry[2] + close + 1 if tail.startswith(b'</') and close >= 0 else None
+    return {
+        'version': INDEX_VERSION,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'encoding': state['encoding'],
+        'testcases': entries,
+    }
+
+
+def get_index(xml_path):
+    """读取旁路索引，不存在或已过期时重建并尝试写回"""
+    index_path = xml_path + INDEX_SUFFIX
+    stat = os.stat(xml_path)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if (index.get('version') == INDEX_VERSION and index.get('mtime') == stat.st_mtime
+                and index.get('size') == stat.st_size):
+            return index
+    except (OSError, ValueError):
+        pass
+    index = build_index(xml_path)
+    try:
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+    except OSError as e:
+        # 目录只读等情况下仅使用内存中的索引
+        print(f"[LOADER] 写入用例索引失败: {index_path}, 原因: {e}")
+    return index
+
+
+def load_testcase(xml_path, testcase_name):
+    """
+    按名称加载用例：通过索引直接读取对应字节范围并解析，不扫描整个文件。
+    :return: 同名用例元素列表（可能为空）
+    """
+    index = get_index(xml_path)
+    spans = [(start, end) for name, start, end in index['testcases'] if name == testcase_name]
+    if any(end is None for _, end in spans):
+        return list(iter_testcases(xml_path, testcase_name))
+    encoding = index.get('encoding')
+    header = f'<?xml version="1.0" encoding="{encoding}"?>'.encode('ascii') if encoding else b''
+    elements = []
+    with open(xml_path, 'rb') as f:
+        for start, end in spans:
+            f.seek(start)
+            elements.append(ET.fromstring(header + f.read(end - start)))
+    return elements
+
+
+def iter_selected(xml_path, testcase_name=None):
+    """
+    产出待执行的用例：指定名称时走索引定位，否则流式遍历全部。
+    """
+    if testcase_name:
+        yield from load_testcase(xml_path, testcase_name)
+    else:
+        yield from iter_testcases(xml_path)
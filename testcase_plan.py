@@ -0,0 +1,406 @@
+"""
+testcase_plan.py
+测试用例编译：把XML中的<testcase>转换为步骤对象列表。
+- 执行前一次性解析、校验所有属性（整数、坐标、JSON数据等），XML有误时在产生任何副作用前报错
+- 未知的 (type, action) 与以前一样不执行，只在编译时给出警告
+- 步骤按文档顺序统一编号（<parallel>组本身及组内子步骤都占一个序号），"第N步"、断点和 --resume-step 使用同一编号
+- 步骤按 (type, action) 通过处理函数注册表分发，执行时不再重复解析字符串
+- <parallel> 组内的步骤同时执行，<join> 等待之前后台启动（detach）的组结束
+"""
+import itertools
+import json
+
+
+class TestcaseCompileError(ValueError):
+    """测试用例XML无法编译（未知步骤、缺少或非法属性等）"""
+
+
+class Param:
+    """步骤参数定义：从XML属性解析为指定类型"""
+
+    def __init__(self, attr, parser=str, default=None, required=False):
+        """
+        :param attr: XML属性名（content也作为属性处理）
+        :param parser: 解析函数 str -> 值，解析失败应抛出ValueError
+        :param default: 属性缺失时的默认值
+        :param required: 是否必填
+        """
+        self.attr = attr
+        self.parser = parser
+        self.default = default
+        self.required = required
+
+
+class Step:
+    """编译后的步骤：原始属性 + 解析好的参数"""
+
+    __slots__ = ('index', 'type', 'action', 'content', 'params', 'attrs')
+
+    def __init__(self, index, step_type, action, content, params, attrs):
+        self.index = index          # 在用例中的序号（从0开始）
+        self.type = step_type
+        self.action = action
+        self.content = content
+        self.params = params        # {参数名: 解析后的值}
+        self.attrs = attrs          # 原始XML属性
+
+    @property
+    def key(self):
+        return (self.type, self.action)
+
+    def get(self, name, default=None):
+        """读取原始XML属性，与ElementTree元素接口一致"""
+        return self.attrs.get(name, default)
+
+    def __repr__(self):
+        return f"Step({self.index}, type={self.type}, action={self.action}, content={self.content})"
+
+
+class TestcasePlan:
+    """编译后的测试用例"""
+
+    def __init__(self, name, steps, attrs=None):
+        self.name = name
+        self.steps = steps
+        self.attrs = attrs or {}
+
+    def iter_steps(self):
+        """按顺序遍历全部步骤，包括<parallel>组内的子步骤"""
+        return iter_steps(self.steps)
+
+    def steps_from(self, start):
+        """
+        从序号start开始需要执行的顶层步骤。
+        start落在<parallel>组内时从整个组开始（组内步骤不能单独续跑）。
+        """
+        return [step for step in self.steps if last_index(step) >= start]
+
+    def step_types(self):
+        """用例中出现的所有步骤类型"""
+        return {step.type for step in self.iter_steps()}
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __repr__(self):
+        return f"TestcasePlan({self.name!r}, {len(self.steps)} steps)"
+
+
+def last_index(step):
+    """步骤（组步骤取其最后一个子步骤）的最大序号"""
+    if step.type == GROUP_TAG:
+        return last_index(step.params['steps'][-1])
+    return step.index
+
+
+def iter_steps(steps):
+    """深度优先遍历步骤，组步骤本身及其子步骤都会产出"""
+    for step in steps:
+        yield step
+        if step.type == GROUP_TAG:
+            yield from iter_steps(step.params['steps'])
+
+
+# ---- 属性解析函数 ----
+
+def parse_point(value):
+    """'x,y' -> (x, y)"""
+    x, y = value.split(',')
+    return int(x), int(y)
+
+
+def parse_region(value):
+    """'left,top,right,bottom' -> 元组"""
+    parts = tuple(int(v) for v in value.split(','))
+    if len(parts) != 4:
+        raise ValueError(f"区域需要4个整数: {value}")
+    return parts
+
+
+def parse_scales(value):
+    """'1.0,1.25' -> (1.0, 1.25)"""
+    return tuple(float(v) for v in value.split(','))
+
+
+def parse_peer(value):
+    """'host:port' -> (host, port)；空字符串表示只启动服务器"""
+    if not value or ':' not in value:
+        return None
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def parse_peers(value):
+    """
+    'alice=192.168.1.101:9998,bob=192.168.1.102:9998' -> {'alice': (host, port), 'bob': (host, port)}
+    未命名的对端（'host:port'）以 'host:port' 为名称；
+    不包含 ':' 的内容（包括空字符串）与原来一样表示只启动服务器（返回None）
+    """
+    entries = [entry.strip() for entry in value.split(',') if entry.strip()]
+    if not entries or ':' not in value:
+        return None
+    peers = {}
+    for entry in entries:
+        name, _, address = entry.rpartition('=')
+        peer = parse_peer(address)
+        if peer is None:
+            raise ValueError(f"对端格式应为 name=host:port 或 host:port: {entry}")
+        name = name.strip() or address
+        if name in peers:
+            raise ValueError(f"对端名称重复: {name}")
+        peers[name] = peer
+    return peers
+
+
+def parse_peer_names(value):
+    """'bob,carol' -> ['bob', 'carol']；'*' 表示全部对端"""
+    if value.strip() == '*':
+        return '*'
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    if not names:
+        raise ValueError("需要对端名称")
+    return names
+
+
+def parse_json_data(value):
+    """JSON数据，非JSON时包装为 {'message': 原文}"""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {'message': value}
+
+
+def parse_text_list(value):
+    """'a|b|c' -> ['a', 'b', 'c']"""
+    return [t for t in value.split('|') if t]
+
+
+def parse_bool(value):
+    """'true'/'false'（也接受 1/0、yes/no）"""
+    lowered = value.strip().lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError("需要 true 或 false")
+
+
+def choice(*values):
+    """限定取值范围的解析函数"""
+    def parser(value):
+        if value not in values:
+            raise ValueError(f"取值必须是 {values} 之一")
+        return value
+    return parser
+
+
+# ---- 步骤定义：(type, action) -> {参数名: Param} ----
+
+STEP_SPECS = {
+    ('keyboard', 'press_key'): {'key': Param('content', required=True)},
+    ('keyboard', 'type_text'): {
+        'text': Param('content', required=True),
+        # auto：短ASCII文本按块发送，长文本/中文用剪贴板粘贴；char：逐字符输入（目标程序需要时）
+        'mode': Param('mode', choice('auto', 'chunk', 'paste', 'char'), default='auto'),
+        'interval': Param('interval', float, default=0.1),
+    },
+    ('mouse', 'move_mouse'): {'point': Param('content', parse_point, required=True)},
+    # 按钮名称原样交给输入后端（left/right/middle）
+    ('mouse', 'click'): {'button': Param('content', required=True)},
+    ('audio', 'play'): {
+        'file': Param('content', required=True),
+        'device': Param('device', int, default=-1),
+        'duration': Param('time', float),
+    },
+    ('audio', 'play_async'): {
+        'file': Param('content', required=True),
+        'device': Param('device', int, default=-1),
+        'duration': Param('time', float),
+    },
+    ('audio', 'record'): {
+        'file': Param('content', required=True),
+        'device': Param('device', int, default=0),
+        'duration': Param('duration', float, default=5.0),
+    },
+    ('audio', 'record_async'): {
+        'file': Param('content', required=True),
+        'device': Param('device', int, default=0),
+        'duration': Param('duration', float, default=5.0),
+    },
+    ('audio', 'stop_record'): {},
+    ('network', 'init'): {
+        # 一个或多个对端：'host:port' 或 'alice=host:port,bob=host:port'
+        'peers': Param('content', parse_peers),
+        'local_port': Param('local_port', int, default=9998),
+        'name': Param('name'),
+    },
+    ('network', 'send'): {
+        'event': Param('content', required=True),
+        'data': Param('data', parse_json_data),
+        # 接收的对端名称（逗号分隔），缺省发给全部对端
+        'to': Param('to', parse_peer_names),
+    },
+    ('network', 'receive'): {
+        'event': Param('content'),
+        'timeout': Param('timeout', float, default=30.0),
+        # 只接收该对端发来的消息
+        'sender': Param('from'),
+    },
+    ('network', 'stop'): {},
+    ('check', 'input_method'): {'expected': Param('content', required=True)},
+    ('wait', 'sleep'): {'seconds': Param('content', float, required=True)},
+    # 文档约定 <step type="wait" content="1" /> 等同于 sleep
+    ('wait', None): {'seconds': Param('content', float, required=True)},
+    ('ocr', 'find_and_click'): {
+        'text': Param('content', required=True),
+        'region': Param('region', parse_region),
+        'timeout': Param('timeout', float, default=2.0),
+    },
+    ('ocr', 'check_texts'): {
+        'texts': Param('content', parse_text_list, required=True),
+        'region': Param('region', parse_region),
+    },
+    ('window', 'maximize_top'): {},
+    ('icon', 'find_and_move'): {
+        'template': Param('content', required=True),
+        'scales': Param('scales', parse_scales),
+    },
+}
+
+# 所有步骤通用的可选参数：覆盖步骤完成后的等待策略（见 step_pacing.py）
+COMMON_PARAMS = {
+    'settle': Param('settle', float),
+    'wait_idle': Param('wait_idle', parse_bool),
+}
+
+# 并发步骤组：<parallel> 内的子步骤同时执行；<join> 等待后台组结束。
+# 编译为 type 为标签名、action 为None的Step
+GROUP_TAG = 'parallel'
+JOIN_TAG = 'join'
+GROUP_SPECS = {
+    GROUP_TAG: {
+        'name': Param('name'),
+        'timeout': Param('timeout', float),
+        'max_workers': Param('max_workers', int),
+        # true 时不等待组结束，继续执行后续步骤，之后用 <join name="..."/> 等待
+        'detach': Param('detach', parse_bool, default=False),
+    },
+    JOIN_TAG: {
+        'name': Param('name'),
+        'timeout': Param('timeout', float),
+    },
+}
+
+# 步骤处理函数注册表：(type, action) -> handler(step)
+STEP_HANDLERS = {}
+
+
+def step_handler(step_type, action):
+    """注册步骤处理函数的装饰器"""
+    def decorator(func):
+        STEP_HANDLERS[(step_type, action)] = func
+        return func
+    return decorator
+
+
+def _where(index, testcase_name):
+    return f"用例 '{testcase_name}' 第{index + 1}步" if testcase_name is not None else f"第{index + 1}步"
+
+
+def _parse_params(spec, attrs, where, what):
+    params = {}
+    for name, param in spec.items():
+        raw = attrs.get(param.attr)
+        if raw is None or (raw == '' and param.parser is not str):
+            if param.required:
+                raise TestcaseCompileError(f"{where}: 缺少属性 {param.attr} ({what})")
+            params[name] = param.default
+            continue
+        try:
+            params[name] = param.parser(raw)
+        except (ValueError, TypeError) as e:
+            raise TestcaseCompileError(f"{where}: 属性 {param.attr}='{raw}' 非法 ({e})")
+    return params
+
+
+def compile_step(element, index=0, testcase_name=None):
+    """
+    编译单个<step>元素。
+    :raises TestcaseCompileError: 未知步骤或属性非法
+    """
+    attrs = dict(element.attrib)
+    step_type = attrs.get('type')
+    action = attrs.get('action')
+    where = _where(index, testcase_name)
+    spec = STEP_SPECS.get((step_type, action))
+    if spec is None:
+        # 与以前的执行器一致：不认识的步骤不执行（例如文档中的旧写法），只给出警告
+        print(f"[PLAN] 警告: {where}: 未知步骤 type={step_type}, action={action}，执行时将跳过")
+        spec = {}
+    params = _parse_params(dict(spec, **COMMON_PARAMS), attrs, where, f"type={step_type}, action={action}")
+    return Step(index, step_type, action, attrs.get('content'), params, attrs)
+
+
+def compile_group(element, index=0, testcase_name=None, counter=None):
+    """
+    编译<parallel>元素：子元素可以是<step>或嵌套的<parallel>。
+    :param counter: 步骤序号计数器（与用例共用），默认组内子步骤从 index+1 开始编号
+    :raises TestcaseCompileError: 组为空、包含<join>或子步骤非法
+    """
+    if counter is None:
+        counter = itertools.count(index + 1)
+    attrs = dict(element.attrib)
+    where = _where(index, testcase_name)
+    params = _parse_params(GROUP_SPECS[GROUP_TAG], attrs, where, GROUP_TAG)
+    if params['detach'] and not params['name']:
+        raise TestcaseCompileError(f"{where}: detach的<parallel>需要name属性，以便<join>等待")
+    if params['max_workers'] is not None and params['max_workers'] < 1:
+        raise TestcaseCompileError(f"{where}: max_workers 必须大于0")
+    children = []
+    for child in element:
+        if child.tag == 'step':
+            children.append(compile_step(child, next(counter), testcase_name))
+        elif child.tag == GROUP_TAG:
+            children.append(compile_group(child, next(counter), testcase_name, counter))
+        else:
+            raise TestcaseCompileError(f"{where}: <parallel> 内不支持 <{child.tag}>")
+    if not children:
+        raise TestcaseCompileError(f"{where}: <parallel> 内没有步骤")
+    params['steps'] = children
+    return Step(index, GROUP_TAG, None, params['name'], params, attrs)
+
+
+def compile_join(element, index=0, testcase_name=None):
+    """编译<join>元素：name为空时等待所有后台组"""
+    attrs = dict(element.attrib)
+    params = _parse_params(GROUP_SPECS[JOIN_TAG], attrs, _where(index, testcase_name), JOIN_TAG)
+    return Step(index, JOIN_TAG, None, params['name'], params, attrs)
+
+
+def compile_testcase(element):
+    """
+    编译<testcase>元素为TestcasePlan。
+    :raises TestcaseCompileError: 任一步骤无法编译，或<join>引用了之前未启动的后台组
+    """
+    name = element.get('name')
+    steps = []
+    detached = set()
+    counter = itertools.count()
+    for child in element:
+        if child.tag not in ('step', GROUP_TAG, JOIN_TAG):
+            continue
+        i = next(counter)
+        if child.tag == 'step':
+            steps.append(compile_step(child, i, name))
+        elif child.tag == GROUP_TAG:
+            group = compile_group(child, i, name, counter)
+            if group.params['detach']:
+                detached.add(group.params['name'])
+            steps.append(group)
+        elif child.tag == JOIN_TAG:
+            join = compile_join(child, i, name)
+            if join.params['name'] and join.params['name'] not in detached:
+                raise TestcaseCompileError(
+                    f"{_where(i, name)}: <join> 引用的组 '{join.params['name']}' 未在之前以detach方式启动")
+            steps.append(join)
+    return TestcasePlan(name, steps, dict(element.attrib))